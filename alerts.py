@@ -0,0 +1,191 @@
+"""
+Stock alerts
+Alerts are evaluated inside the write transaction that changes stock, only for
+the products it touched. Fired alerts land in alert_outbox and a background
+dispatcher hands them to a notifier after the transaction has committed.
+"""
+
+import json
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+import db
+
+SAST = timezone(timedelta(hours=2))
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+DEFAULT_DEBOUNCE_SECONDS = 3600    # at most one alert per product per hour while low
+DEFAULT_POLL_SECONDS = 30.0        # also picks up alerts fired by other processes
+MAX_ATTEMPTS = 5
+DELIVERY_BATCH = 100
+
+logger = logging.getLogger('inventory.alerts')
+
+
+def _now():
+    return datetime.now(SAST).strftime(TIME_FORMAT)
+
+
+def evaluate(conn, product_ids, now=None, debounce_seconds=DEFAULT_DEBOUNCE_SECONDS):
+    """Write transaction step: fire or re-arm alerts for the given products
+
+    A product alerts when its stock is at or below its stock_alerts threshold
+    (min_stock when it has no setting of its own). last_alert_sent debounces
+    repeats and is cleared once stock recovers, so the next drop alerts again.
+    Returns the number of alerts fired.
+    """
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return 0
+    now = now or _now()
+    cutoff = (datetime.strptime(now, TIME_FORMAT) - timedelta(seconds=debounce_seconds)).strftime(TIME_FORMAT)
+
+    placeholders = ', '.join('?' * len(product_ids))
+    rows = conn.execute(f"""
+        SELECT p.id, p.name, p.stock, COALESCE(sa.alert_threshold, p.min_stock, 0),
+               COALESCE(sa.is_active, 1), sa.last_alert_sent
+        FROM products p
+        LEFT JOIN stock_alerts sa ON sa.product_id = p.id
+        WHERE p.id IN ({placeholders})
+    """, product_ids).fetchall()
+
+    fired = []
+    rearmed = []
+    for product_id, name, stock, threshold, is_active, last_alert_sent in rows:
+        if not is_active:
+            continue
+        if stock <= threshold:
+            if last_alert_sent is None or last_alert_sent <= cutoff:
+                fired.append((product_id, name, stock, threshold, now))
+        elif last_alert_sent is not None:
+            rearmed.append((product_id,))
+
+    if fired:
+        conn.executemany("""
+            INSERT INTO alert_outbox (product_id, product_name, stock, threshold, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, fired)
+        # Products without their own setting get a row that keeps using min_stock
+        conn.executemany("""
+            INSERT INTO stock_alerts (product_id, alert_threshold, is_active, last_alert_sent)
+            VALUES (?, NULL, 1, ?)
+            ON CONFLICT(product_id) DO UPDATE SET last_alert_sent = excluded.last_alert_sent
+        """, [(alert[0], now) for alert in fired])
+    if rearmed:
+        conn.executemany("UPDATE stock_alerts SET last_alert_sent = NULL WHERE product_id = ?", rearmed)
+    return len(fired)
+
+
+# -----------------------------------------------------------------------------------------
+# NOTIFIERS
+# -----------------------------------------------------------------------------------------
+class LogNotifier:
+    """Writes each alert to the 'inventory.alerts' logger"""
+
+    def send(self, alert):
+        logger.warning('Low stock: %s has %s left (threshold %s)',
+                       alert['product_name'], alert['stock'], alert['threshold'])
+
+
+class FileNotifier:
+    """Appends each alert as one JSON line to a local file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, alert):
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(alert) + '\n')
+
+
+def build_notifier(config):
+    """Notifier named by ALERT_NOTIFIER ('log' or 'file')"""
+    kind = config.get('ALERT_NOTIFIER', 'log')
+    if kind == 'file':
+        return FileNotifier(config.get('ALERT_LOG_PATH', 'alerts.log'))
+    if kind == 'log':
+        return LogNotifier()
+    raise ValueError(f'Unknown ALERT_NOTIFIER: {kind}')
+
+
+# -----------------------------------------------------------------------------------------
+# DISPATCHER
+# -----------------------------------------------------------------------------------------
+def deliver_pending(conn, notifier, limit=DELIVERY_BATCH):
+    """Send undelivered outbox rows; returns how many were delivered
+
+    Each row is claimed with a conditional UPDATE first, so two processes
+    draining the same outbox never send one alert twice.
+    """
+    rows = conn.execute("""
+        SELECT id, product_id, product_name, stock, threshold, created_at
+        FROM alert_outbox
+        WHERE delivered_at IS NULL AND attempts < ?
+        ORDER BY id
+        LIMIT ?
+    """, (MAX_ATTEMPTS, limit)).fetchall()
+
+    delivered = 0
+    for row in rows:
+        claimed = conn.execute("UPDATE alert_outbox SET delivered_at = ? WHERE id = ? AND delivered_at IS NULL",
+                               (_now(), row[0]))
+        conn.commit()
+        if claimed.rowcount == 0:
+            continue
+        alert = dict(zip(('id', 'product_id', 'product_name', 'stock', 'threshold', 'created_at'), row))
+        try:
+            notifier.send(alert)
+        except Exception as e:
+            conn.execute("""
+                UPDATE alert_outbox SET delivered_at = NULL, attempts = attempts + 1, last_error = ?
+                WHERE id = ?
+            """, (str(e), row[0]))
+            conn.commit()
+            logger.exception('Stock alert %s could not be delivered', row[0])
+        else:
+            delivered += 1
+    return delivered
+
+
+class AlertDispatcher:
+    """Background thread that drains alert_outbox into a notifier
+
+    wake() after a write that may have fired alerts; the thread also polls
+    every poll_seconds for alerts fired by other processes.
+    """
+
+    def __init__(self, database, notifier, pragmas=None, poll_seconds=DEFAULT_POLL_SECONDS):
+        self.database = database
+        self.notifier = notifier
+        self.pragmas = pragmas
+        self.poll_seconds = poll_seconds
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.delivered = 0
+
+    def wake(self):
+        # Started lazily, like the write queue, so a preloaded app can fork first
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='alert-dispatcher', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        conn = db.connect(self.database, self.pragmas)
+        while True:
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+            try:
+                while True:
+                    count = deliver_pending(conn, self.notifier)
+                    self.delivered += count
+                    if count < DELIVERY_BATCH:
+                        break
+            except Exception:
+                logger.exception('Stock alert delivery failed')
+                if conn.in_transaction:
+                    conn.rollback()
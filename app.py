@@ -1,16 +1,72 @@
-from flask import Flask, render_template, request, redirect, send_file, jsonify, session, flash, url_for
+from flask import Blueprint, Flask, Response, current_app, g, render_template, request, redirect, jsonify, session, flash, url_for
 import sqlite3
-import csv
+import base64
+import re
 from datetime import datetime, timedelta, timezone
 from functools import wraps
 import secrets
 import os
+import random
+import time
+from werkzeug.local import LocalProxy
 from werkzeug.security import generate_password_hash, check_password_hash
 
-app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)
-
-DB_NAME = "database.db"
+import alerts
+import cache
+import config
+import db
+import events
+import exports
+import import_products
+import metrics
+import migrations
+import profiling
+import sales_analytics
+from db import get_db
+
+# Every route and hook lives on this blueprint; create_app() registers it
+bp = Blueprint('inventory', __name__)
+
+def create_app(config_object=None):
+    """Application factory
+
+    config_object is a config class or its name in config.CONFIGS; by default
+    APP_CONFIG picks one. Each app gets its own pool, caches, metrics and
+    background workers in app.extensions.
+    """
+    app = Flask(__name__)
+    if config_object is None or isinstance(config_object, str):
+        config_object = config.get_config(config_object)
+    app.config.from_object(config_object)
+    if not app.config['SECRET_KEY']:
+        app.config['SECRET_KEY'] = config.load_secret_key(
+            app.config['SECRET_KEY_FILE'] or os.path.join(app.instance_path, 'secret_key'))
+
+    ensure_schema(app.config['DATABASE'], app.config['DB_AUTO_MIGRATE'])
+
+    # Every pooled and writer connection reports its statements here (see metrics.py)
+    registry = metrics.Registry(slow_query_seconds=app.config['SLOW_QUERY_MS'] / 1000)
+    app.extensions['sql_metrics'] = registry
+    db.init_app(app, factory=registry.connection_class() if app.config['SQL_METRICS'] else sqlite3.Connection)
+    app.extensions['reference_cache'] = cache.ReferenceCache(
+        ttl=app.config['REFERENCE_CACHE_TTL'], max_entries=app.config['REFERENCE_CACHE_SIZE'])
+    app.extensions['barcode_index'] = cache.BarcodeIndex()
+    app.extensions['alert_dispatcher'] = alerts.AlertDispatcher(
+        app.config['DATABASE'], alerts.build_notifier(app.config), pragmas=db.build_pragmas(app.config))
+    app.extensions['event_broker'] = events.EventBroker(
+        app.config['DATABASE'], pragmas=db.build_pragmas(app.config), max_subscribers=app.config['EVENT_MAX_STREAMS'],
+        poll_seconds=app.config['EVENT_POLL_SECONDS'])
+    app.extensions['profile_store'] = profiling.ProfileStore(app.config['PROFILE_DIR'],
+                                                             app.config['PROFILE_KEEP'])
+
+    app.register_blueprint(bp)
+    return app
+
+def app_extension(name):
+    """Module-level stand-in for the current app's app.extensions[name]"""
+    return LocalProxy(lambda: current_app.extensions[name])
+
+sql_metrics = app_extension('sql_metrics')
 
 # South African Time Zone (SAST = UTC+2)
 SAST = timezone(timedelta(hours=2))
@@ -19,8 +75,16 @@ def get_current_time():
     """Get current time in South African Standard Time (SAST)"""
     return datetime.now(SAST)
 
+def day_start(day):
+    """sale_time string for midnight at the start of a date
+
+    sale_time is stored as 'YYYY-MM-DD HH:MM:SS', which sorts as text, so date
+    filters compare against these bounds instead of wrapping the column in
+    DATE() - that keeps them on idx_sales_sale_time.
+    """
+    return f"{day.isoformat()} 00:00:00"
 # Template filter for formatting timestamps
-@app.template_filter('format_datetime')
+@bp.app_template_filter('format_datetime')
 def format_datetime(value):
     """Format datetime string for display"""
     if value:
@@ -31,7 +95,7 @@ def format_datetime(value):
             return value
     return ''
 
-@app.template_filter('format_date')
+@bp.app_template_filter('format_date')
 def format_date(value):
     """Format date string for display"""
     if value:
@@ -45,107 +109,21 @@ def format_date(value):
 # -----------------------------------------------------------------------------------------
 # DATABASE INITIALIZATION
 # -----------------------------------------------------------------------------------------
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-
-    # Products table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            cost REAL NOT NULL,
-            price REAL NOT NULL,
-            stock INTEGER NOT NULL,
-            min_stock INTEGER DEFAULT 5,
-            category TEXT,
-            barcode TEXT UNIQUE,
-            supplier_id INTEGER,
-            created_at TEXT,
-            FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
-        )
-    """)
-
-    # Sales table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS sales (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_id INTEGER,
-            quantity INTEGER,
-            total_amount REAL,
-            sale_time TEXT,
-            FOREIGN KEY (product_id) REFERENCES products(id)
-        )
-    """)
-
-    # Users table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT DEFAULT 'user',
-            created_at TEXT
-        )
-    """)
-
-    # Suppliers table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS suppliers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            contact_person TEXT,
-            email TEXT,
-            phone TEXT,
-            address TEXT,
-            created_at TEXT
-        )
-    """)
-
-    # Purchase Orders table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS purchase_orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            supplier_id INTEGER,
-            product_id INTEGER,
-            quantity INTEGER,
-            cost_per_unit REAL,
-            total_cost REAL,
-            status TEXT DEFAULT 'pending',
-            order_date TEXT,
-            expected_delivery TEXT,
-            received_date TEXT,
-            notes TEXT,
-            FOREIGN KEY (supplier_id) REFERENCES suppliers(id),
-            FOREIGN KEY (product_id) REFERENCES products(id)
-        )
-    """)
-
-    # Stock Alerts table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS stock_alerts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_id INTEGER,
-            alert_threshold INTEGER DEFAULT 5,
-            is_active INTEGER DEFAULT 1,
-            last_alert_sent TEXT,
-            FOREIGN KEY (product_id) REFERENCES products(id)
-        )
-    """)
-
-    # Create default Mabutsi user if not exists
-    c.execute("SELECT * FROM users WHERE username = 'Mabutsi'")
-    if not c.fetchone():
-        hashed_pw = generate_password_hash('Mabutsi@12')
-        current_time = get_current_time().strftime('%Y-%m-%d %H:%M:%S')
-        c.execute("INSERT INTO users (username, password, role, created_at) VALUES (?, ?, ?, ?)",
-                  ('Mabutsi', hashed_pw, 'Mabutsi', current_time))
-
-    conn.commit()
-    conn.close()
-
-# Initialize database when app starts
-init_db()
+def ensure_schema(database, auto_migrate=False):
+    """Startup check: a single PRAGMA read when the schema is current
+
+    Migrations and the default user come from `python init_database.py`.
+    With auto_migrate (DB_AUTO_MIGRATE, on in development) an older database
+    is bootstrapped here instead; without it, startup fails until the
+    command has been run.
+    """
+    conn = sqlite3.connect(database)
+    try:
+        if migrations.get_version(conn) < migrations.SCHEMA_VERSION and auto_migrate:
+            migrations.bootstrap(conn)
+        migrations.check(conn)
+    finally:
+        conn.close()
 
 # -----------------------------------------------------------------------------------------
 # LOGIN REQUIRED DECORATOR
@@ -155,24 +133,23 @@ def login_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             flash('Please log in to access this page.', 'warning')
-            return redirect(url_for('login'))
+            return redirect(url_for('.login'))
         return f(*args, **kwargs)
     return decorated_function
 
 # -----------------------------------------------------------------------------------------
 # AUTHENTICATION ROUTES
 # -----------------------------------------------------------------------------------------
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
 
-        conn = sqlite3.connect(DB_NAME)
+        conn = get_db()
         c = conn.cursor()
         c.execute("SELECT * FROM users WHERE username = ?", (username,))
         user = c.fetchone()
-        conn.close()
 
         if user and check_password_hash(user[2], password):
             session['user_id'] = user[0]
@@ -185,13 +162,13 @@ def login():
 
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.clear()
     flash('You have been logged out.', 'info')
-    return redirect(url_for('login'))
+    return redirect(url_for('.login'))
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form['username']
@@ -200,26 +177,25 @@ def register():
 
         if password != confirm_password:
             flash('Passwords do not match!', 'error')
-            return redirect(url_for('register'))
+            return redirect(url_for('.register'))
 
         hashed_pw = generate_password_hash(password)
 
         try:
-            conn = sqlite3.connect(DB_NAME)
+            conn = get_db()
             c = conn.cursor()
             current_time = get_current_time().strftime('%Y-%m-%d %H:%M:%S')
             c.execute("INSERT INTO users (username, password, created_at) VALUES (?, ?, ?)",
                       (username, hashed_pw, current_time))
             conn.commit()
-            conn.close()
             flash('Registration successful! Please log in.', 'success')
-            return redirect(url_for('login'))
+            return redirect(url_for('.login'))
         except sqlite3.IntegrityError:
             flash('Username already exists.', 'error')
 
     return render_template('register.html')
 
-@app.route('/change_password', methods=['GET', 'POST'])
+@bp.route('/change_password', methods=['GET', 'POST'])
 @login_required
 def change_password():
     if request.method == 'POST':
@@ -228,111 +204,180 @@ def change_password():
         confirm_password = request.form['confirm_password']
 
         # Verify current password
-        conn = sqlite3.connect(DB_NAME)
+        conn = get_db()
         c = conn.cursor()
         c.execute("SELECT password FROM users WHERE id = ?", (session['user_id'],))
         user = c.fetchone()
 
         if not user or not check_password_hash(user[0], current_password):
             flash('Current password is incorrect!', 'error')
-            conn.close()
-            return redirect(url_for('change_password'))
+            return redirect(url_for('.change_password'))
 
         # Check new passwords match
         if new_password != confirm_password:
             flash('New passwords do not match!', 'error')
-            conn.close()
-            return redirect(url_for('change_password'))
+            return redirect(url_for('.change_password'))
 
         # Check password strength
         if len(new_password) < 8:
             flash('Password must be at least 8 characters long!', 'error')
-            conn.close()
-            return redirect(url_for('change_password'))
+            return redirect(url_for('.change_password'))
 
         # Update password
         hashed_pw = generate_password_hash(new_password)
         c.execute("UPDATE users SET password = ? WHERE id = ?", 
                   (hashed_pw, session['user_id']))
         conn.commit()
-        conn.close()
 
         flash('Password changed successfully! Please log in again.', 'success')
-        return redirect(url_for('logout'))
+        return redirect(url_for('.logout'))
 
     return render_template('change_password.html')
 
+# -----------------------------------------------------------------------------------------
+# REFERENCE DATA CACHE
+# -----------------------------------------------------------------------------------------
+# Dropdown and filter lists change a few times a day, so form pages read them
+# from the cache; anything showing stock is still queried live
+reference_cache = app_extension('reference_cache')
+
+def supplier_choices():
+    """(id, name) of every supplier, by name"""
+    return reference_cache.get(get_db(), 'supplier_choices', ('suppliers',), lambda conn: conn.execute(
+        "SELECT id, name FROM suppliers ORDER BY name").fetchall())
+
+def product_categories():
+    """Distinct non-empty product categories, sorted"""
+    return reference_cache.get(get_db(), 'product_categories', ('products',), lambda conn: [
+        row[0] for row in conn.execute(
+            "SELECT DISTINCT category FROM products WHERE category IS NOT NULL AND category != '' ORDER BY category")])
+
+def products_changed():
+    """Invalidation hook for routes that add, edit or remove products"""
+    barcode_index.invalidate()
+    reference_cache.invalidate('products')
+
+def suppliers_changed():
+    """Invalidation hook for routes that add, edit or remove suppliers"""
+    reference_cache.invalidate('suppliers')
+
+# -----------------------------------------------------------------------------------------
+# PRODUCT SEARCH
+# -----------------------------------------------------------------------------------------
+PRODUCTS_PAGE_SIZE = 100
+SEARCH_SUGGESTION_LIMIT = 10
+MAX_SEARCH_LIMIT = 100
+
+def fts_query(text):
+    """FTS5 query for free text: every word must prefix-match some indexed token"""
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+def search_products(c, text, limit, offset=0):
+    """Products matching text from the product_search index, best match first
+
+    bm25 weights favour name, then barcode, category and supplier.
+    """
+    c.execute("""
+        SELECT p.*
+        FROM product_search
+        JOIN products p ON p.id = product_search.rowid
+        WHERE product_search MATCH ?
+        ORDER BY bm25(product_search, 10.0, 2.0, 5.0, 1.0), p.name
+        LIMIT ? OFFSET ?
+    """, (fts_query(text), limit, offset))
+    return c.fetchall()
+
+def product_label(product_id):
+    """Text the product picker (static/product_picker.js) shows for a product, '' if missing"""
+    row = get_db().execute("SELECT id, name, barcode FROM products WHERE id = ?", (product_id,)).fetchone()
+    if row is None:
+        return ''
+    return f"{row[1]} ({row[2]})" if row[2] else f"{row[1]} #{row[0]}"
+
+@bp.route('/api/products/search')
+@login_required
+def api_product_search():
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', SEARCH_SUGGESTION_LIMIT, type=int), MAX_SEARCH_LIMIT))
+    page = max(1, request.args.get('page', 1, type=int))
+
+    if not fts_query(query):
+        return jsonify({'query': query, 'page': page, 'results': []})
+
+    c = get_db().cursor()
+    rows = search_products(c, query, limit, (page - 1) * limit)
+    results = [{
+        'id': row[0],
+        'name': row[1],
+        'price': row[3],
+        'stock': row[4],
+        'category': row[6],
+        'barcode': row[7],
+    } for row in rows]
+
+    return jsonify({'query': query, 'page': page, 'results': results})
+
 # -----------------------------------------------------------------------------------------
 # DASHBOARD
 # -----------------------------------------------------------------------------------------
-@app.route('/')
+@bp.route('/')
 @login_required
 def index():
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
 
     # Total products
     c.execute("SELECT COUNT(*) FROM products")
     total_products = c.fetchone()[0]
 
-    # Total sales quantity
-    c.execute("SELECT SUM(quantity) FROM sales")
-    total_sales = c.fetchone()[0] or 0
+    # Sales figures come from the rollup tables the sales triggers maintain,
+    # so none of these queries touch the sales table itself
+
+    # Total sales quantity, revenue and profit (profit uses each sale's own unit cost)
+    c.execute("SELECT SUM(quantity), SUM(revenue), SUM(profit) FROM product_sales_summary")
+    totals = c.fetchone()
+    total_sales = totals[0] or 0
+    total_revenue = totals[1] or 0
+    total_profit = totals[2] or 0
 
     # Daily sales (today in SAST)
-    today_date = get_current_time().date()
     c.execute("""
-        SELECT 
-            SUM(s.quantity),
-            SUM(s.total_amount)
-        FROM sales s
-        WHERE DATE(s.sale_time) = ?
-    """, (today_date,))
-    daily = c.fetchone()
+        SELECT quantity, revenue
+        FROM daily_sales_summary
+        WHERE sale_date = ?
+    """, (get_current_time().date().isoformat(),))
+    daily = c.fetchone() or (0, 0)
     daily_items = daily[0] or 0
     daily_value = daily[1] or 0
 
-    # Total profit
-    c.execute("""
-        SELECT SUM((p.price - p.cost) * s.quantity)
-        FROM sales s
-        JOIN products p ON s.product_id = p.id
-    """)
-    total_profit = c.fetchone()[0] or 0
-
-    # Total revenue
-    c.execute("SELECT SUM(total_amount) FROM sales")
-    total_revenue = c.fetchone()[0] or 0
-
     # Low stock count
     c.execute("SELECT COUNT(*) FROM products WHERE stock <= min_stock")
     low_stock_count = c.fetchone()[0]
 
-    # Product list with search
+    # Product list with search, one page at a time
     search_query = request.args.get('search', '')
-    if search_query:
-        c.execute("SELECT * FROM products WHERE name LIKE ? OR category LIKE ?", 
-                  (f'%{search_query}%', f'%{search_query}%'))
+    page = max(1, request.args.get('page', 1, type=int))
+    offset = (page - 1) * PRODUCTS_PAGE_SIZE
+    if fts_query(search_query):
+        products = search_products(c, search_query, PRODUCTS_PAGE_SIZE + 1, offset)
     else:
-        c.execute("SELECT * FROM products ORDER BY name")
-    products = c.fetchall()
+        c.execute("SELECT * FROM products ORDER BY name LIMIT ? OFFSET ?", (PRODUCTS_PAGE_SIZE + 1, offset))
+        products = c.fetchall()
+    has_next_page = len(products) > PRODUCTS_PAGE_SIZE
+    products = products[:PRODUCTS_PAGE_SIZE]
 
     # Product sales history
     c.execute("""
-        SELECT p.name, SUM(s.quantity), SUM(s.total_amount)
-        FROM sales s
-        JOIN products p ON s.product_id = p.id
-        GROUP BY p.id
-        ORDER BY SUM(s.quantity) DESC
+        SELECT p.name, ps.quantity, ps.revenue
+        FROM product_sales_summary ps
+        JOIN products p ON ps.product_id = p.id
+        WHERE ps.sale_count > 0
+        ORDER BY ps.quantity DESC
         LIMIT 10
     """)
     product_history = c.fetchall()
 
-    # Categories
-    c.execute("SELECT DISTINCT category FROM products WHERE category IS NOT NULL")
-    categories = [row[0] for row in c.fetchall()]
-
-    conn.close() 
+    categories = product_categories()
 
     return render_template(
         "index.html",
@@ -346,13 +391,15 @@ def index():
         low_stock_count=low_stock_count,
         product_history=product_history,
         categories=categories,
-        search_query=search_query
+        search_query=search_query,
+        page=page,
+        has_next_page=has_next_page
     )
    
 # -----------------------------------------------------------------------------------------
 # ADD PRODUCT
 # -----------------------------------------------------------------------------------------
-@app.route('/add_product', methods=['GET', 'POST'])
+@bp.route('/add_product', methods=['GET', 'POST'])
 @login_required
 def add_product():
     if request.method == 'POST':
@@ -369,10 +416,10 @@ def add_product():
 
         if price < cost:
             flash('Selling price cannot be less than cost price!', 'error')
-            return redirect(url_for('add_product'))
+            return redirect(url_for('.add_product'))
 
         try:
-            conn = sqlite3.connect(DB_NAME)
+            conn = get_db()
             c = conn.cursor()
             current_time = get_current_time().strftime('%Y-%m-%d %H:%M:%S')
             c.execute(
@@ -380,30 +427,36 @@ def add_product():
                 (name, cost, price, stock, min_stock, category, barcode if barcode else None, supplier_id, current_time)
             )
             conn.commit()
-            conn.close()
+            products_changed()
             flash(f'Product "{name}" added successfully!', 'success')
             return redirect('/')
         except sqlite3.IntegrityError:
             flash('Barcode already exists!', 'error')
 
-    # Get suppliers for dropdown
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT id, name FROM suppliers ORDER BY name")
-    suppliers = c.fetchall()
-    conn.close()
-
-    return render_template('add_product.html', suppliers=suppliers)
+    return render_template('add_product.html', suppliers=supplier_choices())
 
 # -----------------------------
 # EDIT PRODUCT
 # -----------------------------
-@app.route('/edit_product/<int:product_id>', methods=['GET', 'POST'])
+def update_product(conn, product_id, name, cost, price, stock, min_stock, category, supplier_id):
+    """Write transaction: save the edited product fields
+
+    Returns the product's previous (stock, min_stock), or None if it is gone.
+    """
+    previous = conn.execute("SELECT stock, min_stock FROM products WHERE id = ?", (product_id,)).fetchone()
+    conn.execute("""
+        UPDATE products 
+        SET name = ?, cost = ?, price = ?, stock = ?, min_stock = ?, category = ?, supplier_id = ?
+        WHERE id = ?
+    """, (name, cost, price, stock, min_stock, category, supplier_id, product_id))
+    alerts.evaluate(conn, [product_id], debounce_seconds=current_app.config['ALERT_DEBOUNCE_SECONDS'])
+    if previous is not None:
+        record_stock_events(conn, [(product_id, name, stock, min_stock, previous[0] <= previous[1])])
+    return previous
+
+@bp.route('/edit_product/<int:product_id>', methods=['GET', 'POST'])
 @login_required
 def edit_product(product_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-
     if request.method == 'POST':
         name = request.form['name']
         cost = float(request.form['cost'])
@@ -417,39 +470,33 @@ def edit_product(product_id):
 
         if price < cost:
             flash('Selling price cannot be less than cost price!', 'error')
-            return redirect(url_for('edit_product', product_id=product_id))
+            return redirect(url_for('.edit_product', product_id=product_id))
 
-        c.execute("""
-            UPDATE products 
-            SET name = ?, cost = ?, price = ?, stock = ?, min_stock = ?, category = ?, supplier_id = ?
-            WHERE id = ?
-        """, (name, cost, price, stock, min_stock, category, supplier_id, product_id))
-        conn.commit()
-        conn.close()
+        db.run_write(update_product, product_id, name, cost, price, stock, min_stock, category, supplier_id)
+        alert_dispatcher.wake()
+        event_broker.wake()
+        products_changed()
         flash('Product updated successfully!', 'success')
         return redirect('/')
 
+    conn = get_db()
+    c = conn.cursor()
     c.execute("SELECT * FROM products WHERE id = ?", (product_id,))
     product = c.fetchone()
-    
-    c.execute("SELECT id, name FROM suppliers ORDER BY name")
-    suppliers = c.fetchall()
-    
-    conn.close()
 
     if not product:
         flash('Product not found!', 'error')
         return redirect('/')
 
-    return render_template('edit_product.html', product=product, suppliers=suppliers)
+    return render_template('edit_product.html', product=product, suppliers=supplier_choices())
 
 # -----------------------------------------------------------------------------------
 # DELETE PRODUCT
 # -----------------------------------------------------------------------------------
-@app.route('/delete_product/<int:product_id>')
+@bp.route('/delete_product/<int:product_id>')
 @login_required
 def delete_product(product_id):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT name FROM products WHERE id = ?", (product_id,))
     product = c.fetchone()
@@ -457,188 +504,638 @@ def delete_product(product_id):
     if product:
         c.execute("DELETE FROM products WHERE id = ?", (product_id,))
         conn.commit()
+        products_changed()
         flash(f'Product "{product[0]}" deleted successfully!', 'success')
     else:
         flash('Product not found!', 'error')
     
-    conn.close()
     return redirect('/')
 
 # -------------------------------------------------------------------------------------
-# ADD SALE
+# BULK PRODUCT IMPORT
 # -------------------------------------------------------------------------------------
-@app.route('/add_sale', methods=['GET', 'POST'])
-@login_required
-def add_sale():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT * FROM products WHERE stock > 0")
-    products = c.fetchall()
+IMPORT_REPORT_ERRORS = 200
 
+@bp.route('/import_products', methods=['GET', 'POST'])
+@login_required
+def upload_products():
+    report = None
     if request.method == 'POST':
-        product_id = int(request.form['product_id'])
-        quantity = int(request.form['quantity'])
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Choose a CSV or JSON file to import!', 'error')
+            return redirect(url_for('.upload_products'))
 
-        # Check stock availability
-        c.execute("SELECT stock, price FROM products WHERE id = ?", (product_id,))
-        product_data = c.fetchone()
-        
-        if not product_data:
-            flash('Product not found!', 'error')
-            conn.close()
-            return redirect(url_for('add_sale'))
+        # Each validated chunk is committed as its own write transaction
+        try:
+            report = import_products.run_import(
+                import_products.text_stream(upload.stream),
+                import_products.detect_format(upload.filename),
+                lambda rows: db.run_write(import_products.apply_chunk, rows))
+        finally:
+            products_changed()
+
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(report)
+        flash(f"Imported {report['imported']} of {report['rows']} rows "
+              f"({len(report['errors'])} rejected)", 'success' if not report['errors'] else 'warning')
+
+    return render_template('import_products.html', report=report, fields=import_products.FIELDS,
+                           max_errors=IMPORT_REPORT_ERRORS)
+
+# -------------------------------------------------------------------------------------
+# ADD SALE
+# -------------------------------------------------------------------------------------
+class InvalidBasket(ValueError):
+    """Malformed basket: empty, or a quantity below 1 (HTTP 400)"""
+
+class ProductNotFound(ValueError):
+    """A basket line names a product that does not exist (HTTP 404)"""
+
+class InsufficientStock(ValueError):
+    """Not enough stock left for a line (HTTP 409)"""
+
+def basket_error(e):
+    """JSON error response for a ValueError raised by record_basket"""
+    if isinstance(e, ProductNotFound):
+        return jsonify({'error': str(e)}), 404
+    if isinstance(e, InsufficientStock):
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'error': str(e)}), 400
+
+def record_basket(conn, lines, sale_time, user_id=None):
+    """Write transaction: one checkout made of (product_id, quantity) lines
+
+    Stock is taken with a conditional UPDATE per line so it can never go
+    negative; any failing line raises (a ValueError subclass above) and the
+    whole basket is rolled back. Returns (transaction_id, total_amount).
+    """
+    # Repeated scans of the same product collapse into one line
+    quantities = {}
+    for product_id, quantity in lines:
+        if quantity < 1:
+            raise InvalidBasket('Quantity must be at least 1!')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+    if not quantities:
+        raise InvalidBasket('No items to sell!')
 
-        available_stock, price = product_data
+    c = conn.cursor()
+    placeholders = ', '.join('?' * len(quantities))
+    c.execute(f"SELECT id, name, price, cost, category FROM products WHERE id IN ({placeholders})", list(quantities))
+    products = {row[0]: row[1:] for row in c.fetchall()}
+
+    if len(products) != len(quantities):
+        raise ProductNotFound('Product not found!')
+
+    # The new level comes back from the UPDATE itself, so the stock events
+    # below describe exactly this transaction's change
+    stock_levels = []
+    for product_id, quantity in quantities.items():
+        c.execute("UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ? RETURNING stock, min_stock",
+                  (quantity, product_id, quantity))
+        level = c.fetchone()
+        if level is not None:
+            stock, min_stock = level
+            stock_levels.append((product_id, products[product_id][0], stock, min_stock,
+                                 stock + quantity <= min_stock))
+        else:
+            c.execute("SELECT stock FROM products WHERE id = ?", (product_id,))
+            available_stock = c.fetchone()[0]
+            prefix = f'{products[product_id][0]}: ' if len(quantities) > 1 else ''
+            raise InsufficientStock(f'{prefix}Insufficient stock! Only {available_stock} units available.')
 
-        if quantity > available_stock:
-            flash(f'Insufficient stock! Only {available_stock} units available.', 'error')
-            conn.close()
-            return redirect(url_for('add_sale'))
+    total_quantity = sum(quantities.values())
+    total_amount = sum(products[product_id][1] * quantity for product_id, quantity in quantities.items())
 
-        total_amount = quantity * price
+    c.execute("""
+        INSERT INTO sale_transactions (sale_time, user_id, line_count, quantity, total_amount)
+        VALUES (?, ?, ?, ?, ?)
+    """, (sale_time, user_id, len(quantities), total_quantity, total_amount))
+    transaction_id = c.lastrowid
+
+    # Price and cost are snapshotted so later product edits don't rewrite history
+    c.executemany("""
+        INSERT INTO sales (transaction_id, product_id, quantity, total_amount, sale_time, unit_price, unit_cost,
+                           category)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(transaction_id, product_id, quantity, quantity * products[product_id][1], sale_time,
+           products[product_id][1], products[product_id][2], products[product_id][3])
+          for product_id, quantity in quantities.items()])
+
+    alerts.evaluate(conn, quantities, sale_time, current_app.config['ALERT_DEBOUNCE_SECONDS'])
+
+    events.record(conn, 'sale', {
+        'transaction_id': transaction_id,
+        'sale_time': sale_time,
+        'total_amount': total_amount,
+        'quantity': total_quantity,
+        'items': [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in quantities.items()],
+    })
+    record_stock_events(conn, stock_levels)
+
+    return transaction_id, total_amount
+
+def record_sale(conn, product_id, quantity, sale_time, user_id=None):
+    """Write transaction: a single-line checkout; returns the sale total"""
+    return record_basket(conn, [(product_id, quantity)], sale_time, user_id)[1]
+
+@bp.route('/add_sale', methods=['GET', 'POST'])
+@login_required
+def add_sale():
+    if request.method == 'POST':
+        # One line per product_id/quantity pair, so a form may carry a whole basket
+        try:
+            lines = [(int(product_id), int(quantity)) for product_id, quantity
+                     in zip(request.form.getlist('product_id'), request.form.getlist('quantity'))]
+        except ValueError:
+            flash('Choose a product and a quantity', 'error')
+            return redirect(url_for('.add_sale'))
 
         # Get current SAST time
         current_time = get_current_time().strftime('%Y-%m-%d %H:%M:%S')
 
-        c.execute(
-            "INSERT INTO sales (product_id, quantity, total_amount, sale_time) VALUES (?, ?, ?, ?)",
-            (product_id, quantity, total_amount, current_time)
-        )
-
-        c.execute(
-            "UPDATE products SET stock = stock - ? WHERE id = ?",
-            (quantity, product_id)
-        )
+        try:
+            transaction_id, total_amount = db.run_write(record_basket, lines, current_time, session['user_id'])
+        except ValueError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('.add_sale'))
+        alert_dispatcher.wake()
+        event_broker.wake()
 
-        conn.commit()
-        conn.close()
         flash(f'Sale recorded successfully! Total: R {total_amount:.2f}', 'success')
         return redirect('/')
 
-    conn.close()
-    return render_template('sales.html', products=products)
+    # Products are found through /api/products/search and /api/scan, so the
+    # form only needs to know whether there is anything to sell
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM products WHERE stock > 0 LIMIT 1")
+    in_stock = c.fetchone() is not None
+
+    return render_template('sales.html', in_stock=in_stock)
 
 # ----------------------------------------------------------------------------------------
-# SALES HISTORY
+# BARCODE SCANNING
 # ----------------------------------------------------------------------------------------
-@app.route('/sales_history')
+barcode_index = app_extension('barcode_index')
+
+def scanned_product(barcode):
+    """(id, name, price, category, stock) for a barcode, or None"""
+    conn = get_db()
+    entry = barcode_index.lookup(conn, barcode)
+    if entry is None:
+        return None
+    row = conn.execute("SELECT stock FROM products WHERE id = ?", (entry[0],)).fetchone()
+    if row is None:
+        # Deleted since the index was built
+        barcode_index.invalidate()
+        return None
+    return entry + (row[0],)
+
+@bp.route('/api/scan/<barcode>')
 @login_required
-def sales_history():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
-    c.execute("""
-        SELECT s.id, p.name, s.quantity, s.total_amount, s.sale_time
+def scan(barcode):
+    product = scanned_product(barcode)
+    if product is None:
+        return jsonify({'error': 'Unknown barcode', 'barcode': barcode}), 404
+
+    product_id, name, price, category, stock = product
+    return jsonify({'id': product_id, 'name': name, 'price': price, 'category': category,
+                    'stock': stock, 'barcode': barcode})
+
+@bp.route('/api/scan/<barcode>/sell', methods=['POST'])
+@login_required
+def scan_sell(barcode):
+    data = request.get_json(silent=True) or request.form
+    try:
+        quantity = int(data.get('quantity', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid quantity'}), 400
+    if quantity < 1:
+        return jsonify({'error': 'Invalid quantity'}), 400
+
+    product = scanned_product(barcode)
+    if product is None:
+        return jsonify({'error': 'Unknown barcode', 'barcode': barcode}), 404
+
+    current_time = get_current_time().strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        transaction_id, total_amount = db.run_write(record_basket, [(product[0], quantity)], current_time,
+                                                    session['user_id'])
+    except ValueError as e:
+        return basket_error(e)
+    alert_dispatcher.wake()
+    event_broker.wake()
+
+    stock = get_db().execute("SELECT stock FROM products WHERE id = ?", (product[0],)).fetchone()[0]
+    return jsonify({'product_id': product[0], 'name': product[1], 'quantity': quantity,
+                    'total_amount': total_amount, 'stock': stock, 'sale_time': current_time})
+
+@bp.route('/api/checkout', methods=['POST'])
+@login_required
+def checkout():
+    """Whole basket in one request: {"items": [{"product_id" or "barcode", "quantity"}]}"""
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list'}), 400
+
+    lines = []
+    for item in items:
+        try:
+            quantity = int(item.get('quantity', 1))
+            if 'barcode' in item:
+                product = barcode_index.lookup(get_db(), str(item['barcode']))
+                if product is None:
+                    return jsonify({'error': 'Unknown barcode', 'barcode': item['barcode']}), 404
+                product_id = product[0]
+            else:
+                product_id = int(item['product_id'])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return jsonify({'error': 'Each item needs a product_id or barcode and a whole quantity'}), 400
+        lines.append((product_id, quantity))
+
+    current_time = get_current_time().strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        transaction_id, total_amount = db.run_write(record_basket, lines, current_time, session['user_id'])
+    except ValueError as e:
+        return basket_error(e)
+    alert_dispatcher.wake()
+    event_broker.wake()
+
+    return jsonify({'transaction_id': transaction_id, 'total_amount': total_amount,
+                    'line_count': len({product_id for product_id, _ in lines}), 'sale_time': current_time})
+
+# ----------------------------------------------------------------------------------------
+# SALES HISTORY
+# ----------------------------------------------------------------------------------------
+SALES_PAGE_SIZE = 100
+MAX_SALES_PAGE_SIZE = 500
+
+def parse_sales_filters(args):
+    """Validated sales filters from query args; raises ValueError on bad input"""
+    filters = {}
+    for key in ('start', 'end'):
+        if args.get(key):
+            filters[key] = datetime.strptime(args[key], '%Y-%m-%d').date()
+    if args.get('product_id'):
+        filters['product_id'] = int(args['product_id'])
+    if args.get('category'):
+        filters['category'] = args['category']
+    return filters
+
+def sales_filter_clauses(filters):
+    """WHERE clauses and params for parse_sales_filters() output (sales s, products p)"""
+    clauses, params = [], []
+    if 'start' in filters:
+        clauses.append("s.sale_time >= ?")
+        params.append(day_start(filters['start']))
+    if 'end' in filters:
+        # end date is inclusive, so stop at midnight after it
+        clauses.append("s.sale_time < ?")
+        params.append(day_start(filters['end'] + timedelta(days=1)))
+    if 'product_id' in filters:
+        clauses.append("s.product_id = ?")
+        params.append(filters['product_id'])
+    if 'category' in filters:
+        # sales.category, not p.category, so the keyset can follow idx_sales_category_time
+        clauses.append("s.category = ?")
+        params.append(filters['category'])
+    return clauses, params
+
+def encode_sales_cursor(sale_time, sale_id):
+    return base64.urlsafe_b64encode(f"{sale_time}|{sale_id}".encode()).decode()
+
+def decode_sales_cursor(cursor):
+    """(sale_time, id) from encode_sales_cursor; raises ValueError for anything else"""
+    sale_time, sale_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    sale_id = int(sale_id)
+    if not -2 ** 63 <= sale_id < 2 ** 63:
+        raise ValueError('Sale id out of range')
+    return sale_time, sale_id
+
+def fetch_sales_page(c, filters, cursor=None, limit=SALES_PAGE_SIZE):
+    """One page of sales, newest first, using keyset pagination on (sale_time, id)
+
+    The cursor marks the last row of the previous page, so every page is an
+    index range scan starting right after it instead of an OFFSET skip.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    clauses, params = sales_filter_clauses(filters)
+    if cursor:
+        clauses.append("(s.sale_time, s.id) < (?, ?)")
+        params.extend(decode_sales_cursor(cursor))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    c.execute(f"""
+        SELECT s.id, p.name, s.quantity, s.total_amount, s.sale_time,
+               s.product_id, p.category, s.unit_price
         FROM sales s
         JOIN products p ON s.product_id = p.id
-        ORDER BY s.sale_time DESC
-        LIMIT 100
-    """)
-    sales = c.fetchall()
-    conn.close()
+        {where}
+        ORDER BY s.sale_time DESC, s.id DESC
+        LIMIT ?
+    """, params + [limit + 1])
+    rows = c.fetchall()
 
-    return render_template('sales_history.html', sales=sales)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_sales_cursor(rows[-1][4], rows[-1][0])
+    return rows, next_cursor
 
-# -------------------------------------------------------------------------------
-# ANALYTICS API (for charts)
-# -------------------------------------------------------------------------------
-@app.route('/api/sales_chart')
+def sales_page_size(args):
+    return max(1, min(int(args.get('per_page', SALES_PAGE_SIZE)), MAX_SALES_PAGE_SIZE))
+
+@bp.route('/sales_history')
 @login_required
-def sales_chart():
-    conn = sqlite3.connect(DB_NAME)
+def sales_history():
+    conn = get_db()
     c = conn.cursor()
-    
-    # Get date 7 days ago in SAST
-    seven_days_ago = (get_current_time() - timedelta(days=7)).date()
-    
-    # Last 7 days sales
-    c.execute("""
-        SELECT DATE(sale_time) as date, SUM(total_amount) as revenue
-        FROM sales
-        WHERE DATE(sale_time) >= ?
-        GROUP BY DATE(sale_time)
-        ORDER BY date
-    """, (seven_days_ago,))
-    data = c.fetchall()
-    conn.close()
 
-    dates = [row[0] for row in data]
-    revenues = [float(row[1]) if row[1] else 0 for row in data]
+    try:
+        filters = parse_sales_filters(request.args)
+        sales, next_cursor = fetch_sales_page(c, filters, request.args.get('cursor'),
+                                              sales_page_size(request.args))
+    except ValueError:
+        flash('Invalid sales filter.', 'error')
+        return redirect(url_for('.sales_history'))
+
+    # The product filter is a type-ahead over /api/products/search, so only the
+    # chosen product is looked up here, never the whole catalogue
+    filter_product_label = product_label(filters['product_id']) if 'product_id' in filters else ''
+    categories = product_categories()
+
+    # Raw filter values, carried over into the next-page link
+    filter_args = {key: request.args[key] for key in ('start', 'end', 'product_id', 'category', 'per_page')
+                   if request.args.get(key)}
 
-    return jsonify({'dates': dates, 'revenues': revenues})
+    return render_template('sales_history.html', sales=sales, next_cursor=next_cursor,
+                           filter_product_label=filter_product_label, categories=categories, filter_args=filter_args,
+                           is_first_page=not request.args.get('cursor'))
 
-@app.route('/api/top_products')
+@bp.route('/api/sales')
 @login_required
-def top_products():
-    conn = sqlite3.connect(DB_NAME)
+def api_sales():
+    conn = get_db()
     c = conn.cursor()
-    
-    c.execute("""
-        SELECT p.name, SUM(s.quantity) as total_sold
-        FROM sales s
-        JOIN products p ON s.product_id = p.id
-        GROUP BY p.id
-        ORDER BY total_sold DESC
-        LIMIT 5
-    """)
-    data = c.fetchall()
-    conn.close()
 
-    products = [row[0] for row in data]
-    quantities = [row[1] for row in data]
+    try:
+        filters = parse_sales_filters(request.args)
+        rows, next_cursor = fetch_sales_page(c, filters, request.args.get('cursor'),
+                                             sales_page_size(request.args))
+    except ValueError:
+        return jsonify({'error': 'Invalid filter or cursor'}), 400
+
+    sales = [{
+        'id': row[0],
+        'product_id': row[5],
+        'product': row[1],
+        'category': row[6],
+        'quantity': row[2],
+        'unit_price': row[7],
+        'total_amount': row[3],
+        'sale_time': row[4],
+    } for row in rows]
+
+    return jsonify({'sales': sales, 'next_cursor': next_cursor})
 
-    return jsonify({'products': products, 'quantities': quantities})
+# -------------------------------------------------------------------------------
+# ANALYTICS API (for charts)
+# -------------------------------------------------------------------------------
+def conditional_json(key, tables, loader, not_before=0):
+    """JSON response validated by the cache_versions counters of the given tables
+
+    The ETag is built from the counters and Last-Modified from their change
+    times, so a repeat request with If-None-Match / If-Modified-Since gets a
+    304 without running the query. The payload itself is memoised per version
+    in reference_cache. not_before raises Last-Modified for results that also
+    depend on the clock (e.g. "last 7 days").
+    """
+    conn = get_db()
+    changes = cache.last_changes(conn)
+    versions = {name: change[0] for name, change in changes.items()}
+    etag = key + '-' + '.'.join(str(versions.get(table, 0)) for table in tables)
+    last_modified = max([not_before] + [changes.get(table, (0, 0))[1] for table in tables])
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(reference_cache.get(conn, key, tables, loader, versions))
+    response.set_etag(etag)
+    response.last_modified = datetime.fromtimestamp(last_modified, timezone.utc)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@bp.route('/api/sales_chart')
+@login_required
+def sales_chart():
+    # Get date 7 days ago in SAST
+    today = get_current_time().date()
+    seven_days_ago = today - timedelta(days=7)
+
+    def load(conn):
+        # Last 7 days sales
+        data = conn.execute("""
+            SELECT sale_date, revenue
+            FROM daily_sales_summary
+            WHERE sale_date >= ? AND sale_count > 0
+            ORDER BY sale_date
+        """, (seven_days_ago.isoformat(),)).fetchall()
+
+        dates = [row[0] for row in data]
+        revenues = [float(row[1]) if row[1] else 0 for row in data]
+        return {'dates': dates, 'revenues': revenues}
+
+    # The window moves at midnight SAST even when no sale has been made
+    midnight = datetime.combine(today, datetime.min.time(), SAST).timestamp()
+    return conditional_json(f'sales_chart:{today.isoformat()}', ('sales',), load, not_before=midnight)
+
+@bp.route('/api/top_products')
+@login_required
+def top_products():
+    def load(conn):
+        data = conn.execute("""
+            SELECT p.name, ps.quantity as total_sold
+            FROM product_sales_summary ps
+            JOIN products p ON ps.product_id = p.id
+            WHERE ps.sale_count > 0
+            ORDER BY total_sold DESC
+            LIMIT 5
+        """).fetchall()
+
+        products = [row[0] for row in data]
+        quantities = [row[1] for row in data]
+        return {'products': products, 'quantities': quantities}
+
+    # Product renames change the labels, so products count as well as sales
+    return conditional_json('top_products', ('sales', 'products'), load)
+
+@bp.route('/api/timeseries')
+@login_required
+def timeseries():
+    """?metric=revenue|units|profit&granularity=hour|day|week|month&start=&end=&group_by=&limit="""
+    metric = request.args.get('metric', 'revenue')
+    granularity = request.args.get('granularity', 'day')
+    group_by = request.args.get('group_by') or None
+    limit = min(max(1, request.args.get('limit', sales_analytics.DEFAULT_GROUP_LIMIT, type=int)), 100)
+    today = get_current_time().date()
+    try:
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else today
+        start = (datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start')
+                 else sales_analytics.default_start(granularity, end))
+        sales_analytics.check_timeseries(metric, granularity, start, end, group_by)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Grouped series are labelled with product, category and supplier names
+    tables = ('sales',) if group_by is None else ('sales', 'products', 'suppliers')
+    key = f'timeseries:{metric}:{granularity}:{start}:{end}:{group_by}:{limit}'
+    midnight = datetime.combine(today, datetime.min.time(), SAST).timestamp()
+    return conditional_json(key, tables, lambda conn: sales_analytics.timeseries(
+        conn, metric, granularity, start, end, group_by, limit), not_before=midnight)
 
 # --------------------------------------------------------------------------------
 # EXPORT SALES
 # --------------------------------------------------------------------------------
-@app.route('/export_sales')
+def wants_gzip(args):
+    return args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+@bp.route('/export_sales')
 @login_required
 def export_sales():
-    conn = sqlite3.connect(DB_NAME)
+    # Same optional filters as the sales history page (start, end, product_id, category)
+    try:
+        filters = parse_sales_filters(request.args)
+    except ValueError:
+        flash('Invalid sales filter.', 'error')
+        return redirect(url_for('.sales_history'))
+
+    clauses, params = sales_filter_clauses(filters)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    conn = get_db()
     c = conn.cursor()
-    c.execute("""
-        SELECT s.sale_time, p.name, s.quantity, p.price,
+    c.execute(f"""
+        SELECT s.sale_time, p.name, s.quantity, s.unit_price,
                s.total_amount as total
         FROM sales s
         JOIN products p ON s.product_id = p.id
+        {where}
         ORDER BY s.sale_time DESC
-    """)
-    rows = c.fetchall()
-    conn.close()
+    """, params)
 
-    file_name = "sales_report.csv"
-    with open(file_name, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['Sale Time', 'Product Name', 'Quantity', 'Price', 'Total'])
-        writer.writerows(rows)
-    
-    return send_file(file_name, as_attachment=True)
+    return exports.csv_response('sales_report.csv',
+                                ['Sale Time', 'Product Name', 'Quantity', 'Price', 'Total'],
+                                c, compress=wants_gzip(request.args))
 
 # --------------------------------------------------------------------------------------------------------
 # EXPORT INVENTORY CSV
 # --------------------------------------------------------------------------------------------------------
-@app.route('/export')
+@bp.route('/export')
 @login_required
 def export():
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
-    c.execute("SELECT * FROM products")
-    rows = c.fetchall()
-    conn.close()
+    c.execute("SELECT id, name, cost, price, stock, category, barcode, created_at FROM products ORDER BY id")
 
-    file_name = "inventory_export.csv"
-    with open(file_name, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['ID', 'Name', 'Cost', 'Price', 'Stock', 'Category', 'Barcode', 'Created At'])
-        writer.writerows(rows)
+    return exports.csv_response('inventory_export.csv',
+                                ['ID', 'Name', 'Cost', 'Price', 'Stock', 'Category', 'Barcode', 'Created At'],
+                                c, compress=wants_gzip(request.args))
 
-    return send_file(file_name, as_attachment=True)
+# --------------------------------------------------------------------------------------------------------
+# BULK EXPORT API (NDJSON / COLUMNAR, INCREMENTAL)
+# --------------------------------------------------------------------------------------------------------
+SALES_BULK_COLUMNS = [
+    ('id', exports.INT), ('sale_time', exports.STR), ('product_id', exports.INT),
+    ('product', exports.STR), ('category', exports.STR), ('quantity', exports.INT),
+    ('unit_price', exports.FLOAT), ('unit_cost', exports.FLOAT), ('total_amount', exports.FLOAT),
+]
+
+PRODUCT_BULK_COLUMNS = [
+    ('id', exports.INT), ('name', exports.STR), ('cost', exports.FLOAT), ('price', exports.FLOAT),
+    ('stock', exports.INT), ('min_stock', exports.INT), ('category', exports.STR),
+    ('barcode', exports.STR), ('supplier_id', exports.INT), ('created_at', exports.STR),
+    ('change_seq', exports.INT),
+]
+
+def parse_since(value):
+    """'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS' as a comparable timestamp string"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return day_start(datetime.strptime(value, '%Y-%m-%d').date())
+
+def bulk_export(name, table, columns, select_sql, time_column, key='id'):
+    """Stream rows with key > the client's last key (and time >= since) up to the current max
+
+    Sales are append-only and page on id (since_id / X-Last-Id). Products
+    change in place, so they page on change_seq (since_seq / X-Last-Seq),
+    which every insert and edit moves forward. The upper bound is fixed
+    before streaming starts and returned in the header, which the client
+    passes back next time. time_column None means `since` is not supported.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'columnar'):
+        return jsonify({'error': 'format must be ndjson or columnar'}), 400
+    param, header = ('since_id', 'X-Last-Id') if key == 'id' else ('since_seq', 'X-Last-Seq')
+    if request.args.get('since') and time_column is None:
+        return jsonify({'error': f'since is not supported here; pass {param} from the {header} header'}), 400
+    try:
+        since_key = int(request.args.get(param, 0))
+        since = parse_since(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        return jsonify({'error': f'Invalid {param} or since'}), 400
+
+    conn = get_db()
+    c = conn.cursor()
+    c.execute(f"SELECT COALESCE(MAX({key}), 0) FROM {table}")
+    last_key = c.fetchone()[0]
+
+    clauses, params = [f"t.{key} > ?", f"t.{key} <= ?"], [since_key, last_key]
+    if since:
+        clauses.append(f"{time_column} >= ?")
+        params.append(since)
+    c.execute(f"{select_sql} WHERE {' AND '.join(clauses)} ORDER BY t.{key}", params)
+
+    if fmt == 'ndjson':
+        response = exports.download(exports.stream_ndjson(columns, c), f'{name}.ndjson',
+                                    'application/x-ndjson', compress=wants_gzip(request.args))
+    else:
+        columnar = exports.columnar_format()
+        mimetype = 'application/vnd.apache.arrow.stream' if columnar == 'arrow-ipc' else 'application/octet-stream'
+        response = exports.download(exports.stream_columnar(columns, c), f'{name}.{columnar}',
+                                    mimetype, compress=wants_gzip(request.args))
+        response.headers['X-Columnar-Format'] = columnar
+    response.headers[header] = str(last_key)
+    return response
+
+@bp.route('/api/bulk/sales')
+@login_required
+def bulk_sales():
+    return bulk_export('sales', 'sales', SALES_BULK_COLUMNS, """
+        SELECT t.id, t.sale_time, t.product_id, p.name, p.category, t.quantity,
+               t.unit_price, t.unit_cost, t.total_amount
+        FROM sales t
+        LEFT JOIN products p ON t.product_id = p.id
+    """, 't.sale_time')
+
+@bp.route('/api/bulk/products')
+@login_required
+def bulk_products():
+    """New and changed products since since_seq; deletions are not reported"""
+    return bulk_export('products', 'products', PRODUCT_BULK_COLUMNS, """
+        SELECT t.id, t.name, t.cost, t.price, t.stock, t.min_stock, t.category,
+               t.barcode, NULLIF(t.supplier_id, ''), t.created_at, t.change_seq
+        FROM products t
+    """, None, key='change_seq')
 
 # ----------------------------------------------------------------------------------------------
 # ANALYTICS DASHBOARD
 # ----------------------------------------------------------------------------------------------
-@app.route('/analytics')
+@bp.route('/analytics')
 @login_required
 def analytics():
     return render_template('analytics.html')
@@ -646,17 +1143,16 @@ def analytics():
 # ----------------------------------------------------------------------------------------------
 # SUPPLIERS MANAGEMENT
 # ----------------------------------------------------------------------------------------------
-@app.route('/suppliers')
+@bp.route('/suppliers')
 @login_required
 def suppliers():
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT * FROM suppliers ORDER BY name")
     suppliers = c.fetchall()
-    conn.close()
     return render_template('suppliers.html', suppliers=suppliers)
 
-@app.route('/add_supplier', methods=['GET', 'POST'])
+@bp.route('/add_supplier', methods=['GET', 'POST'])
 @login_required
 def add_supplier():
     if request.method == 'POST':
@@ -666,7 +1162,7 @@ def add_supplier():
         phone = request.form.get('phone', '')
         address = request.form.get('address', '')
 
-        conn = sqlite3.connect(DB_NAME)
+        conn = get_db()
         c = conn.cursor()
         current_time = get_current_time().strftime('%Y-%m-%d %H:%M:%S')
         c.execute(
@@ -674,16 +1170,16 @@ def add_supplier():
             (name, contact_person, email, phone, address, current_time)
         )
         conn.commit()
-        conn.close()
+        suppliers_changed()
         flash(f'Supplier "{name}" added successfully!', 'success')
-        return redirect(url_for('suppliers'))
+        return redirect(url_for('.suppliers'))
 
     return render_template('add_supplier.html')
 
-@app.route('/edit_supplier/<int:supplier_id>', methods=['GET', 'POST'])
+@bp.route('/edit_supplier/<int:supplier_id>', methods=['GET', 'POST'])
 @login_required
 def edit_supplier(supplier_id):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
 
     if request.method == 'POST':
@@ -699,24 +1195,23 @@ def edit_supplier(supplier_id):
             WHERE id = ?
         """, (name, contact_person, email, phone, address, supplier_id))
         conn.commit()
-        conn.close()
+        suppliers_changed()
         flash('Supplier updated successfully!', 'success')
-        return redirect(url_for('suppliers'))
+        return redirect(url_for('.suppliers'))
 
     c.execute("SELECT * FROM suppliers WHERE id = ?", (supplier_id,))
     supplier = c.fetchone()
-    conn.close()
 
     if not supplier:
         flash('Supplier not found!', 'error')
-        return redirect(url_for('suppliers'))
+        return redirect(url_for('.suppliers'))
 
     return render_template('edit_supplier.html', supplier=supplier)
 
-@app.route('/delete_supplier/<int:supplier_id>')
+@bp.route('/delete_supplier/<int:supplier_id>')
 @login_required
 def delete_supplier(supplier_id):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT name FROM suppliers WHERE id = ?", (supplier_id,))
     supplier = c.fetchone()
@@ -724,20 +1219,20 @@ def delete_supplier(supplier_id):
     if supplier:
         c.execute("DELETE FROM suppliers WHERE id = ?", (supplier_id,))
         conn.commit()
+        suppliers_changed()
         flash(f'Supplier "{supplier[0]}" deleted successfully!', 'success')
     else:
         flash('Supplier not found!', 'error')
     
-    conn.close()
-    return redirect(url_for('suppliers'))
+    return redirect(url_for('.suppliers'))
 
 # --------------------------------------------------------------------------------
 # PURCHASE ORDERS
 # --------------------------------------------------------------------------------
-@app.route('/purchase_orders')
+@bp.route('/purchase_orders')
 @login_required
 def purchase_orders():
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("""
         SELECT po.*, s.name as supplier_name, p.name as product_name
@@ -747,13 +1242,12 @@ def purchase_orders():
         ORDER BY po.order_date DESC
     """)
     orders = c.fetchall()
-    conn.close()
     return render_template('purchase_orders.html', orders=orders)
 
-@app.route('/create_purchase_order', methods=['GET', 'POST'])
+@bp.route('/create_purchase_order', methods=['GET', 'POST'])
 @login_required
 def create_purchase_order():
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
 
     if request.method == 'POST':
@@ -774,27 +1268,32 @@ def create_purchase_order():
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending')
         """, (supplier_id, product_id, quantity, cost_per_unit, total_cost,
               current_time, expected_delivery, notes))
+        order_id = c.lastrowid
+        events.record(conn, 'purchase_order', {'order_id': order_id, 'status': 'pending', 'product_id': product_id,
+                                               'supplier_id': supplier_id, 'quantity': quantity,
+                                               'total_cost': total_cost})
         
         conn.commit()
-        conn.close()
+        event_broker.wake()
         flash(f'Purchase order created successfully! Total: R{total_cost:.2f}', 'success')
-        return redirect(url_for('purchase_orders'))
+        return redirect(url_for('.purchase_orders'))
 
-    # Get suppliers and products for dropdowns
-    c.execute("SELECT id, name FROM suppliers ORDER BY name")
-    suppliers = c.fetchall()
-    c.execute("SELECT id, name, stock, min_stock FROM products ORDER BY name")
-    products = c.fetchall()
-    conn.close()
+    # The product is chosen with the search picker and its forecast fetched
+    # from /api/products/<id>/forecast, so nothing per product is rendered here
+    selected_product = request.args.get('product_id', type=int)
+    selected_label = product_label(selected_product) if selected_product else ''
 
-    return render_template('create_purchase_order.html', suppliers=suppliers, products=products)
+    return render_template('create_purchase_order.html', suppliers=supplier_choices(),
+                           selected_product=selected_product if selected_label else None,
+                           selected_label=selected_label)
 
-@app.route('/receive_purchase_order/<int:order_id>')
-@login_required
-def receive_purchase_order(order_id):
-    conn = sqlite3.connect(DB_NAME)
+def receive_order(conn, order_id, received_date):
+    """Write transaction: add ordered stock and mark the order received
+
+    Returns the order's previous status (None if missing), its quantity and product.
+    """
     c = conn.cursor()
-    
+
     # Get order details
     c.execute("""
         SELECT product_id, quantity, status 
@@ -802,60 +1301,141 @@ def receive_purchase_order(order_id):
         WHERE id = ?
     """, (order_id,))
     order = c.fetchone()
-    
-    if not order:
-        flash('Purchase order not found!', 'error')
-        conn.close()
-        return redirect(url_for('purchase_orders'))
-    
-    if order[2] == 'received':
-        flash('This order has already been received!', 'warning')
-        conn.close()
-        return redirect(url_for('purchase_orders'))
-    
+
+    if not order or order[2] == 'received':
+        return (order[2] if order else None), 0, None
+
     product_id, quantity, status = order
-    
+
     # Update product stock
     c.execute("""
         UPDATE products 
         SET stock = stock + ? 
         WHERE id = ?
+        RETURNING name, stock, min_stock
     """, (quantity, product_id))
-    
+    level = c.fetchone()
+
     # Update order status
-    current_time = get_current_time().strftime('%Y-%m-%d %H:%M:%S')
     c.execute("""
         UPDATE purchase_orders 
         SET status = 'received', received_date = ?
         WHERE id = ?
-    """, (current_time, order_id))
-    
-    conn.commit()
-    conn.close()
-    
+    """, (received_date, order_id))
+
+    # Re-arms the product's alert once stock is back above its threshold
+    alerts.evaluate(conn, [product_id], received_date, current_app.config['ALERT_DEBOUNCE_SECONDS'])
+
+    events.record(conn, 'purchase_order', {'order_id': order_id, 'status': 'received', 'previous_status': status,
+                                           'product_id': product_id, 'quantity': quantity})
+    if level is not None:
+        name, stock, min_stock = level
+        record_stock_events(conn, [(product_id, name, stock, min_stock, stock - quantity <= min_stock)])
+
+    return status, quantity, product_id
+
+@bp.route('/receive_purchase_order/<int:order_id>')
+@login_required
+def receive_purchase_order(order_id):
+    current_time = get_current_time().strftime('%Y-%m-%d %H:%M:%S')
+    status, quantity, product_id = db.run_write(receive_order, order_id, current_time)
+
+    if status is None:
+        flash('Purchase order not found!', 'error')
+        return redirect(url_for('.purchase_orders'))
+
+    if status == 'received':
+        flash('This order has already been received!', 'warning')
+        return redirect(url_for('.purchase_orders'))
+
+    alert_dispatcher.wake()
+    event_broker.wake()
     flash(f'Purchase order received! Stock updated (+{quantity} units)', 'success')
-    return redirect(url_for('purchase_orders'))
+    return redirect(url_for('.purchase_orders'))
 
-@app.route('/cancel_purchase_order/<int:order_id>')
+@bp.route('/cancel_purchase_order/<int:order_id>')
 @login_required
 def cancel_purchase_order(order_id):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     
-    c.execute("UPDATE purchase_orders SET status = 'cancelled' WHERE id = ?", (order_id,))
+    c.execute("UPDATE purchase_orders SET status = 'cancelled' WHERE id = ? RETURNING product_id, quantity",
+              (order_id,))
+    order = c.fetchone()
+    if order:
+        events.record(conn, 'purchase_order', {'order_id': order_id, 'status': 'cancelled',
+                                               'product_id': order[0], 'quantity': order[1]})
     conn.commit()
-    conn.close()
+    event_broker.wake()
     
     flash('Purchase order cancelled', 'info')
-    return redirect(url_for('purchase_orders'))
+    return redirect(url_for('.purchase_orders'))
 
 # --------------------------------------------------------------------------------------------
 # STOCK ALERTS
 # --------------------------------------------------------------------------------------------
-@app.route('/stock_alerts')
+RUNNING_OUT_LIMIT = 50
+RECENT_ALERTS_LIMIT = 20
+
+# Delivers alerts fired by stock-changing writes (see alerts.evaluate)
+alert_dispatcher = app_extension('alert_dispatcher')
+
+def reorder_plan(stock_rows):
+    """Sales velocity, days of cover and suggested order for (id, stock, min_stock) rows
+
+    Velocity only changes with sales (and the date), so it is memoised; stock
+    is always taken from the rows passed in.
+    """
+    today = get_current_time().date()
+    velocity = reference_cache.get(get_db(), f'sales_velocity:{today.isoformat()}', ('sales',),
+                                   lambda conn: sales_analytics.sales_velocity(conn, today))
+    return sales_analytics.reorder_plan(velocity, stock_rows)
+
+def catalogue_reorder_plan():
+    """reorder_plan for every product, without starting over on every sale
+
+    The full plan is built once per day and 'products' version (rows added,
+    removed or edited) and remembers the newest change_seq it has seen. After
+    that only the products whose change_seq moved since, which every sale and
+    stock change does, are recomputed and laid over it; that result is cached
+    until change_seq moves again.
+    """
+    conn = get_db()
+    versions = cache.data_versions(conn)
+    versions['product_changes'] = conn.execute("SELECT MAX(change_seq) FROM products").fetchone()[0] or 0
+    today = get_current_time().date()
+
+    def build(conn):
+        return versions['product_changes'], reorder_plan(conn.execute("SELECT id, stock, min_stock FROM products").fetchall())
+
+    def update(conn):
+        built_seq, plan = reference_cache.get(conn, f'reorder_plan_base:{today.isoformat()}', ('products',), build,
+                                              versions=versions)
+        if built_seq == versions['product_changes']:
+            return plan
+        rows = conn.execute("SELECT id, stock, min_stock FROM products WHERE change_seq > ?", (built_seq,)).fetchall()
+        velocity = sales_analytics.sales_velocity(conn, today, changed_since=built_seq)
+        return plan.updated(sales_analytics.reorder_plan(velocity, rows))
+
+    return reference_cache.get(conn, f'reorder_plan:{today.isoformat()}', ('products', 'product_changes'), update,
+                               versions=versions)
+
+@bp.route('/api/products/<int:product_id>/forecast')
+@login_required
+def api_product_forecast(product_id):
+    row = get_db().execute("SELECT id, name, stock, min_stock, cost FROM products WHERE id = ?",
+                           (product_id,)).fetchone()
+    if row is None:
+        return jsonify({'error': 'Product not found', 'product_id': product_id}), 404
+
+    forecast = reorder_plan([(row[0], row[2], row[3])])[row[0]]
+    return jsonify(dict(forecast, id=row[0], name=row[1], stock=row[2], min_stock=row[3], cost=row[4],
+                        lead_time_days=sales_analytics.LEAD_TIME_DAYS))
+
+@bp.route('/stock_alerts')
 @login_required
 def stock_alerts():
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     
     # Get products with low stock
@@ -867,7 +1447,34 @@ def stock_alerts():
         ORDER BY p.stock ASC
     """)
     low_stock_products = c.fetchall()
+
+    # Forecast every product in one pass, then list those that will run out
+    # before a new order could arrive even though they are above min_stock
+    plan = catalogue_reorder_plan()
+    low_stock_ids = {product[0] for product in low_stock_products}
+    running_out_ids = [product_id for product_id
+                       in plan.running_out(sales_analytics.LEAD_TIME_DAYS, RUNNING_OUT_LIMIT + len(low_stock_ids))
+                       if product_id not in low_stock_ids][:RUNNING_OUT_LIMIT]
+    running_out_products = []
+    if running_out_ids:
+        placeholders = ','.join('?' * len(running_out_ids))
+        c.execute(f"""
+            SELECT p.id, p.name, p.stock, p.min_stock, p.category, s.name as supplier_name
+            FROM products p
+            LEFT JOIN suppliers s ON p.supplier_id = s.id
+            WHERE p.id IN ({placeholders})
+        """, running_out_ids)
+        running_out_products = sorted(c.fetchall(), key=lambda product: plan[product[0]]['days_of_cover'])
     
+    # Alerts fired by recent stock changes
+    c.execute("""
+        SELECT product_id, product_name, stock, threshold, created_at, delivered_at
+        FROM alert_outbox
+        ORDER BY id DESC
+        LIMIT ?
+    """, (RECENT_ALERTS_LIMIT,))
+    recent_alerts = c.fetchall()
+
     # Get all stock alert settings
     c.execute("""
         SELECT sa.*, p.name, p.stock, p.min_stock
@@ -877,42 +1484,252 @@ def stock_alerts():
     """)
     alert_settings = c.fetchall()
     
-    conn.close()
     return render_template('stock_alerts.html', 
                          low_stock_products=low_stock_products,
+                         running_out_products=running_out_products,
+                         plan=plan,
+                         recent_alerts=recent_alerts,
+                         lead_time_days=sales_analytics.LEAD_TIME_DAYS,
                          alert_settings=alert_settings)
 
-@app.route('/set_stock_alert/<int:product_id>', methods=['POST'])
+@bp.route('/set_stock_alert/<int:product_id>', methods=['POST'])
 @login_required
 def set_stock_alert(product_id):
     threshold = int(request.form.get('threshold', 5))
     
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     
-    # Check if alert exists
-    c.execute("SELECT id FROM stock_alerts WHERE product_id = ?", (product_id,))
-    existing = c.fetchone()
-    
-    if existing:
-        c.execute("""
-            UPDATE stock_alerts 
-            SET alert_threshold = ?, is_active = 1
-            WHERE product_id = ?
-        """, (threshold, product_id))
-    else:
-        c.execute("""
-            INSERT INTO stock_alerts (product_id, alert_threshold, is_active)
-            VALUES (?, ?, 1)
-        """, (product_id, threshold))
+    # One row per product (unique index), so insert or update in a single statement
+    c.execute("""
+        INSERT INTO stock_alerts (product_id, alert_threshold, is_active)
+        VALUES (?, ?, 1)
+        ON CONFLICT(product_id) DO UPDATE
+        SET alert_threshold = excluded.alert_threshold, is_active = 1
+    """, (product_id, threshold))
     
     conn.commit()
-    conn.close()
     
     flash('Stock alert updated!', 'success')
-    return redirect(url_for('stock_alerts'))
+    return redirect(url_for('.stock_alerts'))
+
+# --------------------------------------------------------------------------------
+# LIVE EVENTS
+# --------------------------------------------------------------------------------
+# Write transactions record their deltas in live_events (see events.record);
+# each worker's broker tails that log, so open screens receive every
+# worker's changes over /api/stream instead of polling.
+event_broker = app_extension('event_broker')
+
+def record_stock_events(conn, levels):
+    """Write transaction step: a 'stock' event per product, and 'low_stock' on a crossing
+
+    levels are (product_id, name, stock, min_stock, was_low) as written by the
+    same transaction. 'low_stock' is sent only when a product crosses its
+    min_stock either way.
+    """
+    for product_id, name, stock, min_stock, was_low in levels:
+        low = stock <= min_stock
+        data = {'product_id': product_id, 'name': name, 'stock': stock, 'min_stock': min_stock, 'low': low}
+        events.record(conn, 'stock', data)
+        if low != was_low:
+            events.record(conn, 'low_stock', data)
+
+@bp.route('/api/stream')
+@login_required
+def stream():
+    """Server-Sent Events: sale, stock, low_stock and purchase_order deltas"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+
+    try:
+        subscription = event_broker.subscribe(get_db(), last_event_id)
+    except events.TooManySubscribers as e:
+        # Every stream holds a server thread; past the cap, clients come back later
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '15'}
+
+    # A plain generator (no stream_with_context): the request's pooled
+    # connection goes back as soon as this returns, not when the stream ends
+    return Response(event_broker.stream(subscription, current_app.config['EVENT_HEARTBEAT_SECONDS']),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --------------------------------------------------------------------------------
+# INSTRUMENTATION
+# --------------------------------------------------------------------------------
+@bp.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    sql_metrics.start_request()
+
+@bp.after_app_request
+def record_request_metrics(response):
+    # Streamed bodies (exports, /api/stream) are timed to their first byte
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    sql = sql_metrics.finish_request(request.method, request.endpoint or 'unmatched',
+                                     response.status_code, elapsed)
+    if current_app.config['QUERY_COUNT_HEADER'] or current_app.debug:
+        response.headers['X-Response-Time'] = f'{elapsed * 1000:.2f}'
+        if current_app.config['SQL_METRICS']:
+            response.headers['X-Query-Count'] = str(sql.queries)
+            response.headers['X-Query-Time'] = f'{sql.seconds * 1000:.2f}'
+    return response
+
+@bp.teardown_app_request
+def clear_request_metrics(exception=None):
+    sql_metrics.discard_request()
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text format; scrapers send METRICS_TOKEN as a bearer token"""
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    elif 'user_id' not in session:
+        return Response('Log in or set METRICS_TOKEN\n', status=401, mimetype='text/plain')
+
+    gauges = {
+        'db_pool': db.get_pool().stats(),
+        'db_writer': db.get_writer().stats(),
+        'reference_cache': reference_cache.stats(),
+        'events': event_broker.stats(),
+        'alerts': {'delivered': alert_dispatcher.delivered},
+    }
+    # Each worker keeps its own counters and a scrape reaches whichever worker
+    # accepts it, so every sample carries the worker's pid: take rate() per
+    # worker series, then sum() across workers
+    return Response(sql_metrics.render(gauges, {'worker': str(os.getpid())}),
+                    mimetype='text/plain; version=0.0.4')
+
+# --------------------------------------------------------------------------------
+# PROFILING
+# --------------------------------------------------------------------------------
+PROFILE_ROLE = 'Mabutsi'
+
+profile_store = app_extension('profile_store')
+
+def requested_profile():
+    """'report' or 'explain' when an admin asked for a profile, else None
+
+    Asked for with ?profile=1 (?profile=explain or &explain=1 adds query plans)
+    or the same values in an X-Profile header.
+    """
+    flag = request.args.get('profile') or request.headers.get('X-Profile')
+    if not flag or flag == '0' or session.get('role') != PROFILE_ROLE:
+        return None
+    if flag == 'explain' or request.args.get('explain') == '1':
+        return 'explain'
+    return 'report'
+
+@bp.before_app_request
+def start_profile():
+    mode = requested_profile()
+    if mode is None:
+        # Background sampling: profiled and saved, response left untouched
+        rate = current_app.config['PROFILE_SAMPLE_RATE']
+        if not rate or random.random() >= rate:
+            return
+        mode = 'sample'
+    if not profiling.acquire():
+        g.profile_busy = mode != 'sample'
+        return
+    g.profile_mode = mode
+    g.profile_started = time.perf_counter()
+    if mode == 'explain' and current_app.config['SQL_METRICS']:
+        g.profile_statements = sql_metrics.capture_statements()
+    g.profiler = profiling.start()
+
+@bp.after_app_request
+def finish_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        if g.pop('profile_busy', False):
+            response.headers['X-Profile'] = 'busy'
+        return response
+
+    mode = g.pop('profile_mode')
+    if response.mimetype == 'text/event-stream':
+        # Never replaced: an event stream's generator only unsubscribes from
+        # the broker once it has started, so it has to reach the client
+        profiler.disable()
+        profiling.release()
+        if mode != 'sample':
+            response.headers['X-Profile'] = 'skipped'
+        return response
+
+    body_bytes = None
+    try:
+        # Streamed bodies (exports) do their work while being read; the report
+        # replaces the body anyway, so read it under the profiler
+        if mode != 'sample' and response.is_streamed:
+            body_bytes = sum(len(chunk) for chunk in response.iter_encoded())
+            response.close()
+        profiler.disable()
+        elapsed = time.perf_counter() - g.pop('profile_started')
+
+        query_string = request.query_string.decode('utf-8', 'replace')
+        lines = [f"{request.method} {request.path}{'?' + query_string if query_string else ''}"
+                 f" -> {response.status_code} in {elapsed * 1000:.1f} ms"]
+        if body_bytes is not None:
+            lines.append(f"Streamed body read under the profiler: {body_bytes} bytes")
+        lines.append("Writes queued to the writer thread show up here as time waiting on their result")
+        lines += ['', f"== cProfile (top {current_app.config['PROFILE_TOP']} by cumulative time) ==",
+                  profiling.stats_text(profiler, current_app.config['PROFILE_TOP'])]
+        if mode == 'explain':
+            lines += ['', '== EXPLAIN QUERY PLAN ==']
+            statements = g.pop('profile_statements', None)
+            if statements is None:
+                lines.append('(statements are only captured with SQL_METRICS=1)')
+            else:
+                pool = db.get_pool()
+                conn = db.connect(pool.database, pool.pragmas)
+                try:
+                    lines.append(f"{len(statements)} statements")
+                    lines.append(profiling.explain(conn, statements))
+                finally:
+                    conn.close()
+        report = '\n'.join(lines) + '\n'
+        base = profile_store.save(profiler, report, request.endpoint)
+    finally:
+        profiler.disable()
+        profiling.release()
+
+    if mode == 'sample':
+        return response
+    response.close()
+    report = f"Saved as {base}.prof (python -m pstats {base}.prof)\n\n" + report
+    return Response(report, mimetype='text/plain',
+                    headers={'X-Profile': os.path.basename(base), 'Cache-Control': 'no-store'})
+
+@bp.teardown_app_request
+def abandon_profile(exception=None):
+    # Requests that raised past the after_request hooks
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        profiling.release()
+
+# --------------------------------------------------------------------------------
+# DATABASE STATS
+# --------------------------------------------------------------------------------
+@bp.route('/api/db_stats')
+@login_required
+def db_stats():
+    return jsonify({'pool': db.get_pool().stats(), 'writer': db.get_writer().stats(),
+                    'reference_cache': reference_cache.stats(),
+                    'alerts': {'delivered': alert_dispatcher.delivered},
+                    'events': event_broker.stats(),
+                    'slowest_statements': dict(list(sql_metrics.statements().items())[:10])})
 
 # --------------------------------------------------------------------------------
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server; production runs wsgi.py under gunicorn or waitress
+    create_app().run()
 
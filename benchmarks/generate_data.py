@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator
+Fills a database with store-sized volumes of suppliers, products, sales and
+purchase orders for load testing. The same --seed and --end-date always
+produce the same data.
+
+    python benchmarks/generate_data.py --force
+    python benchmarks/generate_data.py --products 2000 --sales 200000 --database bench.db --force
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations
+
+SAST = timezone(timedelta(hours=2))
+BATCH_SIZE = 50000
+CASHIER_PASSWORD = 'Cashier@12'
+
+# Tables loaded here; their triggers and indexes are suspended during the load
+LOADED_TABLES = ('suppliers', 'products', 'sale_transactions', 'sales', 'purchase_orders', 'stock_alerts')
+
+CATEGORIES = {
+    'Bakery': (['Bread', 'Rolls', 'Muffins', 'Rusks', 'Scones'], 0.06),
+    'Dairy': (['Milk', 'Yoghurt', 'Cheese', 'Butter', 'Amasi'], 0.10),
+    'Beverages': (['Cola', 'Juice', 'Rooibos Tea', 'Coffee', 'Mineral Water'], 0.14),
+    'Snacks': (['Chips', 'Biscuits', 'Chocolate', 'Nuts', 'Biltong'], 0.12),
+    'Pantry': (['Maize Meal', 'Rice', 'Sugar', 'Flour', 'Cooking Oil', 'Pasta'], 0.14),
+    'Canned Goods': (['Baked Beans', 'Pilchards', 'Chakalaka', 'Tomato Paste'], 0.07),
+    'Frozen': (['Chicken Portions', 'Mixed Veg', 'Fish Fingers', 'Ice Cream'], 0.06),
+    'Produce': (['Apples', 'Bananas', 'Potatoes', 'Onions', 'Tomatoes'], 0.08),
+    'Household': (['Dishwashing Liquid', 'Washing Powder', 'Bleach', 'Candles'], 0.08),
+    'Personal Care': (['Soap', 'Toothpaste', 'Body Lotion', 'Shampoo', 'Deodorant'], 0.08),
+    'Baby': (['Nappies', 'Baby Formula', 'Wipes'], 0.03),
+    'Stationery': (['Exercise Book', 'Pens', 'Glue Stick'], 0.02),
+    'Hardware': (['Batteries', 'Light Bulbs', 'Extension Cord'], 0.02),
+}
+BRANDS = ['Sunrise', 'Karoo', 'Ubuntu', 'Blue Crane', 'Highveld', 'Protea', 'Limpopo', 'Table Bay',
+          'Drakensberg', 'Marula', 'Savanna', 'Kalahari', 'Baobab', 'Cape Point', 'Zulu Gold']
+SIZES = ['100g', '250g', '500g', '1kg', '2kg', '5kg', '330ml', '500ml', '1L', '2L', 'Pack of 6', 'Single']
+SURNAMES = ['Mokoena', 'Naidoo', 'van der Merwe', 'Dlamini', 'Botha', 'Khumalo', 'Pillay', 'Nkosi',
+            'Pretorius', 'Mahlangu', 'Smith', 'Ndlovu', 'Jacobs', 'Sithole', 'Venter', 'Mthembu']
+FIRST_NAMES = ['Thabo', 'Lerato', 'Sipho', 'Anele', 'Pieter', 'Priya', 'Zanele', 'Johan', 'Naledi', 'Ayesha']
+SUPPLIER_KINDS = ['Wholesale', 'Distributors', 'Foods', 'Trading', 'Suppliers', 'Imports']
+CITIES = ['Johannesburg', 'Pretoria', 'Durban', 'Cape Town', 'Polokwane', 'Gqeberha', 'Bloemfontein']
+
+# Relative trade by hour of day (07:00-20:00) and by weekday (Monday first)
+HOUR_WEIGHTS = {7: 3, 8: 5, 9: 6, 10: 7, 11: 8, 12: 10, 13: 9, 14: 7, 15: 7, 16: 9, 17: 11, 18: 10, 19: 6, 20: 3}
+WEEKDAY_WEIGHTS = [0.9, 0.85, 0.9, 0.95, 1.2, 1.35, 0.85]
+BASKET_LINES = ([1, 2, 3, 4, 5, 8], [40, 25, 15, 10, 7, 3])
+LINE_QUANTITIES = ([1, 2, 3, 4, 6, 12], [60, 20, 8, 6, 4, 2])
+
+
+def ean13(number):
+    """12-digit number plus its EAN-13 check digit"""
+    digits = f'{number:012d}'
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return digits + str((10 - total % 10) % 10)
+
+
+def stamp(day, seconds):
+    return (datetime(day.year, day.month, day.day) + timedelta(seconds=seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# -----------------------------------------------------------------------------------------
+# LOADING
+# -----------------------------------------------------------------------------------------
+def suspend_triggers_and_indexes(conn):
+    """Drop triggers and secondary indexes on the loaded tables; returns their SQL
+
+    Building indexes and rollups once after the load is far cheaper than
+    maintaining them row by row for millions of inserts.
+    """
+    placeholders = ', '.join('?' * len(LOADED_TABLES))
+    rows = conn.execute(f"""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('trigger', 'index') AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+    """, LOADED_TABLES).fetchall()
+    for kind, name, _ in rows:
+        conn.execute(f"DROP {kind.upper()} {name}")
+    return [sql for _, _, sql in rows]
+
+
+def restore_triggers_and_indexes(conn, statements):
+    c = conn.cursor()
+    for sql in statements:
+        c.execute(sql)
+    # The rollups and the search index were not maintained during the load
+    migrations.rebuild_sales_summaries(c)
+    migrations.rebuild_sales_buckets(c)
+    migrations.rebuild_product_search(c)
+    migrations.rebuild_product_changes(c)
+    migrations.rebuild_sales_categories(c)
+    c.execute("UPDATE cache_versions SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)")
+
+
+# -----------------------------------------------------------------------------------------
+# GENERATORS
+# -----------------------------------------------------------------------------------------
+def supplier_rows(rng, count, created_at):
+    for i in range(1, count + 1):
+        surname = rng.choice(SURNAMES)
+        contact = f'{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}'
+        slug = surname.lower().replace(' ', '')
+        yield (f'{surname} {rng.choice(SUPPLIER_KINDS)} {i}', contact, f'orders@{slug}{i}.co.za',
+               f'0{rng.randint(10, 87)}{rng.randint(1000000, 9999999)}',
+               f'{rng.randint(1, 400)} Main Road, {rng.choice(CITIES)}', created_at)
+
+
+def product_rows(rng, count, suppliers, created_at):
+    categories = list(CATEGORIES)
+    category_weights = [CATEGORIES[name][1] for name in categories]
+    for i in range(1, count + 1):
+        category = rng.choices(categories, category_weights)[0]
+        name = f'{rng.choice(BRANDS)} {rng.choice(CATEGORIES[category][0])} {rng.choice(SIZES)}'
+        cost = round(min(max(rng.lognormvariate(3.0, 0.8), 2.0), 4000.0), 2)
+        price = round(cost * rng.uniform(1.12, 1.6), 2)
+        min_stock = rng.randint(5, 20)
+        # About one product in twenty starts at or below its minimum
+        stock = rng.randint(0, min_stock) if rng.random() < 0.05 else rng.randint(min_stock + 1, 400)
+        yield (name, cost, price, stock, min_stock, category, ean13(600000000000 + i),
+               rng.randint(1, suppliers), created_at)
+
+
+def daily_counts(rng, total, days, start):
+    """Split total sales over the days with weekday swings and steady growth"""
+    weights = [WEEKDAY_WEIGHTS[(start + timedelta(days=d)).weekday()] * (0.8 + 0.4 * d / max(days - 1, 1))
+               * rng.uniform(0.9, 1.1) for d in range(days)]
+    scale = total / sum(weights)
+    counts = [int(w * scale) for w in weights]
+    for d in rng.sample(range(days), total - sum(counts)):
+        counts[d] += 1
+    return counts
+
+
+def sale_rows(rng, total, days, start, products, users, transactions):
+    """Yield sales rows day by day; baskets are appended to transactions
+
+    Popularity follows a Zipf-like curve so a few hundred products carry most
+    of the volume, as in a real store.
+    """
+    ranks = list(range(1, len(products) + 1))
+    rng.shuffle(ranks)
+    cum_weights = list(accumulate(1.0 / rank ** 1.1 for rank in ranks))
+    product_ids = range(1, len(products) + 1)
+    hours = list(HOUR_WEIGHTS)
+    hour_weights = list(HOUR_WEIGHTS.values())
+    transaction_id = 0
+
+    for offset, count in enumerate(daily_counts(rng, total, days, start)):
+        day = start + timedelta(days=offset)
+        baskets = []
+        remaining = count
+        while remaining > 0:
+            lines = min(rng.choices(*BASKET_LINES)[0], remaining, len(products))
+            seconds = rng.choices(hours, hour_weights)[0] * 3600 + rng.randrange(3600)
+            baskets.append((seconds, lines))
+            remaining -= lines
+        baskets.sort()
+
+        for seconds, lines in baskets:
+            # A basket holds each product once, like record_basket leaves it
+            chosen = set(rng.choices(product_ids, cum_weights=cum_weights, k=lines))
+            while len(chosen) < lines:
+                chosen.add(rng.choices(product_ids, cum_weights=cum_weights)[0])
+            sale_time = stamp(day, seconds)
+            transaction_id += 1
+            rows = []
+            for product_id in chosen:
+                price, cost = products[product_id - 1]
+                quantity = rng.choices(*LINE_QUANTITIES)[0]
+                rows.append((transaction_id, product_id, quantity, round(price * quantity, 2), sale_time, price, cost))
+            # The header goes first so it is written with the batch holding its lines
+            transactions.append((transaction_id, sale_time, rng.choice(users), lines,
+                                 sum(row[2] for row in rows), round(sum(row[3] for row in rows), 2)))
+            yield from rows
+
+
+def purchase_order_rows(rng, count, days, start, products, product_suppliers):
+    end = start + timedelta(days=days)
+    for _ in range(count):
+        product_id = rng.randint(1, len(products))
+        ordered = start + timedelta(seconds=rng.randrange(days * 86400))
+        order_date = ordered.strftime('%Y-%m-%d %H:%M:%S')
+        expected = (ordered + timedelta(days=7)).strftime('%Y-%m-%d')
+        quantity = rng.randint(2, 40) * 5
+        cost = products[product_id - 1][1]
+        received_date = None
+        if (end - ordered).days > 14:
+            status = 'cancelled' if rng.random() < 0.08 else 'received'
+        else:
+            status = rng.choices(['pending', 'received', 'cancelled'], [60, 35, 5])[0]
+        if status == 'received':
+            received_date = (ordered + timedelta(days=rng.randint(2, 9), hours=rng.randint(0, 8))).strftime(
+                '%Y-%m-%d %H:%M:%S')
+        yield (product_suppliers[product_id - 1], product_id, quantity, cost, round(quantity * cost, 2), status,
+               order_date, expected, received_date, '')
+
+
+# -----------------------------------------------------------------------------------------
+# MAIN
+# -----------------------------------------------------------------------------------------
+def generate(conn, args):
+    rng = random.Random(args.seed)
+    end = args.end_date
+    start = end - timedelta(days=args.days - 1)
+    created_at = stamp(start - timedelta(days=30), 8 * 3600)
+    started = time.perf_counter()
+
+    def step(message):
+        print(f"   {message} ({time.perf_counter() - started:.1f}s)")
+
+    c = conn.cursor()
+    c.execute("BEGIN")
+    statements = suspend_triggers_and_indexes(conn)
+
+    c.executemany("""
+        INSERT INTO suppliers (name, contact_person, email, phone, address, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, supplier_rows(rng, args.suppliers, created_at))
+    step(f'{args.suppliers} suppliers')
+
+    from werkzeug.security import generate_password_hash
+    password = generate_password_hash(CASHIER_PASSWORD)
+    c.executemany("INSERT OR IGNORE INTO users (username, password, role, created_at) VALUES (?, ?, 'user', ?)",
+                  [(f'cashier{i:02d}', password, created_at) for i in range(1, args.users + 1)])
+    users = [row[0] for row in c.execute("SELECT id FROM users WHERE username LIKE 'cashier%'")]
+
+    products = []
+    product_suppliers = []
+    for batch in batched(product_rows(rng, args.products, args.suppliers, created_at)):
+        c.executemany("""
+            INSERT INTO products (name, cost, price, stock, min_stock, category, barcode, supplier_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, batch)
+        products.extend((row[2], row[1]) for row in batch)
+        product_suppliers.extend(row[7] for row in batch)
+    step(f'{args.products} products')
+
+    c.executemany("INSERT INTO stock_alerts (product_id, alert_threshold, is_active) VALUES (?, ?, 1)",
+                  [(product_id, rng.randint(3, 25)) for product_id
+                   in rng.sample(range(1, args.products + 1), args.products // 50)])
+
+    transactions = []
+    loaded = 0
+    for batch in batched(sale_rows(rng, args.sales, args.days, start, products, users, transactions)):
+        c.executemany("""
+            INSERT INTO sales (transaction_id, product_id, quantity, total_amount, sale_time, unit_price, unit_cost)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, batch)
+        c.executemany("""
+            INSERT INTO sale_transactions (id, sale_time, user_id, line_count, quantity, total_amount)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, transactions)
+        transactions.clear()
+        loaded += len(batch)
+        if loaded % (BATCH_SIZE * 20) == 0:
+            step(f'{loaded} sales')
+    if loaded % (BATCH_SIZE * 20):
+        step(f'{loaded} sales')
+
+    c.executemany("""
+        INSERT INTO purchase_orders (supplier_id, product_id, quantity, cost_per_unit, total_cost, status,
+                                     order_date, expected_delivery, received_date, notes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, purchase_order_rows(rng, args.purchase_orders, args.days, start, products, product_suppliers))
+    step(f'{args.purchase_orders} purchase orders')
+
+    restore_triggers_and_indexes(conn, statements)
+    step('indexes, rollups and search index rebuilt')
+    c.execute("COMMIT")
+    c.execute("ANALYZE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default=os.environ.get('DATABASE', 'database.db'))
+    parser.add_argument('--force', action='store_true', help='replace the database file if it exists')
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--sales', type=int, default=10000000, help='sale lines (rows in sales)')
+    parser.add_argument('--suppliers', type=int, default=200)
+    parser.add_argument('--purchase-orders', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=10, help='cashier accounts sales are spread over')
+    parser.add_argument('--days', type=int, default=365, help='days of sales history')
+    parser.add_argument('--end-date', type=date.fromisoformat, default=datetime.now(SAST).date(),
+                        help='last day of sales (YYYY-MM-DD, default today in SAST)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        if not args.force:
+            parser.error(f'{args.database} already exists; pass --force to replace it')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.database + suffix):
+                os.remove(args.database + suffix)
+
+    conn = sqlite3.connect(args.database, isolation_level=None)
+    # Same bootstrap as init_database.py, so load.py can log in as the default admin
+    migrations.bootstrap(conn)
+    # Throwaway data: skip durability while loading, then hand over in WAL mode like the app uses
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -500000")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+    print(f"📦 Generating {args.database} (seed {args.seed}, {args.days} days to {args.end_date})...")
+    generate(conn, args)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+
+    size = os.path.getsize(args.database) / 1024 / 1024
+    username, password, _ = migrations.DEFAULT_ADMIN
+    print(f"   ✅ Done: {size:.0f} MB. Logins {username} / {password} and "
+          f"cashier01..cashier{args.users:02d} / {CASHIER_PASSWORD}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Group commit benchmark
+Drives the single writer queue with many concurrent sales, once with one
+transaction per sale and once with group commit, and prints sales/second.
+
+    python benchmarks/group_commit.py --threads 32 --sales 4000 --window-ms 5
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import migrations
+
+
+def insert_sale(conn, product_id):
+    conn.execute(
+        "INSERT INTO sales (product_id, quantity, total_amount, sale_time, unit_price, unit_cost) VALUES (?, 1, 10, ?, 10, 6)",
+        (product_id, time.strftime('%Y-%m-%d %H:%M:%S'))
+    )
+    conn.execute("UPDATE products SET stock = stock - 1 WHERE id = ? AND stock >= 1", (product_id,))
+
+
+def run(database, pragmas, threads, sales, window_ms, group_max):
+    writer = db.WriteQueue(database, pragmas=pragmas, group_window=window_ms / 1000, group_max=group_max)
+    per_thread = sales // threads
+
+    def till(product_id):
+        for _ in range(per_thread):
+            writer.run(insert_sale, product_id)
+
+    workers = [threading.Thread(target=till, args=(1 + i % 10,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    stats = writer.stats()
+    return per_thread * threads / elapsed, stats['committed'] / max(stats['batches'], 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--sales', type=int, default=4000)
+    parser.add_argument('--window-ms', type=float, default=5.0)
+    parser.add_argument('--group-max', type=int, default=db.DEFAULT_GROUP_COMMIT_MAX)
+    parser.add_argument('--dir', default='.',
+                        help='where to put the scratch database; use the disk the real one lives on')
+    parser.add_argument('--synchronous', default='FULL',
+                        help='FULL syncs on every commit, which is where group commit pays off')
+    args = parser.parse_args()
+
+    pragmas = db.build_pragmas({'DB_SYNCHRONOUS': args.synchronous})
+    print(f"{args.sales} sales from {args.threads} threads, synchronous={args.synchronous}")
+
+    for label, window in (('per-sale commit', 0), (f'group commit {args.window_ms:g} ms', args.window_ms)):
+        with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+            database = os.path.join(tmp, 'bench.db')
+            conn = sqlite3.connect(database)
+            migrations.migrate(conn)
+            conn.executemany(
+                "INSERT INTO products (name, cost, price, stock) VALUES (?, 6, 10, 1000000)",
+                [(f'Product {i}',) for i in range(10)]
+            )
+            conn.commit()
+            conn.close()
+
+            rate, batch = run(database, pragmas, args.threads, args.sales, window, args.group_max)
+            print(f"  {label:<24} {rate:>10.0f} sales/s   avg batch {batch:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Load test
+Drives the main flows (dashboard, new sale, sales history, sales chart and
+both exports) through the Flask test client, a local WSGI server (--serve)
+or a running instance (--url), and reports p50/p95/p99 latency and
+requests/second per scenario. Results can be kept as a JSON baseline and
+later runs compared against it.
+
+    python benchmarks/generate_data.py --database bench.db --force
+    python benchmarks/load.py --database bench.db --save benchmarks/baselines/local.json
+    python benchmarks/load.py --database bench.db --compare benchmarks/baselines/local.json
+"""
+
+import argparse
+import http.cookiejar
+import json
+import logging
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_TOLERANCE = 0.20     # allowed slowdown before a scenario counts as a regression
+MIN_DELTA_MS = 2.0           # ignore changes smaller than this, they are timer noise
+SALE_MIN_STOCK = 20          # only sell products that will not run out during the run
+
+
+# -----------------------------------------------------------------------------------------
+# CLIENTS
+# -----------------------------------------------------------------------------------------
+class TestClientSession:
+    """In-process requests through Flask's test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        size = len(response.get_data())   # drains streamed exports
+        response.close()
+        return response.status_code, size
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """Real HTTP requests against a server, keeping the session cookie"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as e:
+            # Redirects land here too because they are not followed
+            return e.code, len(e.read())
+
+
+def login(session, username, password):
+    status, _ = session.request('POST', '/login', {'username': username, 'password': password})
+    if status != 302:
+        raise SystemExit(f'Login as {username} failed (HTTP {status})')
+    return session
+
+
+# -----------------------------------------------------------------------------------------
+# SCENARIOS
+# -----------------------------------------------------------------------------------------
+def build_scenarios(database, export_days):
+    """(name, method, request builder, default request count) for each flow"""
+    conn = sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+    product_ids = [row[0] for row in conn.execute("SELECT id FROM products WHERE stock >= ?", (SALE_MIN_STOCK,))]
+    last_sale = conn.execute("SELECT MAX(sale_time) FROM sales").fetchone()[0]
+    conn.close()
+    if not product_ids:
+        raise SystemExit(f'{database} has no products to sell; run benchmarks/generate_data.py first')
+
+    end = date.fromisoformat(last_sale[:10]) if last_sale else date.today()
+    export_range = f'start={(end - timedelta(days=export_days - 1)).isoformat()}&end={end.isoformat()}'
+
+    def sale(rng):
+        return {'product_id': str(rng.choice(product_ids)), 'quantity': '1'}
+
+    return [
+        ('dashboard', 'GET', lambda rng: ('/', None), None),
+        ('add_sale', 'POST', lambda rng: ('/add_sale', sale(rng)), None),
+        ('sales_history', 'GET', lambda rng: ('/sales_history', None), None),
+        ('sales_chart', 'GET', lambda rng: ('/api/sales_chart', None), None),
+        # A full sales export is a batch job; the request-sized case is a recent window
+        (f'export_sales_{export_days}d', 'GET', lambda rng: (f'/export_sales?{export_range}', None), 20),
+        ('export_inventory', 'GET', lambda rng: ('/export', None), 20),
+    ]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def run_scenario(sessions, method, build, requests, warmup, seed):
+    """Spread requests over one thread per session; returns the scenario's figures"""
+    latencies = []
+    errors = []
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker(session, rng):
+        for _ in range(warmup):
+            session.request(method, *build(rng))
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            path, data = build(rng)
+            started = time.perf_counter()
+            try:
+                status, _ = session.request(method, path, data)
+            except Exception as e:
+                status = repr(e)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed * 1000)
+                if not isinstance(status, int) or status >= 400:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=worker, args=(session, random.Random(seed + i)))
+               for i, session in enumerate(sessions)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        'rps': round(len(latencies) / wall, 1) if wall else 0.0,
+    }
+
+
+# -----------------------------------------------------------------------------------------
+# BASELINES
+# -----------------------------------------------------------------------------------------
+def describe_run(database, target, concurrency):
+    conn = sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ('products', 'sales', 'purchase_orders')}
+    conn.close()
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'target': target,
+        'concurrency': concurrency,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.platform(),
+        'rows': counts,
+    }
+
+
+def compare(results, meta, baseline, tolerance):
+    """Print the change against a baseline; returns the names that regressed"""
+    regressions = []
+    print(f"\nAgainst baseline from {baseline['meta']['created']} (commit {baseline['meta'].get('commit')}):")
+    for key in ('target', 'concurrency'):
+        if key in meta and baseline['meta'].get(key) != meta[key]:
+            print(f"  ⚠️  baseline {key} was {baseline['meta'].get(key)}, this run has {meta[key]}")
+    for name, current in results.items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            print(f"  {name:<22} (not in baseline)")
+            continue
+        change = (current['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+        slower = change > tolerance and current['p95_ms'] - before['p95_ms'] > MIN_DELTA_MS
+        dropped = current['rps'] < before['rps'] / (1 + tolerance)
+        if slower or dropped or current['errors'] > before['errors']:
+            regressions.append(name)
+        flag = 'REGRESSION' if name in regressions else 'ok'
+        print(f"  {name:<22} p95 {before['p95_ms']:>9.2f} -> {current['p95_ms']:>9.2f} ms ({change:+.0%})   "
+              f"req/s {before['rps']:>8.1f} -> {current['rps']:>8.1f}   {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default=os.environ.get('DATABASE', 'database.db'),
+                        help='database the app uses (add_sale writes to it)')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--serve', action='store_true', help='run the app on a local threaded WSGI server')
+    target.add_argument('--url', help='benchmark an already running server sharing --database')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario (exports default to 20)')
+    parser.add_argument('--warmup', type=int, default=3, help='unrecorded requests per client per scenario')
+    parser.add_argument('--scenario', action='append', help='only run these scenarios (repeatable)')
+    parser.add_argument('--export-days', type=int, default=7, help='days of sales in the export scenario')
+    parser.add_argument('--username', default='Mabutsi')
+    parser.add_argument('--password', default='Mabutsi@12')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save', metavar='FILE', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare against a JSON baseline; exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed p95 slowdown / throughput drop as a fraction (default 0.2)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        parser.error(f'{args.database} does not exist; run benchmarks/generate_data.py first')
+    # Request logs and stock alert warnings would drown the report
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('inventory.alerts').setLevel(logging.ERROR)
+
+    server = None
+    if args.url:
+        target_name = args.url
+        new_session = lambda: HttpSession(args.url)
+    else:
+        os.environ['DATABASE'] = os.path.abspath(args.database)
+        from app import create_app
+        app = create_app('production')
+        if args.serve:
+            from werkzeug.serving import make_server
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            target_name = f'http://127.0.0.1:{server.server_port}'
+            new_session = lambda: HttpSession(target_name)
+        else:
+            target_name = 'test-client'
+            new_session = lambda: TestClientSession(app)
+
+    sessions = [login(new_session(), args.username, args.password) for _ in range(args.concurrency)]
+    scenarios = build_scenarios(args.database, args.export_days)
+    if args.scenario:
+        unknown = set(args.scenario) - {name for name, *_ in scenarios}
+        if unknown:
+            parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+        scenarios = [scenario for scenario in scenarios if scenario[0] in args.scenario]
+
+    meta = describe_run(args.database, target_name, args.concurrency)
+    print(f"{target_name}, {args.concurrency} client(s), "
+          f"{meta['rows']['products']} products / {meta['rows']['sales']} sales, commit {meta['commit']}")
+    print(f"  {'scenario':<22} {'reqs':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+
+    results = {}
+    for name, method, build, default_requests in scenarios:
+        requests = min(args.requests, default_requests) if default_requests else args.requests
+        result = run_scenario(sessions, method, build, requests, args.warmup, args.seed)
+        results[name] = result
+        print(f"  {name:<22} {result['requests']:>6} {result['errors']:>4} {result['p50_ms']:>9.2f} "
+              f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['rps']:>8.1f}")
+
+    if server is not None:
+        server.shutdown()
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta, 'scenarios': results}, f, indent=2)
+        print(f"\nBaseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, meta, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} scenario(s) regressed: {', '.join(regressions)}")
+            return 1
+        print("\n✅ No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
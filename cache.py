@@ -0,0 +1,129 @@
+"""
+In-process caches
+Each worker keeps its own copy and checks it against the cache_versions
+counters, so a change made by any process invalidates every worker's copy
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_REFERENCE_TTL = 300.0     # seconds
+DEFAULT_REFERENCE_SIZE = 128      # entries
+
+
+def data_version(conn, name):
+    """Current change counter for a cached table ('products', 'suppliers')"""
+    row = conn.execute("SELECT version FROM cache_versions WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def data_versions(conn):
+    """All change counters in one read: {'products': n, 'suppliers': n, 'sales': n}"""
+    return dict(conn.execute("SELECT name, version FROM cache_versions").fetchall())
+
+
+def last_changes(conn):
+    """{name: (version, unix time of the last change)} for every counter"""
+    return {row[0]: (row[1], row[2] or 0)
+            for row in conn.execute("SELECT name, version, updated_at FROM cache_versions")}
+
+
+class BarcodeIndex:
+    """barcode -> (id, name, price, category) dictionary for till scanners
+
+    Rebuilt only when the products version moves; stock is never cached
+    because it changes with every sale.
+    """
+
+    def __init__(self):
+        self._products = {}
+        self._version = None
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+
+    def invalidate(self):
+        self._version = None
+
+    def _rebuild(self, conn, version):
+        rows = conn.execute("""
+            SELECT barcode, id, name, price, category
+            FROM products
+            WHERE barcode IS NOT NULL AND barcode != ''
+        """).fetchall()
+        self._products = {row[0]: row[1:] for row in rows}
+        self._version = version
+        self.rebuilds += 1
+
+    def lookup(self, conn, barcode):
+        version = data_version(conn, 'products')
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._rebuild(conn, version)
+        return self._products.get(barcode)
+
+
+class ReferenceCache:
+    """Small query results (dropdowns, category lists) shared by all requests
+
+    Each entry remembers the versions of the tables it was loaded from and is
+    reloaded once any of them moves, expires after ttl seconds, and the least
+    recently used entry is dropped beyond max_entries. Write routes also call
+    invalidate(), which covers tables that have no cache_versions counter.
+    """
+
+    def __init__(self, ttl=DEFAULT_REFERENCE_TTL, max_entries=DEFAULT_REFERENCE_SIZE):
+        self.ttl = float(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()   # key -> (tables, versions, expires, value)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'stale': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, conn, key, tables, loader, versions=None):
+        """Cached loader(conn), valid while the given tables are unchanged
+
+        Pass versions (as from data_versions) when the caller has already read them.
+        """
+        if versions is None:
+            versions = data_versions(conn)
+        current = tuple(versions.get(table, 0) for table in tables)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] != current:
+                    self._stats['stale'] += 1
+                elif entry[2] <= now:
+                    self._stats['expired'] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[3]
+            self._stats['misses'] += 1
+
+        value = loader(conn)
+        with self._lock:
+            self._entries[key] = (tuple(tables), current, now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return value
+
+    def invalidate(self, *tables):
+        """Drop entries loaded from any of the tables (all entries if none given)"""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if not tables or set(tables) & set(entry[0]):
+                    del self._entries[key]
+                    self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
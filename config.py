@@ -0,0 +1,159 @@
+"""
+Configuration
+Config objects for create_app(). Every value can be overridden from the
+environment; APP_CONFIG picks the object (development, production, testing).
+"""
+
+import multiprocessing
+import os
+import secrets
+
+import alerts
+import cache
+import db
+import events
+import profiling
+
+
+def _flag(name, default):
+    return os.environ.get(name, default) != '0'
+
+
+# Threads per WSGI worker kept for ordinary requests, whatever the streams take
+REQUEST_THREADS = 8
+
+
+def web_workers():
+    """Worker processes gunicorn.conf.py starts (WEB_CONCURRENCY, default one per core plus one)"""
+    return int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+
+
+def worker_threads(target_streams):
+    """Threads per worker (GUNICORN_THREADS): its share of target_streams plus REQUEST_THREADS"""
+    return int(os.environ.get('GUNICORN_THREADS', -(-target_streams // web_workers()) + REQUEST_THREADS))
+
+
+class Config:
+    DATABASE = os.environ.get('DATABASE', 'database.db')
+    DB_AUTO_MIGRATE = _flag('DB_AUTO_MIGRATE', '1')   # migrate an old database at startup
+
+    # Signs the session cookie, so every worker (and every host behind a load
+    # balancer) needs the same one. Unset: read from SECRET_KEY_FILE, default
+    # instance/secret_key, which is created on first start.
+    SECRET_KEY = os.environ.get('SECRET_KEY') or None
+    SECRET_KEY_FILE = os.environ.get('SECRET_KEY_FILE') or None
+    SESSION_COOKIE_HTTPONLY = True
+    SESSION_COOKIE_SAMESITE = 'Lax'
+    SESSION_COOKIE_SECURE = _flag('SESSION_COOKIE_SECURE', '0')
+
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', db.DEFAULT_POOL_SIZE))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', db.DEFAULT_POOL_TIMEOUT))
+    DB_WRITE_QUEUE = _flag('DB_WRITE_QUEUE', '1')
+    DB_GROUP_COMMIT_MS = float(os.environ.get('DB_GROUP_COMMIT_MS', db.DEFAULT_GROUP_COMMIT_MS))
+    DB_GROUP_COMMIT_MAX = int(os.environ.get('DB_GROUP_COMMIT_MAX', db.DEFAULT_GROUP_COMMIT_MAX))
+    DB_JOURNAL_MODE = os.environ.get('DB_JOURNAL_MODE', db.DEFAULT_JOURNAL_MODE)
+    DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', db.DEFAULT_SYNCHRONOUS)
+    DB_CACHE_SIZE = int(os.environ.get('DB_CACHE_SIZE', db.DEFAULT_CACHE_SIZE))
+    DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', db.DEFAULT_MMAP_SIZE))
+    DB_BUSY_TIMEOUT = int(os.environ.get('DB_BUSY_TIMEOUT', db.DEFAULT_BUSY_TIMEOUT))
+
+    REFERENCE_CACHE_TTL = float(os.environ.get('REFERENCE_CACHE_TTL', cache.DEFAULT_REFERENCE_TTL))
+    REFERENCE_CACHE_SIZE = int(os.environ.get('REFERENCE_CACHE_SIZE', cache.DEFAULT_REFERENCE_SIZE))
+
+    ALERT_NOTIFIER = os.environ.get('ALERT_NOTIFIER', 'log')
+    ALERT_LOG_PATH = os.environ.get('ALERT_LOG_PATH', 'alerts.log')
+    ALERT_DEBOUNCE_SECONDS = int(os.environ.get('ALERT_DEBOUNCE_SECONDS', alerts.DEFAULT_DEBOUNCE_SECONDS))
+
+    EVENT_MAX_STREAMS = int(os.environ.get('EVENT_MAX_STREAMS', events.DEFAULT_MAX_SUBSCRIBERS))
+    EVENT_HEARTBEAT_SECONDS = float(os.environ.get('EVENT_HEARTBEAT_SECONDS', events.DEFAULT_HEARTBEAT_SECONDS))
+    EVENT_POLL_SECONDS = float(os.environ.get('EVENT_POLL_SECONDS', events.DEFAULT_POLL_SECONDS))
+    # Open dashboards a deployment is sized for; the stream limits below follow it
+    EVENT_TARGET_STREAMS = int(os.environ.get('EVENT_TARGET_STREAMS', 1000))
+    # stream_server.py: /api/stream from one event loop, no thread per open screen
+    STREAM_BIND = os.environ.get('STREAM_BIND', '0.0.0.0:8001')
+    STREAM_MAX_STREAMS = int(os.environ.get('STREAM_MAX_STREAMS', EVENT_TARGET_STREAMS))
+
+    SQL_METRICS = _flag('SQL_METRICS', '1')
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 0))          # 0 = no slow query log
+    QUERY_COUNT_HEADER = _flag('QUERY_COUNT_HEADER', '0')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', profiling.DEFAULT_PROFILE_DIR)
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', profiling.DEFAULT_KEEP))
+    PROFILE_TOP = int(os.environ.get('PROFILE_TOP', profiling.DEFAULT_TOP))
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))  # 0 = on demand only
+
+
+class DevelopmentConfig(Config):
+    """python app.py: debugger on, database created and migrated on start"""
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    """WSGI servers (wsgi.py): several workers share one database and secret
+
+    Migrations are run once with init_database.py before the workers start,
+    so an out-of-date database stops startup instead of being migrated by
+    every worker at once.
+    """
+    DEBUG = False
+    DB_AUTO_MIGRATE = _flag('DB_AUTO_MIGRATE', '0')
+    # A stream answered by a WSGI worker holds one of its threads, so this cap
+    # limits how many dashboards the workers can serve; it adds no capacity.
+    # Sized against 8 threads it allowed 4 streams a worker (36 on 8 cores),
+    # which conflicts with the hundreds of screens /api/stream is meant for.
+    # The default is therefore each worker's share of EVENT_TARGET_STREAMS,
+    # and gunicorn.conf.py gives every worker that many threads plus
+    # REQUEST_THREADS. stream_server.py serves the target without the threads.
+    EVENT_MAX_STREAMS = int(os.environ.get('EVENT_MAX_STREAMS', max(
+        1, worker_threads(Config.EVENT_TARGET_STREAMS) - REQUEST_THREADS)))
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SECRET_KEY = os.environ.get('SECRET_KEY') or 'testing'
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+
+def get_config(name=None):
+    """Config object by name; APP_CONFIG, else development, when not given"""
+    name = name or os.environ.get('APP_CONFIG', 'development')
+    if name not in CONFIGS:
+        raise ValueError(f'Unknown APP_CONFIG: {name}')
+    return CONFIGS[name]
+
+
+def load_secret_key(path):
+    """Read the secret key at path, creating it on first use
+
+    The key is written to a temporary file and hard-linked into place, so
+    workers starting together all end up reading the one that won.
+    """
+    try:
+        with open(path, encoding='ascii') as f:
+            key = f.read().strip()
+    except FileNotFoundError:
+        key = None
+    if key is None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='ascii') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(temporary, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary)
+        with open(path, encoding='ascii') as f:
+            key = f.read().strip()
+    if not key:
+        raise RuntimeError(f'Secret key file {path} is empty; delete it or set SECRET_KEY')
+    return key
@@ -0,0 +1,372 @@
+"""
+Database connection layer
+Keeps a pool of warm SQLite connections and hands one out per request
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app, g
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_POOL_TIMEOUT = 30.0
+
+# Tuning knobs, each overridable through app.config
+DEFAULT_JOURNAL_MODE = 'WAL'
+DEFAULT_SYNCHRONOUS = 'NORMAL'
+DEFAULT_CACHE_SIZE = -20000          # negative = KiB, so ~20 MB of page cache per connection
+DEFAULT_MMAP_SIZE = 134217728        # 128 MB
+DEFAULT_BUSY_TIMEOUT = 5000          # ms
+DEFAULT_GROUP_COMMIT_MS = 0          # 0 = one transaction per write
+DEFAULT_GROUP_COMMIT_MAX = 64
+
+# Applied once when a connection is opened, never per request
+DEFAULT_PRAGMAS = {
+    'journal_mode': DEFAULT_JOURNAL_MODE,
+    'synchronous': DEFAULT_SYNCHRONOUS,
+    'cache_size': DEFAULT_CACHE_SIZE,
+    'mmap_size': DEFAULT_MMAP_SIZE,
+    'busy_timeout': DEFAULT_BUSY_TIMEOUT,
+    'temp_store': 'MEMORY',
+}
+
+
+def connect(database, pragmas=None, timeout=DEFAULT_POOL_TIMEOUT, **kwargs):
+    """Open a connection and apply pragmas to it"""
+    conn = sqlite3.connect(database, timeout=timeout, check_same_thread=False, **kwargs)
+    for name, value in (DEFAULT_PRAGMAS if pragmas is None else pragmas).items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection became free in time"""
+
+
+class ConnectionPool:
+    """Bounded pool of reusable SQLite connections"""
+
+    def __init__(self, database, max_size=DEFAULT_POOL_SIZE, pragmas=None, timeout=DEFAULT_POOL_TIMEOUT,
+                 factory=sqlite3.Connection):
+        self.database = database
+        self.factory = factory
+        self.max_size = max(1, int(max_size))
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.timeout = timeout
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'released': 0,
+            'discarded': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    def _connect(self):
+        return connect(self.database, self.pragmas, self.timeout, factory=self.factory)
+
+    def acquire(self):
+        """Take an idle connection, opening a new one while under max_size"""
+        with self._cond:
+            if self._closed:
+                raise sqlite3.ProgrammingError('Connection pool is closed')
+            while not self._idle and self._size >= self.max_size:
+                self._stats['waits'] += 1
+                if not self._cond.wait(self.timeout):
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection free after {self.timeout}s')
+            if self._idle:
+                # LIFO so the most recently used (warmest) connection goes out first
+                self._stats['reused'] += 1
+                return self._idle.pop()
+            self._size += 1
+
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['created'] += 1
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back anything left open"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                conn.close()
+                return
+            self._stats['released'] += 1
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats['discarded'] += 1
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection and refuse new checkouts"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().close()
+                self._size -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        """Snapshot of pool usage counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['max_size'] = self.max_size
+        checkouts = stats['created'] + stats['reused']
+        stats['reuse_ratio'] = round(stats['reused'] / checkouts, 4) if checkouts else 0.0
+        return stats
+
+
+# -----------------------------------------------------------------------------------------
+# SINGLE WRITER QUEUE
+# -----------------------------------------------------------------------------------------
+class WriteQueue:
+    """Funnels write transactions through one thread and one connection
+
+    Requests submit a function taking a connection; the writer runs it inside
+    BEGIN IMMEDIATE ... COMMIT and hands back its return value (or exception).
+    With WAL, readers on pooled connections never wait for these writes.
+
+    With group_window > 0 (group commit) the writer keeps collecting jobs for
+    that many seconds, up to group_max, and runs them all in one transaction,
+    each under its own SAVEPOINT so a failing job only undoes itself. Every
+    job is acknowledged after the shared COMMIT, so one sync covers the batch.
+    """
+
+    def __init__(self, database, pragmas=None, timeout=DEFAULT_POOL_TIMEOUT,
+                 group_window=0.0, group_max=DEFAULT_GROUP_COMMIT_MAX, factory=sqlite3.Connection):
+        self.database = database
+        self.factory = factory
+        self.pragmas = pragmas
+        self.timeout = timeout
+        self.group_window = group_window
+        self.group_max = max(1, int(group_max))
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'committed': 0, 'failed': 0, 'batches': 0, 'largest_batch': 0}
+
+    def _ensure_started(self):
+        # Started lazily so a preloaded app can fork before any thread exists
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(conn, *args, **kwargs) and return a Future for its result"""
+        self._ensure_started()
+        future = Future()
+        with self._lock:
+            self._stats['submitted'] += 1
+        self._jobs.put((future, fn, args, kwargs))
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Queue a write and block until it has committed"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def _next_batch(self):
+        batch = [self._jobs.get()]
+        if self.group_window > 0:
+            deadline = time.monotonic() + self.group_window
+            while len(batch) < self.group_max:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._jobs.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return [job for job in batch if job[0].set_running_or_notify_cancel()]
+
+    def _run(self):
+        conn = connect(self.database, self.pragmas, self.timeout, isolation_level=None, factory=self.factory)
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            if self.group_window > 0:
+                outcomes = self._run_group(conn, batch)
+            else:
+                outcomes = [self._run_single(conn, *batch[0][1:])]
+
+            with self._lock:
+                self._stats['batches'] += 1
+                self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+                for ok, _ in outcomes:
+                    self._stats['committed' if ok else 'failed'] += 1
+            for (future, _, _, _), (ok, value) in zip(batch, outcomes):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _run_single(self, conn, fn, args, kwargs):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            result = fn(conn, *args, **kwargs)
+            conn.execute("COMMIT")
+        except BaseException as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return False, e
+        return True, result
+
+    def _run_group(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for _, fn, args, kwargs in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    result = fn(conn, *args, **kwargs)
+                except BaseException as e:
+                    conn.execute("ROLLBACK TO job")
+                    outcomes.append((False, e))
+                else:
+                    outcomes.append((True, result))
+                conn.execute("RELEASE job")
+            conn.execute("COMMIT")
+        except BaseException as e:
+            # The shared transaction failed, so nothing in the batch was kept
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return [(False, e)] * len(batch)
+        return outcomes
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._jobs.qsize()
+        return stats
+
+
+# -----------------------------------------------------------------------------------------
+# FLASK INTEGRATION
+# -----------------------------------------------------------------------------------------
+def build_pragmas(config):
+    """Pragmas for every connection, taken from DB_* config values"""
+    pragmas = dict(DEFAULT_PRAGMAS)
+    pragmas.update({
+        'journal_mode': config.get('DB_JOURNAL_MODE', DEFAULT_JOURNAL_MODE),
+        'synchronous': config.get('DB_SYNCHRONOUS', DEFAULT_SYNCHRONOUS),
+        'cache_size': int(config.get('DB_CACHE_SIZE', DEFAULT_CACHE_SIZE)),
+        'mmap_size': int(config.get('DB_MMAP_SIZE', DEFAULT_MMAP_SIZE)),
+        'busy_timeout': int(config.get('DB_BUSY_TIMEOUT', DEFAULT_BUSY_TIMEOUT)),
+    })
+    pragmas.update(config.get('DB_PRAGMAS') or {})
+    return pragmas
+
+
+def init_app(app, factory=sqlite3.Connection):
+    """Create the pool and writer for this app and return connections at teardown
+
+    factory is the sqlite3.Connection class used for every connection, which
+    is how metrics.py instruments queries.
+    """
+    app.config.setdefault('DB_POOL_SIZE', DEFAULT_POOL_SIZE)
+    app.config.setdefault('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT)
+    app.config.setdefault('DB_WRITE_QUEUE', True)
+    app.config.setdefault('DB_GROUP_COMMIT_MS', DEFAULT_GROUP_COMMIT_MS)
+    app.config.setdefault('DB_GROUP_COMMIT_MAX', DEFAULT_GROUP_COMMIT_MAX)
+
+    pragmas = build_pragmas(app.config)
+    app.extensions['db_pool'] = ConnectionPool(
+        app.config['DATABASE'],
+        max_size=app.config['DB_POOL_SIZE'],
+        pragmas=pragmas,
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        factory=factory,
+    )
+    app.extensions['db_writer'] = WriteQueue(
+        app.config['DATABASE'],
+        pragmas=pragmas,
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        group_window=float(app.config['DB_GROUP_COMMIT_MS']) / 1000,
+        group_max=app.config['DB_GROUP_COMMIT_MAX'],
+        factory=factory,
+    )
+    app.teardown_appcontext(close_db)
+
+
+def get_pool():
+    return current_app.extensions['db_pool']
+
+
+def get_writer():
+    return current_app.extensions['db_writer']
+
+
+def run_write(fn, *args, **kwargs):
+    """Run fn(conn, ...) as one write transaction
+
+    Goes through the single writer queue when DB_WRITE_QUEUE is on, otherwise
+    runs inline on the request connection under BEGIN IMMEDIATE.
+    """
+    if current_app.config['DB_WRITE_QUEUE']:
+        return get_writer().run(_in_app_context, current_app._get_current_object(), fn, *args, **kwargs)
+
+    conn = get_db()
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = fn(conn, *args, **kwargs)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return result
+
+
+def _in_app_context(conn, app, fn, *args, **kwargs):
+    # The writer thread has no app context of its own, so jobs that read
+    # current_app.config run inside the submitting app's
+    with app.app_context():
+        return fn(conn, *args, **kwargs)
+
+
+def get_db():
+    """Connection bound to the current app context, checked out on first use"""
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+
+def close_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
@@ -0,0 +1,214 @@
+"""
+Live events
+Publish/subscribe behind /api/stream. Writes append small deltas to the
+live_events table inside their own transaction; every process runs a tail
+thread that reads new rows and copies each pre-encoded Server-Sent Events
+frame into every open screen's bounded queue, so a stream sees the writes of
+every worker, and one slow client is disconnected instead of slowing down
+the tail or the other screens.
+"""
+
+import json
+import logging
+import queue
+import threading
+
+import db
+
+DEFAULT_QUEUE_SIZE = 256           # frames buffered per client before it is dropped
+DEFAULT_HISTORY_SIZE = 10000       # log rows kept for Last-Event-ID resume
+DEFAULT_MAX_SUBSCRIBERS = 500
+DEFAULT_HEARTBEAT_SECONDS = 15.0   # keeps proxies from closing idle streams
+DEFAULT_POLL_SECONDS = 0.25        # how soon another worker's write reaches this one's streams
+PRUNE_EVERY = 1000                 # events between trims of the log
+TAIL_BATCH = 500
+RETRY_MS = 3000
+
+logger = logging.getLogger('inventory.events')
+
+
+class TooManySubscribers(RuntimeError):
+    """Raised when the broker already serves max_subscribers streams"""
+
+
+def _frame(event_id, event_type, payload):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n".encode()
+
+
+def encode(event_id, event_type, data):
+    """One SSE frame; JSON is encoded once per event, not once per client"""
+    return _frame(event_id, event_type, json.dumps(data, separators=(',', ':')))
+
+
+def record(conn, event_type, data, keep=DEFAULT_HISTORY_SIZE):
+    """Write transaction step: append one event to live_events; returns its id
+
+    The event commits or rolls back with the change it describes. Every
+    PRUNE_EVERY events the rows older than the newest keep are deleted.
+    """
+    event_id = conn.execute("INSERT INTO live_events (event_type, data) VALUES (?, ?)",
+                            (event_type, json.dumps(data, separators=(',', ':')))).lastrowid
+    if event_id % PRUNE_EVERY == 0:
+        conn.execute("DELETE FROM live_events WHERE id <= ?", (event_id - keep,))
+    return event_id
+
+
+class Subscription:
+    """One open stream: replayed frames first, then live frames from the queue"""
+
+    def __init__(self, frames, backlog, after):
+        self.queue = frames
+        self.backlog = backlog
+        self.after = after        # frames up to this id were replayed or predate the stream
+        self.overflowed = False
+
+
+class EventBroker:
+    """Fan events from the live_events log out to every subscribed stream
+
+    The tail thread polls every poll_seconds; wake() after a local write
+    delivers it without waiting for the next poll. queue_factory(size) makes
+    each subscription's queue; anything with queue.Queue's put_nowait (and
+    its queue.Full) will do, such as stream_server's event loop queues.
+    """
+
+    def __init__(self, database, pragmas=None, queue_size=DEFAULT_QUEUE_SIZE,
+                 max_subscribers=DEFAULT_MAX_SUBSCRIBERS, poll_seconds=DEFAULT_POLL_SECONDS,
+                 queue_factory=queue.Queue):
+        self.database = database
+        self.pragmas = pragmas
+        self.queue_size = queue_size
+        self.queue_factory = queue_factory
+        self.max_subscribers = max_subscribers
+        self.poll_seconds = poll_seconds
+        self._subscribers = set()
+        self._last_id = None      # newest log id handed to subscribers; read on first subscribe
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stats = {
+            'published': 0,       # events read from the log, whichever process wrote them
+            'delivered': 0,
+            'dropped': 0,
+            'resumed': 0,
+            'resets': 0,
+        }
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _start(self, conn):
+        # Called with the lock held. Started lazily, like the write queue, so a
+        # preloaded app can fork first; the tail begins at the log's current end
+        if self._last_id is None:
+            self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM live_events").fetchone()[0]
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._tail, name='event-tail', daemon=True)
+            self._thread.start()
+
+    def _tail(self):
+        conn = db.connect(self.database, self.pragmas)
+        while True:
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+            try:
+                while True:
+                    rows = conn.execute("""
+                        SELECT id, event_type, data FROM live_events WHERE id > ? ORDER BY id LIMIT ?
+                    """, (self._last_id, TAIL_BATCH)).fetchall()
+                    if rows:
+                        self._fanout([(row[0], _frame(*row)) for row in rows])
+                    if len(rows) < TAIL_BATCH:
+                        break
+            except Exception:
+                logger.exception('Reading the live event log failed')
+
+    def _fanout(self, frames):
+        with self._lock:
+            self._last_id = frames[-1][0]
+            subscribers = list(self._subscribers)
+            self._stats['published'] += len(frames)
+
+        delivered = 0
+        dropped = []
+        for subscription in subscribers:
+            for event_id, frame in frames:
+                if event_id <= subscription.after:
+                    continue
+                try:
+                    subscription.queue.put_nowait(frame)
+                    delivered += 1
+                except queue.Full:
+                    # The client reconnects with Last-Event-ID and catches up from the log
+                    subscription.overflowed = True
+                    dropped.append(subscription)
+                    break
+
+        with self._lock:
+            self._stats['delivered'] += delivered
+            for subscription in dropped:
+                if subscription in self._subscribers:
+                    self._subscribers.discard(subscription)
+                    self._stats['dropped'] += 1
+
+    def subscribe(self, conn, last_event_id=None):
+        """Register a stream, replaying anything it missed since last_event_id
+
+        Missed events are read back from the log, so a client can resume on
+        any worker. If they have already been pruned the stream starts with a
+        'reset' event so the page reloads its state instead.
+        """
+        # Streams start at the log's end even if this worker's tail is behind
+        # it; anything up to there is replayed from the log instead
+        newest = conn.execute("SELECT COALESCE(MAX(id), 0) FROM live_events").fetchone()[0]
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(f'{self.max_subscribers} streams are already open')
+            self._start(conn)
+            after = max(newest, self._last_id)
+            subscription = Subscription(self.queue_factory(self.queue_size), [], after)
+            self._subscribers.add(subscription)
+
+        if last_event_id is not None:
+            oldest = conn.execute("SELECT MIN(id) FROM live_events").fetchone()[0] or after + 1
+            # An id from a different database is ahead of the log
+            if oldest - 1 <= last_event_id <= after:
+                rows = conn.execute("""
+                    SELECT id, event_type, data FROM live_events WHERE id > ? AND id <= ? ORDER BY id
+                """, (last_event_id, after)).fetchall()
+                subscription.backlog = [_frame(*row) for row in rows]
+                stat = 'resumed'
+            else:
+                subscription.backlog = [encode(after, 'reset', {'reason': 'missed events'})]
+                stat = 'resets'
+            with self._lock:
+                self._stats[stat] += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stream(self, subscription, heartbeat=DEFAULT_HEARTBEAT_SECONDS):
+        """Generator of SSE frames for one subscription; unsubscribes when closed"""
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            yield from subscription.backlog
+            subscription.backlog = None
+            while True:
+                try:
+                    # Once dropped, flush what is queued and end the stream
+                    yield subscription.queue.get(timeout=0 if subscription.overflowed else heartbeat)
+                except queue.Empty:
+                    if subscription.overflowed:
+                        return
+                    yield b": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['subscribers'] = len(self._subscribers)
+            stats['last_event_id'] = self._last_id or 0
+        return stats
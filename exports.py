@@ -0,0 +1,220 @@
+"""
+Streaming exports
+Rows are read from the database cursor in chunks and sent as they are encoded,
+so an export never holds the whole table in memory or touches the disk
+"""
+
+import array
+import csv
+import io
+import json
+import struct
+import sys
+import zlib
+
+from flask import Response, stream_with_context
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # optional, the built-in columnar format is used instead
+    pyarrow = None
+
+EXPORT_CHUNK_ROWS = 1000
+
+# Column types understood by the columnar writers
+INT, FLOAT, STR = 'int', 'float', 'str'
+
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_csv(header, cursor):
+    """Yield UTF-8 CSV bytes: the header first, then one chunk per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def drain():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(header)
+    yield drain()
+
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+        if not rows:
+            break
+        writer.writerows(rows)
+        yield drain()
+
+
+def download(chunks, filename, mimetype, compress=False):
+    """Chunked attachment response; with compress the body is gzipped on the fly"""
+    if compress:
+        chunks = _gzip_stream(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+def csv_response(filename, header, cursor, compress=False):
+    return download(stream_csv(header, cursor), filename, 'text/csv', compress)
+
+
+def stream_ndjson(columns, cursor):
+    """Yield newline-delimited JSON, one object per row, in row batches"""
+    names = [name for name, _ in columns]
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+        if not rows:
+            break
+        yield ''.join(json.dumps(dict(zip(names, row)), separators=(',', ':')) + '\n'
+                      for row in rows).encode('utf-8')
+
+
+# -----------------------------------------------------------------------------------------
+# COLUMNAR FORMAT
+# -----------------------------------------------------------------------------------------
+# Arrow IPC stream when pyarrow is installed, otherwise "IVCOL1":
+#   b'IVCOL1' | uint32 header length | JSON header {"columns": [[name, type], ...]}
+#   then per batch: b'B' | uint32 row count | per column: null flags (1 byte/row)
+#       int   -> int64 values      float -> float64 values
+#       str   -> uint32 byte lengths followed by the concatenated UTF-8
+#   and finally b'E'. All numbers are little-endian; nulls hold 0 / ''.
+COLUMNAR_MAGIC = b'IVCOL1'
+_ARRAY_CODES = {INT: 'q', FLOAT: 'd'}
+
+
+def _numbers(kind, values):
+    """Column values as int/float, with None for anything that does not convert
+
+    SQLite columns are loosely typed, so an INTEGER column can still hold ''
+    or text written by older code; those export as null rather than failing
+    halfway through the stream.
+    """
+    convert = int if kind == INT else float
+    converted = []
+    for value in values:
+        try:
+            converted.append(None if value is None else convert(value))
+        except (TypeError, ValueError):
+            converted.append(None)
+    return converted
+
+
+def _le_bytes(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _encode_batch(columns, rows):
+    parts = [b'B', struct.pack('<I', len(rows))]
+    for index, (_, kind) in enumerate(columns):
+        values = [row[index] for row in rows]
+        if kind != STR:
+            values = _numbers(kind, values)
+        parts.append(bytes(value is None for value in values))
+        if kind == STR:
+            encoded = [b'' if value is None else str(value).encode('utf-8') for value in values]
+            parts.append(_le_bytes(array.array('I', map(len, encoded))))
+            parts.append(b''.join(encoded))
+        else:
+            default = 0 if kind == INT else 0.0
+            parts.append(_le_bytes(array.array(_ARRAY_CODES[kind],
+                                               (default if value is None else value for value in values))))
+    return b''.join(parts)
+
+
+def _stream_ivcol(columns, cursor):
+    header = json.dumps({'columns': [list(column) for column in columns]}).encode('utf-8')
+    yield COLUMNAR_MAGIC + struct.pack('<I', len(header)) + header
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+        if not rows:
+            break
+        yield _encode_batch(columns, rows)
+    yield b'E'
+
+
+def _stream_arrow(columns, cursor):
+    arrow_types = {INT: pyarrow.int64(), FLOAT: pyarrow.float64(), STR: pyarrow.string()}
+    schema = pyarrow.schema([(name, arrow_types[kind]) for name, kind in columns])
+    sink = io.BytesIO()
+    writer = pyarrow.ipc.new_stream(sink, schema)
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+        if not rows:
+            break
+        arrays = []
+        for i, (_, kind) in enumerate(columns):
+            values = [row[i] for row in rows]
+            arrays.append(pyarrow.array(values if kind == STR else _numbers(kind, values), type=schema.field(i).type))
+        writer.write_batch(pyarrow.record_batch(arrays, schema=schema))
+        yield drain()
+    writer.close()
+    yield drain()
+
+
+def columnar_format():
+    return 'arrow-ipc' if pyarrow is not None else 'ivcol1'
+
+
+def stream_columnar(columns, cursor):
+    """Yield the rows in the best available columnar encoding"""
+    if pyarrow is not None:
+        return _stream_arrow(columns, cursor)
+    return _stream_ivcol(columns, cursor)
+
+
+def read_columnar(stream):
+    """Decode an IVCOL1 stream into {column: [values]} (for consumers and checks)"""
+    def read(size):
+        data = stream.read(size)
+        if len(data) != size:
+            raise ValueError('Truncated columnar stream')
+        return data
+
+    if read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError('Not an IVCOL1 stream')
+    columns = json.loads(read(struct.unpack('<I', read(4))[0]))['columns']
+    result = {name: [] for name, _ in columns}
+
+    while read(1) == b'B':
+        count = struct.unpack('<I', read(4))[0]
+        for name, kind in columns:
+            nulls = read(count)
+            if kind == STR:
+                lengths = array.array('I')
+                lengths.frombytes(read(lengths.itemsize * count))
+                if sys.byteorder == 'big':
+                    lengths.byteswap()
+                values = [read(length).decode('utf-8') for length in lengths]
+            else:
+                values = array.array(_ARRAY_CODES[kind])
+                values.frombytes(read(values.itemsize * count))
+                if sys.byteorder == 'big':
+                    values.byteswap()
+            result[name].extend(None if null else value for null, value in zip(nulls, values))
+    return result
@@ -0,0 +1,38 @@
+"""
+Gunicorn settings: gunicorn -c gunicorn.conf.py wsgi:app
+Each value can be overridden from the environment or the command line.
+"""
+
+import os
+
+import config
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+# SQLite takes one writer at a time across all processes, so extra workers
+# add read throughput and lock waits, not write throughput
+workers = config.web_workers()
+
+# Threads keep a worker serving while it waits on SQLite. A stream answered
+# here occupies one thread until the dashboard closes, so each worker gets
+# its share of EVENT_TARGET_STREAMS (its EVENT_MAX_STREAMS) plus 8 threads
+# for requests; gthread only starts them as they are needed. With
+# stream_server.py in front of /api/stream most of them are never started
+worker_class = 'gthread'
+threads = config.worker_threads(config.Config.EVENT_TARGET_STREAMS)
+
+# Import and check the app once in the master, then fork; the pool, writer
+# and background threads start lazily, so nothing is shared across the fork
+preload_app = True
+
+# Recycle workers so slow leaks and fragmentation never build up; the jitter
+# keeps them from all restarting at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+timeout = 60            # large exports stream for a while
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
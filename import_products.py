@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Bulk Product Import
+Loads a supplier catalogue from CSV, NDJSON or a JSON array and upserts it by barcode
+(required on every row)
+
+    python import_products.py catalogue.csv
+    python import_products.py catalogue.ndjson --chunk-size 10000
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import db
+import migrations
+
+DB_NAME = os.environ.get('DATABASE', "database.db")
+SAST = timezone(timedelta(hours=2))
+
+CHUNK_SIZE = 5000
+FIELDS = ['name', 'cost', 'price', 'stock', 'min_stock', 'category', 'barcode', 'supplier_id']
+
+# Blank optional fields keep the existing value on update; rows that would not
+# change anything are skipped so re-importing a catalogue does not rewrite it.
+# ?10 is the row's change_seq, stamped here because the per-row triggers are
+# stood down for bulk loads (see apply_chunk)
+UPSERT_SQL = """
+    INSERT INTO products (name, cost, price, stock, min_stock, category, barcode, supplier_id, created_at, change_seq)
+    VALUES (?1, ?2, ?3, COALESCE(?4, 0), COALESCE(?5, 5), COALESCE(?6, ''), ?7, ?8, ?9, ?10)
+    ON CONFLICT(barcode) DO UPDATE SET
+        name = ?1,
+        cost = ?2,
+        price = ?3,
+        stock = COALESCE(?4, stock),
+        min_stock = COALESCE(?5, min_stock),
+        category = COALESCE(?6, category),
+        supplier_id = COALESCE(?8, supplier_id),
+        change_seq = ?10
+    WHERE name IS NOT ?1 OR cost IS NOT ?2 OR price IS NOT ?3
+       OR stock IS NOT COALESCE(?4, stock)
+       OR min_stock IS NOT COALESCE(?5, min_stock)
+       OR category IS NOT COALESCE(?6, category)
+       OR supplier_id IS NOT COALESCE(?8, supplier_id)
+"""
+
+
+def get_current_time():
+    return datetime.now(SAST)
+
+
+# -----------------------------------------------------------------------------------------
+# PARSING
+# -----------------------------------------------------------------------------------------
+def detect_format(filename):
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    if extension == '.json':
+        return 'json'
+    return 'csv'
+
+
+def iter_records(stream, fmt):
+    """Yield dict records from a text stream without reading CSV/NDJSON fully"""
+    if fmt == 'csv':
+        for record in csv.DictReader(stream):
+            yield {(key or '').strip().lower(): value for key, value in record.items()}
+    elif fmt == 'ndjson':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    elif fmt == 'json':
+        # A JSON array has to be parsed in one go; use NDJSON for huge catalogues
+        data = json.load(stream)
+        if isinstance(data, dict):
+            data = data.get('products')
+        if not isinstance(data, list):
+            raise ValueError('JSON must be an array of products or an object with a "products" array')
+        yield from data
+    else:
+        raise ValueError(f'Unknown import format: {fmt}')
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def validate(record, seen_barcodes, created_at):
+    """Turn a raw record into an upsert parameter tuple; raises ValueError"""
+    if not isinstance(record, dict):
+        raise ValueError('Row is not an object')
+
+    name = str(record.get('name') or '').strip()
+    if not name:
+        raise ValueError('Name is required')
+
+    try:
+        cost = float(record.get('cost'))
+        price = float(record.get('price'))
+    except (TypeError, ValueError):
+        raise ValueError('Cost and price must be numbers')
+    if cost < 0 or price < 0:
+        raise ValueError('Cost and price cannot be negative')
+    if price < cost:
+        raise ValueError('Selling price cannot be less than cost price')
+
+    try:
+        stock, min_stock, supplier_id = (
+            None if _blank(record.get(field)) else int(record[field])
+            for field in ('stock', 'min_stock', 'supplier_id')
+        )
+    except (TypeError, ValueError):
+        raise ValueError('Stock, min_stock and supplier_id must be whole numbers')
+    if (stock is not None and stock < 0) or (min_stock is not None and min_stock < 0):
+        raise ValueError('Stock levels cannot be negative')
+
+    # Rows are matched to products by barcode, and ON CONFLICT never matches a
+    # NULL one, so a row without it would be added again on every re-import
+    if _blank(record.get('barcode')):
+        raise ValueError('Barcode is required (add products without one on the Add Product page)')
+    barcode = str(record['barcode']).strip()
+    if barcode in seen_barcodes:
+        raise ValueError(f'Barcode {barcode} appears more than once in this file')
+    seen_barcodes.add(barcode)
+
+    category = None if _blank(record.get('category')) else str(record['category']).strip()
+
+    return (name, cost, price, stock, min_stock, category, barcode, supplier_id, created_at)
+
+
+# -----------------------------------------------------------------------------------------
+# APPLYING
+# -----------------------------------------------------------------------------------------
+def apply_chunk(conn, rows):
+    """Write transaction body: upsert one validated chunk, returns rows changed
+
+    The search index and products version are brought up to date once for
+    the whole chunk instead of by a trigger per row (see migrations._bulk_load).
+    Rows that change nothing leave a gap in change_seq, which readers ignore.
+    """
+    started_seq = migrations.begin_bulk_load(conn)
+    count = conn.executemany(UPSERT_SQL, [row + (started_seq + n,) for n, row in enumerate(rows, start=1)]).rowcount
+    migrations.finish_bulk_load(conn)
+    return count
+
+
+def run_import(stream, fmt, write_chunk, chunk_size=CHUNK_SIZE):
+    """Validate records chunk by chunk and hand each chunk to write_chunk(rows)
+
+    write_chunk returns how many products it inserted or changed. The report
+    counts rows read, rows accepted ('imported'), rows that changed the table
+    and per-row errors (row numbers are 1-based data rows).
+    """
+    created_at = get_current_time().strftime('%Y-%m-%d %H:%M:%S')
+    seen_barcodes = set()
+    report = {'rows': 0, 'imported': 0, 'changed': 0, 'errors': []}
+    chunk = []
+    started = time.perf_counter()
+
+    def flush():
+        report['changed'] += write_chunk(chunk)
+        report['imported'] += len(chunk)
+
+    try:
+        for row_number, record in enumerate(iter_records(stream, fmt), start=1):
+            report['rows'] = row_number
+            try:
+                chunk.append(validate(record, seen_barcodes, created_at))
+            except ValueError as e:
+                report['errors'].append({'row': row_number, 'error': str(e)})
+                continue
+            if len(chunk) >= chunk_size:
+                flush()
+                chunk = []
+    except (ValueError, csv.Error) as e:
+        # Unreadable file (bad JSON, broken CSV): stop, keep what was already written
+        report['errors'].append({'row': report['rows'] + 1, 'error': f'Could not parse file: {e}'})
+
+    if chunk:
+        flush()
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def import_file(conn, path, fmt=None, chunk_size=CHUNK_SIZE):
+    """Import a file on disk using a plain connection, one transaction per chunk"""
+    conn.isolation_level = None
+
+    def write_chunk(rows):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            count = apply_chunk(conn, rows)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return count
+
+    with open(path, newline='', encoding='utf-8-sig') as stream:
+        return run_import(stream, fmt or detect_format(path), write_chunk, chunk_size)
+
+
+def text_stream(binary):
+    """Text wrapper for an uploaded file object"""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import products (CSV, NDJSON or JSON)')
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=['csv', 'ndjson', 'json'])
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    conn = db.connect(DB_NAME)
+    migrations.migrate(conn)
+    print(f"📦 Importing {args.path}...")
+    report = import_file(conn, args.path, args.format, args.chunk_size)
+    conn.close()
+
+    rate = report['imported'] / report['seconds'] if report['seconds'] else report['imported']
+    print(f"   ✅ {report['imported']} of {report['rows']} rows imported in {report['seconds']}s ({rate:.0f} rows/s), "
+          f"{report['changed']} products added or changed")
+    for error in report['errors'][:50]:
+        print(f"   ❌ Row {error['row']}: {error['error']}")
+    if len(report['errors']) > 50:
+        print(f"   ... and {len(report['errors']) - 50} more errors")
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""
+Instrumentation
+Per-statement SQL counts, timings and row counts from an instrumented sqlite3
+connection class, per-route latency histograms, and the Prometheus text
+format served at /metrics.
+"""
+
+import bisect
+import functools
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_STATEMENTS = 500      # distinct statement shapes tracked; any beyond are pooled under 'other'
+MAX_SQL_LABEL = 200
+MAX_LABEL_CACHE = 5000
+
+logger = logging.getLogger('inventory.sql')
+
+_WHITESPACE = re.compile(r'\s+')
+_PLACEHOLDER_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+
+
+def normalize(sql):
+    """One label per statement shape: whitespace collapsed, IN (?, ?, ...) lists folded"""
+    return _PLACEHOLDER_LIST.sub('?, ...', _WHITESPACE.sub(' ', sql).strip())[:MAX_SQL_LABEL]
+
+
+class RequestStats:
+    """SQL work done on the current request's thread"""
+
+    __slots__ = ('queries', 'seconds', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        # [(sql, parameters, seconds)] while a profile is capturing, else None
+        self.statements = None
+
+
+# -----------------------------------------------------------------------------------------
+# INSTRUMENTED CONNECTIONS
+# -----------------------------------------------------------------------------------------
+class InstrumentedCursor(sqlite3.Cursor):
+    """Times execute and fetch* calls and counts the rows they return
+
+    Fetch time is charged to the statement that produced the rows, since
+    SQLite does most of a SELECT's work while rows are being stepped through.
+    """
+
+    _label = None
+    _elapsed = 0.0
+    _logged = False
+
+    def _started(self, sql, parameters, seconds, rows, failed=False):
+        registry = self.connection.registry
+        self._label = registry.label(sql)
+        self._elapsed = seconds
+        self._logged = False
+        registry.record_query(self._label, seconds, rows, failed, sql, parameters)
+        self._check_slow(registry)
+
+    def _fetched(self, seconds, rows):
+        if self._label is None:
+            return
+        registry = self.connection.registry
+        self._elapsed += seconds
+        registry.record_fetch(self._label, seconds, rows)
+        self._check_slow(registry)
+
+    def _check_slow(self, registry):
+        # Logged once per execution, when its running time first crosses the threshold
+        if registry.slow_query_seconds and not self._logged and self._elapsed >= registry.slow_query_seconds:
+            self._logged = True
+            registry.record_slow(self._label, self._elapsed)
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except Exception:
+            self._started(sql, parameters, time.perf_counter() - started, 0, failed=True)
+            raise
+        self._started(sql, parameters, time.perf_counter() - started, max(self.rowcount, 0))
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        except Exception:
+            self._started(sql, None, time.perf_counter() - started, 0, failed=True)
+            raise
+        self._started(sql, None, time.perf_counter() - started, max(self.rowcount, 0))
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - started, len(rows))
+        return rows
+
+    def __iter__(self):
+        # Rows are counted but not timed: a per-row timer would cost more than
+        # the row itself, and the gaps between rows belong to the caller
+        return self._iterate()
+
+    def _iterate(self):
+        rows = 0
+        try:
+            # iter(callable, sentinel) stops on the StopIteration the C __next__ raises
+            for row in iter(functools.partial(sqlite3.Cursor.__next__, self), None):
+                rows += 1
+                yield row
+        finally:
+            self._fetched(0.0, rows)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including conn.execute(), are instrumented"""
+
+    registry = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The C shortcuts bypass cursor(), so route them through it
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# -----------------------------------------------------------------------------------------
+# REGISTRY
+# -----------------------------------------------------------------------------------------
+class Registry:
+    """Process-wide SQL and HTTP metrics"""
+
+    def __init__(self, slow_query_seconds=None):
+        self.slow_query_seconds = slow_query_seconds or None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._labels = {}
+        # label -> [queries, seconds, rows, errors]
+        self._statements = {}
+        self._slow = 0
+        # (method, endpoint) -> [bucket counts..., +Inf count, sum]
+        self._latency = {}
+        # (method, endpoint, status) -> requests
+        self._requests = {}
+        # endpoint -> [queries, seconds]
+        self._request_sql = {}
+
+    def connection_class(self):
+        """sqlite3 connection factory that reports to this registry"""
+        return type('InstrumentedConnection', (InstrumentedConnection,), {'registry': self})
+
+    def label(self, sql):
+        label = self._labels.get(sql)
+        if label is None:
+            label = normalize(sql)
+            with self._lock:
+                if label not in self._statements and len(self._statements) >= MAX_STATEMENTS:
+                    label = 'other'
+                if len(self._labels) >= MAX_LABEL_CACHE:
+                    self._labels.clear()
+                self._labels[sql] = label
+        return label
+
+    def record_query(self, label, seconds, rows, failed=False, sql=None, parameters=None):
+        with self._lock:
+            stats = self._statements.get(label)
+            if stats is None:
+                stats = self._statements[label] = [0, 0.0, 0, 0]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] += rows
+            if failed:
+                stats[3] += 1
+        current = getattr(self._local, 'request', None)
+        if current is not None:
+            current.queries += 1
+            current.seconds += seconds
+            if current.statements is not None and sql is not None:
+                current.statements.append((sql, parameters, seconds))
+
+    def record_fetch(self, label, seconds, rows):
+        with self._lock:
+            stats = self._statements.get(label)
+            if stats is not None:
+                stats[1] += seconds
+                stats[2] += rows
+        current = getattr(self._local, 'request', None)
+        if current is not None:
+            current.seconds += seconds
+
+    def record_slow(self, label, seconds):
+        with self._lock:
+            self._slow += 1
+        logger.warning('Slow query (%.1f ms): %s', seconds * 1000, label)
+
+    # Per-request bookkeeping -----------------------------------------------------------
+    def start_request(self):
+        self._local.request = RequestStats()
+        return self._local.request
+
+    def finish_request(self, method, endpoint, status, seconds):
+        """Record one request; returns the SQL work done on its thread"""
+        current = getattr(self._local, 'request', None) or RequestStats()
+        self._local.request = None
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            histogram = self._latency.get((method, endpoint))
+            if histogram is None:
+                histogram = self._latency[(method, endpoint)] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += seconds
+            key = (method, endpoint, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            sql = self._request_sql.setdefault(endpoint, [0, 0.0])
+            sql[0] += current.queries
+            sql[1] += current.seconds
+        return current
+
+    def capture_statements(self):
+        """Start keeping (sql, parameters, seconds) for the current request; returns the list"""
+        current = getattr(self._local, 'request', None)
+        if current is None:
+            return None
+        current.statements = []
+        return current.statements
+
+    def discard_request(self):
+        self._local.request = None
+
+    # Output ----------------------------------------------------------------------------
+    def statements(self):
+        """{label: {'queries', 'seconds', 'rows', 'errors'}} sorted by total time"""
+        with self._lock:
+            items = [(label, list(stats)) for label, stats in self._statements.items()]
+        items.sort(key=lambda item: item[1][1], reverse=True)
+        return {label: dict(zip(('queries', 'seconds', 'rows', 'errors'), stats)) for label, stats in items}
+
+    def render(self, gauges=None, labels=None):
+        """Prometheus text exposition; gauges maps a prefix to a dict of numbers
+
+        labels (such as the worker) are added to every sample.
+        """
+        common = labels or {}
+        with self._lock:
+            statements = {label: list(stats) for label, stats in self._statements.items()}
+            latency = {key: list(histogram) for key, histogram in self._latency.items()}
+            requests = dict(self._requests)
+            request_sql = {key: list(value) for key, value in self._request_sql.items()}
+            slow = self._slow
+
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(dict(labels, **common))} {_number(value)}')
+
+        metric('inventory_http_requests_total', 'counter', 'HTTP requests by route and status',
+               [({'method': m, 'endpoint': e, 'status': s}, n) for (m, e, s), n in sorted(requests.items())])
+
+        lines.append('# HELP inventory_http_request_duration_seconds Time to produce the response headers')
+        lines.append('# TYPE inventory_http_request_duration_seconds histogram')
+        for (method, endpoint), histogram in sorted(latency.items()):
+            labels = {'method': method, 'endpoint': endpoint, **common}
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram[:-1]):
+                cumulative += count
+                bucket = dict(labels, le=bound if bound == '+Inf' else _number(bound))
+                lines.append(f'inventory_http_request_duration_seconds_bucket{_labels(bucket)} {cumulative}')
+            lines.append(f'inventory_http_request_duration_seconds_sum{_labels(labels)} {_number(histogram[-1])}')
+            lines.append(f'inventory_http_request_duration_seconds_count{_labels(labels)} {cumulative}')
+
+        metric('inventory_http_request_sql_queries_total', 'counter',
+               'SQL statements run on request threads, by route',
+               [({'endpoint': e}, v[0]) for e, v in sorted(request_sql.items())])
+        metric('inventory_http_request_sql_seconds_total', 'counter', 'SQL time on request threads, by route',
+               [({'endpoint': e}, v[1]) for e, v in sorted(request_sql.items())])
+
+        ordered = sorted(statements.items())
+        metric('inventory_sql_queries_total', 'counter', 'SQL statements executed',
+               [({'statement': label}, stats[0]) for label, stats in ordered])
+        metric('inventory_sql_query_seconds_total', 'counter', 'Time spent executing and fetching',
+               [({'statement': label}, stats[1]) for label, stats in ordered])
+        metric('inventory_sql_rows_total', 'counter', 'Rows returned or changed',
+               [({'statement': label}, stats[2]) for label, stats in ordered])
+        metric('inventory_sql_errors_total', 'counter', 'Statements that raised',
+               [({'statement': label}, stats[3]) for label, stats in ordered if stats[3]])
+        metric('inventory_sql_slow_queries_total', 'counter', 'Statements over the slow query threshold',
+               [({}, slow)])
+
+        for prefix, values in (gauges or {}).items():
+            for key, value in sorted(values.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric(f'inventory_{prefix}_{key}', 'gauge', f'{prefix} {key}'.replace('_', ' '), [({}, value)])
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,744 @@
+"""
+Schema migrations
+Shared by app.py and init_database.py; progress is tracked in PRAGMA user_version
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from werkzeug.security import generate_password_hash
+
+SAST = timezone(timedelta(hours=2))
+
+# Seeded by bootstrap(): username, password, role
+DEFAULT_ADMIN = ('Mabutsi', 'Mabutsi@12', 'Mabutsi')
+
+
+class SchemaOutOfDate(RuntimeError):
+    """The database is not at the schema version this code expects"""
+
+
+def _base_schema(c):
+    """Six core tables (matches databases created before versioning)"""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            cost REAL NOT NULL,
+            price REAL NOT NULL,
+            stock INTEGER NOT NULL,
+            min_stock INTEGER DEFAULT 5,
+            category TEXT,
+            barcode TEXT UNIQUE,
+            supplier_id INTEGER,
+            created_at TEXT,
+            FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
+        )
+    """)
+
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS sales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            quantity INTEGER,
+            total_amount REAL,
+            sale_time TEXT,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+    """)
+
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT DEFAULT 'user',
+            created_at TEXT
+        )
+    """)
+
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS suppliers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            contact_person TEXT,
+            email TEXT,
+            phone TEXT,
+            address TEXT,
+            created_at TEXT
+        )
+    """)
+
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS purchase_orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            supplier_id INTEGER,
+            product_id INTEGER,
+            quantity INTEGER,
+            cost_per_unit REAL,
+            total_cost REAL,
+            status TEXT DEFAULT 'pending',
+            order_date TEXT,
+            expected_delivery TEXT,
+            received_date TEXT,
+            notes TEXT,
+            FOREIGN KEY (supplier_id) REFERENCES suppliers(id),
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+    """)
+
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS stock_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            alert_threshold INTEGER DEFAULT 5,
+            is_active INTEGER DEFAULT 1,
+            last_alert_sent TEXT,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+    """)
+
+
+def _hot_query_indexes(c):
+    """Indexes for the dashboard, sales history, purchase orders and alerts"""
+    # Sales history and exports: ORDER BY sale_time DESC
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sales_sale_time ON sales(sale_time)")
+    # Per-product aggregates (top sellers) join sales on product_id
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sales_product_time ON sales(product_id, sale_time)")
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_purchase_orders_status_date ON purchase_orders(status, order_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_purchase_orders_order_date ON purchase_orders(order_date)")
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_products_category ON products(category)")
+    # Partial index holding only low-stock rows, used by WHERE stock <= min_stock
+    c.execute("CREATE INDEX IF NOT EXISTS idx_products_low_stock ON products(stock) WHERE stock <= min_stock")
+
+    # One alert setting per product; keep the newest if duplicates crept in
+    c.execute("""
+        DELETE FROM stock_alerts
+        WHERE id NOT IN (SELECT MAX(id) FROM stock_alerts GROUP BY product_id)
+    """)
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_stock_alerts_product ON stock_alerts(product_id)")
+
+
+def _sales_summaries(c):
+    """Per-day and per-product sales rollups kept current by triggers on sales"""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS daily_sales_summary (
+            sale_date TEXT PRIMARY KEY,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            sale_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS product_sales_summary (
+            product_id INTEGER PRIMARY KEY,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            sale_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_product_sales_summary_quantity ON product_sales_summary(quantity)")
+
+    # Add a sale row's figures to both rollups
+    add_new = """
+        INSERT INTO daily_sales_summary (sale_date, quantity, revenue, sale_count)
+        VALUES (substr(NEW.sale_time, 1, 10), COALESCE(NEW.quantity, 0), COALESCE(NEW.total_amount, 0), 1)
+        ON CONFLICT(sale_date) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue,
+            sale_count = sale_count + 1;
+        INSERT INTO product_sales_summary (product_id, quantity, revenue, sale_count)
+        SELECT NEW.product_id, COALESCE(NEW.quantity, 0), COALESCE(NEW.total_amount, 0), 1
+        WHERE NEW.product_id IS NOT NULL
+        ON CONFLICT(product_id) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue,
+            sale_count = sale_count + 1;
+    """
+    # Take an old sale row's figures back out
+    remove_old = """
+        UPDATE daily_sales_summary SET
+            quantity = quantity - COALESCE(OLD.quantity, 0),
+            revenue = revenue - COALESCE(OLD.total_amount, 0),
+            sale_count = sale_count - 1
+        WHERE sale_date = substr(OLD.sale_time, 1, 10);
+        UPDATE product_sales_summary SET
+            quantity = quantity - COALESCE(OLD.quantity, 0),
+            revenue = revenue - COALESCE(OLD.total_amount, 0),
+            sale_count = sale_count - 1
+        WHERE product_id = OLD.product_id;
+    """
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_sales_summary_insert AFTER INSERT ON sales BEGIN {add_new} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_sales_summary_delete AFTER DELETE ON sales BEGIN {remove_old} END")
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_sales_summary_update
+        AFTER UPDATE OF product_id, quantity, total_amount, sale_time ON sales
+        BEGIN {remove_old} {add_new} END
+    """)
+
+    # Backfill existing history
+    c.execute("""
+        INSERT INTO daily_sales_summary (sale_date, quantity, revenue, sale_count)
+        SELECT substr(sale_time, 1, 10), COALESCE(SUM(quantity), 0), COALESCE(SUM(total_amount), 0), COUNT(*)
+        FROM sales
+        GROUP BY substr(sale_time, 1, 10)
+    """)
+    c.execute("""
+        INSERT INTO product_sales_summary (product_id, quantity, revenue, sale_count)
+        SELECT product_id, COALESCE(SUM(quantity), 0), COALESCE(SUM(total_amount), 0), COUNT(*)
+        FROM sales
+        WHERE product_id IS NOT NULL
+        GROUP BY product_id
+    """)
+
+
+def _sale_price_snapshot(c):
+    """Record unit price and cost on each sale and roll profit up with it"""
+    c.execute("ALTER TABLE sales ADD COLUMN unit_price REAL")
+    c.execute("ALTER TABLE sales ADD COLUMN unit_cost REAL")
+
+    # Price is recoverable from the stored total; cost only from the product
+    # as it is now, which is the best we have for sales made before this
+    c.execute("""
+        UPDATE sales SET
+            unit_price = CASE WHEN quantity > 0 THEN total_amount / quantity END,
+            unit_cost = (SELECT p.cost FROM products p WHERE p.id = sales.product_id)
+    """)
+
+    c.execute("ALTER TABLE daily_sales_summary ADD COLUMN profit REAL NOT NULL DEFAULT 0")
+    c.execute("ALTER TABLE product_sales_summary ADD COLUMN profit REAL NOT NULL DEFAULT 0")
+
+    for trigger in ('trg_sales_summary_insert', 'trg_sales_summary_delete', 'trg_sales_summary_update'):
+        c.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+    # Sales with no known cost contribute nothing to profit
+    new_profit = "CASE WHEN NEW.unit_cost IS NULL THEN 0 ELSE COALESCE(NEW.total_amount, 0) - NEW.unit_cost * COALESCE(NEW.quantity, 0) END"
+    old_profit = "CASE WHEN OLD.unit_cost IS NULL THEN 0 ELSE COALESCE(OLD.total_amount, 0) - OLD.unit_cost * COALESCE(OLD.quantity, 0) END"
+
+    add_new = f"""
+        INSERT INTO daily_sales_summary (sale_date, quantity, revenue, profit, sale_count)
+        VALUES (substr(NEW.sale_time, 1, 10), COALESCE(NEW.quantity, 0), COALESCE(NEW.total_amount, 0), {new_profit}, 1)
+        ON CONFLICT(sale_date) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue,
+            profit = profit + excluded.profit,
+            sale_count = sale_count + 1;
+        INSERT INTO product_sales_summary (product_id, quantity, revenue, profit, sale_count)
+        SELECT NEW.product_id, COALESCE(NEW.quantity, 0), COALESCE(NEW.total_amount, 0), {new_profit}, 1
+        WHERE NEW.product_id IS NOT NULL
+        ON CONFLICT(product_id) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue,
+            profit = profit + excluded.profit,
+            sale_count = sale_count + 1;
+    """
+    remove_old = f"""
+        UPDATE daily_sales_summary SET
+            quantity = quantity - COALESCE(OLD.quantity, 0),
+            revenue = revenue - COALESCE(OLD.total_amount, 0),
+            profit = profit - {old_profit},
+            sale_count = sale_count - 1
+        WHERE sale_date = substr(OLD.sale_time, 1, 10);
+        UPDATE product_sales_summary SET
+            quantity = quantity - COALESCE(OLD.quantity, 0),
+            revenue = revenue - COALESCE(OLD.total_amount, 0),
+            profit = profit - {old_profit},
+            sale_count = sale_count - 1
+        WHERE product_id = OLD.product_id;
+    """
+    c.execute(f"CREATE TRIGGER trg_sales_summary_insert AFTER INSERT ON sales BEGIN {add_new} END")
+    c.execute(f"CREATE TRIGGER trg_sales_summary_delete AFTER DELETE ON sales BEGIN {remove_old} END")
+    c.execute(f"""
+        CREATE TRIGGER trg_sales_summary_update
+        AFTER UPDATE OF product_id, quantity, total_amount, unit_cost, sale_time ON sales
+        BEGIN {remove_old} {add_new} END
+    """)
+
+    rebuild_sales_summaries(c)
+
+
+def rebuild_sales_summaries(c):
+    """Recompute both sales rollups from the sales table (current schema)"""
+    profit = "CASE WHEN unit_cost IS NULL THEN 0 ELSE COALESCE(total_amount, 0) - unit_cost * COALESCE(quantity, 0) END"
+    c.execute("DELETE FROM daily_sales_summary")
+    c.execute(f"""
+        INSERT INTO daily_sales_summary (sale_date, quantity, revenue, profit, sale_count)
+        SELECT substr(sale_time, 1, 10), COALESCE(SUM(quantity), 0), COALESCE(SUM(total_amount), 0),
+               SUM({profit}), COUNT(*)
+        FROM sales
+        GROUP BY substr(sale_time, 1, 10)
+    """)
+    c.execute("DELETE FROM product_sales_summary")
+    c.execute(f"""
+        INSERT INTO product_sales_summary (product_id, quantity, revenue, profit, sale_count)
+        SELECT product_id, COALESCE(SUM(quantity), 0), COALESCE(SUM(total_amount), 0),
+               SUM({profit}), COUNT(*)
+        FROM sales
+        WHERE product_id IS NOT NULL
+        GROUP BY product_id
+    """)
+
+
+def _product_search(c):
+    """FTS5 index over product name, category, barcode and supplier name"""
+    c.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+            name, category, barcode, supplier,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    # Supplier renames fan out to that supplier's products; product list sorts by name
+    c.execute("CREATE INDEX IF NOT EXISTS idx_products_supplier ON products(supplier_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_products_name ON products(name)")
+
+    # The FTS rowid is the product id
+    index_new = """
+        INSERT INTO product_search (rowid, name, category, barcode, supplier)
+        VALUES (NEW.id, NEW.name, NEW.category, NEW.barcode,
+                (SELECT s.name FROM suppliers s WHERE s.id = NEW.supplier_id));
+    """
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_product_search_insert AFTER INSERT ON products BEGIN {index_new} END")
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_product_search_update
+        AFTER UPDATE OF name, category, barcode, supplier_id ON products
+        BEGIN
+            DELETE FROM product_search WHERE rowid = OLD.id;
+            {index_new}
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_product_search_delete AFTER DELETE ON products
+        BEGIN
+            DELETE FROM product_search WHERE rowid = OLD.id;
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_product_search_supplier_update AFTER UPDATE OF name ON suppliers
+        BEGIN
+            UPDATE product_search SET supplier = NEW.name
+            WHERE rowid IN (SELECT id FROM products WHERE supplier_id = NEW.id);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_product_search_supplier_delete AFTER DELETE ON suppliers
+        BEGIN
+            UPDATE product_search SET supplier = NULL
+            WHERE rowid IN (SELECT id FROM products WHERE supplier_id = OLD.id);
+        END
+    """)
+
+    rebuild_product_search(c)
+
+
+def rebuild_product_search(c):
+    """Re-index every product in the full-text search table"""
+    c.execute("DELETE FROM product_search")
+    c.execute("""
+        INSERT INTO product_search (rowid, name, category, barcode, supplier)
+        SELECT p.id, p.name, p.category, p.barcode, s.name
+        FROM products p
+        LEFT JOIN suppliers s ON p.supplier_id = s.id
+    """)
+
+
+def _cache_versions(c):
+    """Per-table change counters that in-process caches compare against
+
+    Stock-only updates (every sale) deliberately do not bump 'products'.
+    """
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    c.execute("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('products', 0), ('suppliers', 0)")
+
+    for table, columns in (
+        ('products', 'name, cost, price, min_stock, category, barcode, supplier_id'),
+        ('suppliers', 'name, contact_person, email, phone, address'),
+    ):
+        bump = f"UPDATE cache_versions SET version = version + 1 WHERE name = '{table}';"
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_version_insert AFTER INSERT ON {table} BEGIN {bump} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_version_delete AFTER DELETE ON {table} BEGIN {bump} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_version_update AFTER UPDATE OF {columns} ON {table} BEGIN {bump} END")
+
+
+def _sale_transactions(c):
+    """Checkout header table; each sales row becomes a line of one transaction"""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS sale_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sale_time TEXT NOT NULL,
+            user_id INTEGER,
+            line_count INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            total_amount REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sale_transactions_time ON sale_transactions(sale_time)")
+    c.execute("ALTER TABLE sales ADD COLUMN transaction_id INTEGER REFERENCES sale_transactions(id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sales_transaction ON sales(transaction_id)")
+
+
+def _change_times(c):
+    """Last change time on each cache_versions counter, plus a 'sales' counter
+
+    Together they give HTTP validators (ETag / Last-Modified) for sales reports.
+    """
+    now = "CAST(strftime('%s', 'now') AS INTEGER)"
+    c.execute("ALTER TABLE cache_versions ADD COLUMN updated_at INTEGER")
+    c.execute(f"UPDATE cache_versions SET updated_at = {now}")
+    c.execute(f"INSERT OR IGNORE INTO cache_versions (name, version, updated_at) VALUES ('sales', 0, {now})")
+
+    for table, columns in (
+        ('products', 'name, cost, price, min_stock, category, barcode, supplier_id'),
+        ('suppliers', 'name, contact_person, email, phone, address'),
+        ('sales', 'product_id, quantity, total_amount, sale_time, unit_price, unit_cost, transaction_id'),
+    ):
+        bump = f"UPDATE cache_versions SET version = version + 1, updated_at = {now} WHERE name = '{table}';"
+        for event, trigger_on in (('insert', 'INSERT'), ('delete', 'DELETE'), ('update', f'UPDATE OF {columns}')):
+            c.execute(f"DROP TRIGGER IF EXISTS trg_{table}_version_{event}")
+            c.execute(f"CREATE TRIGGER trg_{table}_version_{event} AFTER {trigger_on} ON {table} BEGIN {bump} END")
+
+
+# (table, bucket column, SQL deriving the bucket from a sale_time expression)
+SALES_BUCKETS = (
+    ('hourly_product_sales', 'sale_hour', 'substr({t}, 1, 13)'),
+    ('daily_product_sales', 'sale_date', 'substr({t}, 1, 10)'),
+    # Monday of the ISO week
+    ('weekly_product_sales', 'week_start',
+     "date(substr({t}, 1, 10), '-' || ((CAST(strftime('%w', substr({t}, 1, 10)) AS INTEGER) + 6) % 7) || ' days')"),
+    ('monthly_product_sales', 'sale_month', 'substr({t}, 1, 7)'),
+)
+
+
+def _sales_buckets(c):
+    """Hourly, daily, weekly and monthly per-product sales rollups for time series
+
+    product_id 0 stands for sales whose product is unknown.
+    """
+    for table, bucket, _ in SALES_BUCKETS:
+        c.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {bucket} TEXT NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0,
+                profit REAL NOT NULL DEFAULT 0,
+                sale_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY ({bucket}, product_id)
+            ) WITHOUT ROWID
+        """)
+
+    new_profit = "CASE WHEN NEW.unit_cost IS NULL THEN 0 ELSE COALESCE(NEW.total_amount, 0) - NEW.unit_cost * COALESCE(NEW.quantity, 0) END"
+    old_profit = "CASE WHEN OLD.unit_cost IS NULL THEN 0 ELSE COALESCE(OLD.total_amount, 0) - OLD.unit_cost * COALESCE(OLD.quantity, 0) END"
+
+    add_new = ''
+    remove_old = ''
+    for table, bucket, expression in SALES_BUCKETS:
+        add_new += f"""
+            INSERT INTO {table} ({bucket}, product_id, quantity, revenue, profit, sale_count)
+            VALUES ({expression.format(t='NEW.sale_time')}, COALESCE(NEW.product_id, 0),
+                    COALESCE(NEW.quantity, 0), COALESCE(NEW.total_amount, 0), {new_profit}, 1)
+            ON CONFLICT({bucket}, product_id) DO UPDATE SET
+                quantity = quantity + excluded.quantity,
+                revenue = revenue + excluded.revenue,
+                profit = profit + excluded.profit,
+                sale_count = sale_count + 1;
+        """
+        remove_old += f"""
+            UPDATE {table} SET
+                quantity = quantity - COALESCE(OLD.quantity, 0),
+                revenue = revenue - COALESCE(OLD.total_amount, 0),
+                profit = profit - {old_profit},
+                sale_count = sale_count - 1
+            WHERE {bucket} = {expression.format(t='OLD.sale_time')} AND product_id = COALESCE(OLD.product_id, 0);
+        """
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_sales_buckets_insert AFTER INSERT ON sales BEGIN {add_new} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_sales_buckets_delete AFTER DELETE ON sales BEGIN {remove_old} END")
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_sales_buckets_update
+        AFTER UPDATE OF product_id, quantity, total_amount, unit_cost, sale_time ON sales
+        BEGIN {remove_old} {add_new} END
+    """)
+
+    rebuild_sales_buckets(c)
+
+
+def rebuild_sales_buckets(c):
+    """Recompute every SALES_BUCKETS rollup (hourly, daily, weekly, monthly) from the sales table"""
+    profit = "CASE WHEN unit_cost IS NULL THEN 0 ELSE COALESCE(total_amount, 0) - unit_cost * COALESCE(quantity, 0) END"
+    for table, bucket, expression in SALES_BUCKETS:
+        c.execute(f"DELETE FROM {table}")
+        c.execute(f"""
+            INSERT INTO {table} ({bucket}, product_id, quantity, revenue, profit, sale_count)
+            SELECT {expression.format(t='sale_time')}, COALESCE(product_id, 0), COALESCE(SUM(quantity), 0),
+                   COALESCE(SUM(total_amount), 0), SUM({profit}), COUNT(*)
+            FROM sales
+            GROUP BY 1, 2
+        """)
+
+
+def _alert_outbox(c):
+    """Fired stock alerts waiting for (or done with) notifier delivery"""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS alert_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            product_name TEXT,
+            stock INTEGER NOT NULL,
+            threshold INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            delivered_at TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+    """)
+    # Only undelivered rows are indexed, so the dispatcher never scans history
+    c.execute("CREATE INDEX IF NOT EXISTS idx_alert_outbox_pending ON alert_outbox(id) WHERE delivered_at IS NULL")
+
+
+def _product_changes(c):
+    """Change sequence on products, so bulk exports can pull edited rows
+
+    Every insert and every change to a product's data (stock included) stamps
+    the row with the next number; readers page through change_seq > last seen.
+    """
+    c.execute("ALTER TABLE products ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_products_change_seq ON products(change_seq)")
+    # Only change_seq is written here, which is not in the UPDATE OF list, so
+    # this never re-fires itself or the search and version triggers
+    stamp = "UPDATE products SET change_seq = (SELECT MAX(change_seq) FROM products) + 1 WHERE id = NEW.id;"
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_products_change_insert AFTER INSERT ON products
+        BEGIN {stamp} END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_products_change_update
+        AFTER UPDATE OF name, cost, price, stock, min_stock, category, barcode, supplier_id ON products
+        BEGIN {stamp} END
+    """)
+    rebuild_product_changes(c)
+
+
+def rebuild_product_changes(c):
+    """Give rows without a change stamp (existing or bulk-loaded ones) one in id order"""
+    c.execute("""
+        UPDATE products
+        SET change_seq = (SELECT MAX(change_seq) FROM products) + id
+        WHERE change_seq = 0
+    """)
+
+
+def _live_events(c):
+    """Event log behind /api/stream
+
+    Writes append their events in the same transaction and every worker tails
+    the table, so each stream sees every worker's changes. AUTOINCREMENT keeps
+    ids from being reused once old rows are pruned, so Last-Event-ID stays valid.
+    """
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS live_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL,
+            data TEXT NOT NULL
+        )
+    """)
+
+
+def _bulk_load(c):
+    """Set-based search, change_seq and version maintenance for bulk product loads
+
+    While a write transaction holds a row in bulk_load, the per-row product
+    triggers stand down: the loader stamps change_seq itself and
+    finish_bulk_load re-indexes the stamped rows and bumps the products
+    version once. The row is added and removed in the same transaction, so
+    no other writer ever sees it.
+    """
+    c.execute("CREATE TABLE IF NOT EXISTS bulk_load (started_seq INTEGER NOT NULL)")
+    idle = "WHEN NOT EXISTS (SELECT 1 FROM bulk_load)"
+    now = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+    index_new = """
+        INSERT INTO product_search (rowid, name, category, barcode, supplier)
+        VALUES (NEW.id, NEW.name, NEW.category, NEW.barcode,
+                (SELECT s.name FROM suppliers s WHERE s.id = NEW.supplier_id));
+    """
+    stamp = "UPDATE products SET change_seq = (SELECT MAX(change_seq) FROM products) + 1 WHERE id = NEW.id;"
+    bump = f"UPDATE cache_versions SET version = version + 1, updated_at = {now} WHERE name = 'products';"
+    for name, event, body in (
+        ('trg_product_search_insert', 'INSERT', index_new),
+        ('trg_product_search_update', 'UPDATE OF name, category, barcode, supplier_id',
+         f'DELETE FROM product_search WHERE rowid = OLD.id; {index_new}'),
+        ('trg_products_change_insert', 'INSERT', stamp),
+        ('trg_products_change_update',
+         'UPDATE OF name, cost, price, stock, min_stock, category, barcode, supplier_id', stamp),
+        ('trg_products_version_insert', 'INSERT', bump),
+        ('trg_products_version_update', 'UPDATE OF name, cost, price, min_stock, category, barcode, supplier_id',
+         bump),
+    ):
+        c.execute(f"DROP TRIGGER IF EXISTS {name}")
+        c.execute(f"CREATE TRIGGER {name} AFTER {event} ON products {idle} BEGIN {body} END")
+
+
+def _sales_category(c):
+    """Product category copied onto each sale, so category filters can page on an index
+
+    Unlike the price snapshot it follows the product: a re-categorised
+    product moves its sales history with it, as the join it replaces did.
+    """
+    c.execute("ALTER TABLE sales ADD COLUMN category TEXT")
+    rebuild_sales_categories(c)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sales_category_time ON sales(category, sale_time)")
+    # Checkout writes the category itself; this covers any other writer
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_sales_category_insert
+        AFTER INSERT ON sales
+        WHEN NEW.category IS NULL
+        BEGIN
+            UPDATE sales SET category = (SELECT p.category FROM products p WHERE p.id = NEW.product_id)
+            WHERE id = NEW.id;
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_products_category_sales
+        AFTER UPDATE OF category ON products
+        WHEN OLD.category IS NOT NEW.category
+        BEGIN
+            UPDATE sales SET category = NEW.category WHERE product_id = NEW.id;
+        END
+    """)
+
+
+def rebuild_sales_categories(c):
+    """Copy each product's current category onto its sales"""
+    c.execute("UPDATE sales SET category = (SELECT p.category FROM products p WHERE p.id = sales.product_id)")
+
+
+def begin_bulk_load(c):
+    """Stand the per-row product triggers down inside a write transaction
+
+    Returns the current highest change_seq; every row the load inserts or
+    changes must be given a change_seq above it.
+    """
+    started_seq = c.execute("SELECT COALESCE(MAX(change_seq), 0) FROM products").fetchone()[0]
+    c.execute("INSERT INTO bulk_load (started_seq) VALUES (?)", (started_seq,))
+    return started_seq
+
+
+def finish_bulk_load(c):
+    """Re-index the rows stamped since begin_bulk_load and bump the products version once"""
+    started_seq = c.execute("SELECT started_seq FROM bulk_load").fetchone()[0]
+    c.execute("DELETE FROM bulk_load")
+    c.execute("""
+        DELETE FROM product_search
+        WHERE rowid IN (SELECT id FROM products WHERE change_seq > ?)
+    """, (started_seq,))
+    c.execute("""
+        INSERT INTO product_search (rowid, name, category, barcode, supplier)
+        SELECT p.id, p.name, p.category, p.barcode, s.name
+        FROM products p
+        LEFT JOIN suppliers s ON p.supplier_id = s.id
+        WHERE p.change_seq > ?
+    """, (started_seq,))
+    c.execute("""
+        UPDATE cache_versions SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+        WHERE name = 'products'
+          AND EXISTS (SELECT 1 FROM products WHERE change_seq > ?)
+    """, (started_seq,))
+
+
+# (version, description, function) - append only, never reorder or edit applied steps
+MIGRATIONS = [
+    (1, 'base schema', _base_schema),
+    (2, 'indexes for hot queries', _hot_query_indexes),
+    (3, 'daily and product sales summaries', _sales_summaries),
+    (4, 'unit price and cost snapshot on sales', _sale_price_snapshot),
+    (5, 'full-text product search', _product_search),
+    (6, 'cache version counters', _cache_versions),
+    (7, 'multi-line sale transactions', _sale_transactions),
+    (8, 'change times for cache versions', _change_times),
+    (9, 'per-product sales buckets by hour, day, week and month', _sales_buckets),
+    (10, 'stock alert outbox', _alert_outbox),
+    (11, 'change sequence on products', _product_changes),
+    (12, 'live event log', _live_events),
+    (13, 'set-based index maintenance for bulk loads', _bulk_load),
+    (14, 'category on sales', _sales_category),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=SCHEMA_VERSION):
+    """Apply pending migrations, each in its own transaction
+
+    Returns the list of (version, description) steps that were applied.
+    """
+    applied = []
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for version, description, step in MIGRATIONS:
+            if version > target:
+                break
+            if get_version(conn) >= version:
+                continue
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-read inside the write lock in case another process got here first
+                if get_version(conn) >= version:
+                    c.execute("COMMIT")
+                    continue
+                step(c)
+                c.execute(f"PRAGMA user_version = {version}")
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+            applied.append((version, description))
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
+
+def check(conn):
+    """Cheap startup check: one PRAGMA read, raises SchemaOutOfDate on a mismatch"""
+    version = get_version(conn)
+    if version < SCHEMA_VERSION:
+        raise SchemaOutOfDate(f"Database schema is v{version}, this code needs v{SCHEMA_VERSION}: "
+                              "run python init_database.py")
+    if version > SCHEMA_VERSION:
+        raise SchemaOutOfDate(f"Database schema is v{version}, newer than this code (v{SCHEMA_VERSION})")
+    return version
+
+
+def seed_default_user(conn):
+    """Create the default admin user if it is missing; returns True if created"""
+    username, password, role = DEFAULT_ADMIN
+    if conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone():
+        return False
+    created_at = datetime.now(SAST).strftime('%Y-%m-%d %H:%M:%S')
+    conn.execute("INSERT OR IGNORE INTO users (username, password, role, created_at) VALUES (?, ?, ?, ?)",
+                 (username, generate_password_hash(password), role, created_at))
+    conn.commit()
+    return True
+
+
+def bootstrap(conn):
+    """Everything a new or older database needs: migrations, then the default user
+
+    Returns (applied migrations, whether the default user was created).
+    """
+    applied = migrate(conn)
+    return applied, seed_default_user(conn)
@@ -0,0 +1,114 @@
+"""
+Request profiling
+cProfile reports for single requests, EXPLAIN QUERY PLAN for the statements
+they ran, and a rotating directory of saved profiles (readable later with
+`python -m pstats <file>.prof`).
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import time
+
+DEFAULT_PROFILE_DIR = 'profiles'
+DEFAULT_KEEP = 50          # newest profiles kept on disk
+DEFAULT_TOP = 40           # functions listed in a report
+
+# Statements worth a query plan; PRAGMA, BEGIN, COMMIT, SAVEPOINT etc. are skipped
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+_UNSAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]+')
+
+# Only one profiler at a time: cProfile hooks are per thread before Python 3.12
+# and process-wide after it
+_active = threading.Lock()
+
+
+def acquire():
+    """Claim the profiler without waiting; False if another request holds it"""
+    return _active.acquire(blocking=False)
+
+
+def release():
+    _active.release()
+
+
+def start():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stats_text(profiler, top=DEFAULT_TOP):
+    buffer = io.StringIO()
+    stats = pstats.Stats(profiler, stream=buffer)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(top)
+    return buffer.getvalue().strip('\n')
+
+
+def explain(conn, statements):
+    """EXPLAIN QUERY PLAN for each distinct (sql, parameters, seconds), as text
+
+    Statements run through executemany have no single parameter set and are
+    listed without a plan.
+    """
+    seen = set()
+    sections = []
+    for sql, parameters, seconds in statements:
+        if sql in seen or not _EXPLAINABLE.match(sql):
+            continue
+        seen.add(sql)
+        lines = [f"-- {seconds * 1000:.2f} ms\n{' '.join(sql.split())}"]
+        if parameters is None:
+            lines.append('   (executemany: no plan)')
+        else:
+            try:
+                rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+            except Exception as e:
+                lines.append(f'   (no plan: {e})')
+            else:
+                depth = {0: 0}
+                for node_id, parent, _, detail in rows:
+                    depth[node_id] = depth.get(parent, 0) + 1
+                    lines.append('   ' + '  ' * (depth[node_id] - 1) + detail)
+        sections.append('\n'.join(lines))
+    return '\n\n'.join(sections) or '(no statements)'
+
+
+class ProfileStore:
+    """Directory of the newest profiles, each a .prof dump plus its .txt report"""
+
+    def __init__(self, directory=DEFAULT_PROFILE_DIR, keep=DEFAULT_KEEP):
+        self.directory = directory
+        self.keep = max(1, int(keep))
+        self._lock = threading.Lock()
+
+    def save(self, profiler, report, endpoint):
+        """Write one profile and drop the oldest beyond keep; returns its base path"""
+        stamp = time.strftime('%Y%m%d-%H%M%S') + f'-{time.time_ns() % 1000000000:09d}'
+        base = os.path.join(self.directory, f"{stamp}-{_UNSAFE_NAME.sub('_', endpoint or 'unmatched')}")
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            profiler.dump_stats(base + '.prof')
+            with open(base + '.txt', 'w', encoding='utf-8') as f:
+                f.write(report)
+            self._rotate()
+        return base
+
+    def _rotate(self):
+        # Names start with a timestamp, so name order is age order
+        names = sorted({os.path.splitext(name)[0] for name in os.listdir(self.directory)
+                        if name.endswith(('.prof', '.txt'))})
+        for name in names[:-self.keep]:
+            for extension in ('.prof', '.txt'):
+                try:
+                    os.remove(os.path.join(self.directory, name + extension))
+                except FileNotFoundError:
+                    pass
+
+    def list(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((name for name in os.listdir(self.directory) if name.endswith('.prof')), reverse=True)
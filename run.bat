@@ -51,8 +51,8 @@ echo.
 echo Access the application at: http://127.0.0.1:5000
 echo.
 echo Default login credentials:
-echo    Username: admin
-echo    Password: admin123
+echo    Username: Mabutsi
+echo    Password: Mabutsi@12
 echo.
 echo Press Ctrl+C to stop the server
 echo.
@@ -0,0 +1,336 @@
+"""
+Sales analytics
+Time-series queries and reorder forecasts answered from the rollup tables the
+sales triggers maintain, so neither ever scans the sales table itself
+"""
+
+import math
+from datetime import timedelta
+
+try:
+    import numpy
+except ImportError:  # optional; tests/test_sales_analytics.py checks both paths give the same plan
+    numpy = None
+
+# API name -> rollup column
+METRICS = {'revenue': 'revenue', 'units': 'quantity', 'profit': 'profit'}
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+MAX_BUCKETS = 2000
+DEFAULT_GROUP_LIMIT = 10
+
+# Per-product rollup table and bucket column for each granularity
+_BUCKET_TABLES = {
+    'hour': ('hourly_product_sales', 'sale_hour'),
+    'day': ('daily_product_sales', 'sale_date'),
+    'week': ('weekly_product_sales', 'week_start'),
+    'month': ('monthly_product_sales', 'sale_month'),
+}
+
+# Ungrouped day/week/month charts only need the one-row-per-day summary
+_TOTAL_BUCKET_SQL = {
+    'day': 'b.sale_date',
+    # Monday of the ISO week
+    'week': "date(b.sale_date, '-' || ((CAST(strftime('%w', b.sale_date) AS INTEGER) + 6) % 7) || ' days')",
+    'month': 'substr(b.sale_date, 1, 7)',
+}
+
+# group_by -> (joins, key expression, label expression); grouping uses the
+# product's current category and supplier
+_GROUPS = {
+    'product': ('LEFT JOIN products p ON p.id = b.product_id',
+                'b.product_id', "COALESCE(p.name, 'Unknown product')"),
+    'category': ('LEFT JOIN products p ON p.id = b.product_id',
+                 "COALESCE(NULLIF(p.category, ''), 'Uncategorised')",
+                 "COALESCE(NULLIF(p.category, ''), 'Uncategorised')"),
+    'supplier': ('LEFT JOIN products p ON p.id = b.product_id LEFT JOIN suppliers s ON s.id = p.supplier_id',
+                 'COALESCE(p.supplier_id, 0)', "COALESCE(s.name, 'No supplier')"),
+}
+GROUP_BY = tuple(_GROUPS)
+
+
+def default_start(granularity, end):
+    """Start of the default window ending on the date end"""
+    if granularity == 'hour':
+        return end - timedelta(days=1)
+    if granularity == 'day':
+        return end - timedelta(days=29)
+    if granularity == 'week':
+        return end - timedelta(weeks=11)
+    month = end.year * 12 + end.month - 1 - 11
+    return end.replace(year=month // 12, month=month % 12 + 1, day=1)
+
+
+def bucket_keys(granularity, start, end):
+    """Every bucket key from start to end (dates, inclusive), in order"""
+    if granularity == 'month':
+        keys = []
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            keys.append(f'{year:04d}-{month:02d}')
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return keys
+
+    if granularity == 'week':
+        day, step = start - timedelta(days=start.weekday()), timedelta(weeks=1)
+    else:
+        day, step = start, timedelta(days=1)
+    days = []
+    while day <= end:
+        days.append(day.isoformat())
+        day += step
+    if granularity == 'hour':
+        return [f'{day} {hour:02d}' for day in days for hour in range(24)]
+    return days
+
+
+def whole_buckets(granularity, start, end):
+    """(start, end) widened to whole weeks or months"""
+    if granularity == 'week':
+        return start - timedelta(days=start.weekday()), end + timedelta(days=6 - end.weekday())
+    if granularity == 'month':
+        next_month = (end.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return start.replace(day=1), next_month - timedelta(days=1)
+    return start, end
+
+
+def check_timeseries(metric, granularity, start, end, group_by=None):
+    """Raise ValueError for unknown options or a range of more than MAX_BUCKETS"""
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    if group_by is not None and group_by not in _GROUPS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+    if start > end:
+        raise ValueError('start must not be after end')
+    buckets = bucket_keys(granularity, start, end)
+    if len(buckets) > MAX_BUCKETS:
+        raise ValueError(f'Range has {len(buckets)} buckets; the limit is {MAX_BUCKETS}')
+    return buckets
+
+
+def timeseries(conn, metric, granularity, start, end, group_by=None, limit=DEFAULT_GROUP_LIMIT):
+    """Zero-filled series of one metric per bucket, optionally one per group
+
+    start and end are dates (inclusive), widened to whole weeks or months for
+    those granularities; see check_timeseries for the errors.
+    """
+    buckets = check_timeseries(metric, granularity, start, end, group_by)
+    column = METRICS[metric]
+    if group_by is None and granularity != 'hour':
+        table, bucket = 'daily_sales_summary', _TOTAL_BUCKET_SQL[granularity]
+        where = 'b.sale_date BETWEEN ? AND ?'
+        params = [day.isoformat() for day in whole_buckets(granularity, start, end)]
+    else:
+        table, bucket = _BUCKET_TABLES[granularity]
+        bucket = f'b.{bucket}'
+        where, params = f'{bucket} >= ? AND {bucket} <= ?', [buckets[0], buckets[-1]]
+
+    if group_by is None:
+        joins, key, label = '', "'total'", "'Total'"
+    else:
+        joins, key, label = _GROUPS[group_by]
+
+    # Only the largest groups are returned; the rest are left out rather than
+    # lumped together, and their buckets are never read back into Python
+    top = ''
+    if group_by is not None:
+        top = f"""
+            AND {key} IN (
+                SELECT {key} FROM {table} b {joins} WHERE {where}
+                GROUP BY {key} ORDER BY SUM(b.{column}) DESC LIMIT ?
+            )
+        """
+        params = params + params + [limit]
+
+    rows = conn.execute(f"""
+        SELECT {bucket} AS bucket, {key} AS group_key, {label} AS group_label, SUM(b.{column})
+        FROM {table} b
+        {joins}
+        WHERE {where} {top}
+        GROUP BY bucket, group_key
+    """, params).fetchall()
+
+    groups = {}
+    for bucket, group_key, group_label, value in rows:
+        group = groups.setdefault(group_key, {'key': group_key, 'label': group_label, 'total': 0, 'points': {}})
+        group['points'][bucket] = value or 0
+        group['total'] += value or 0
+
+    ranked = sorted(groups.values(), key=lambda group: group['total'], reverse=True)
+    if group_by is None and not ranked:
+        ranked = [{'key': 'total', 'label': 'Total', 'total': 0, 'points': {}}]
+
+    def number(value):
+        return int(value) if metric == 'units' else round(value, 2)
+
+    return {
+        'metric': metric,
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'group_by': group_by,
+        'buckets': [f'{bucket}:00' for bucket in buckets] if granularity == 'hour' else buckets,
+        'series': [
+            {
+                'key': group['key'],
+                'label': group['label'],
+                'total': number(group['total']),
+                'values': [number(group['points'].get(bucket, 0)) for bucket in buckets],
+            }
+            for group in ranked
+        ],
+    }
+
+
+# -----------------------------------------------------------------------------------------
+# VELOCITY AND REORDER SUGGESTIONS
+# -----------------------------------------------------------------------------------------
+SHORT_WINDOW_DAYS = 7
+LONG_WINDOW_DAYS = 28
+LEAD_TIME_DAYS = 7       # assumed supplier delivery time
+ORDER_COVER_DAYS = 14    # an order should last this long after it arrives
+
+
+def sales_velocity(conn, today, changed_since=None):
+    """Units sold per day by product over the last 7 and 28 days (up to today)
+
+    Returns (product_ids, ma7, ma28): product_ids ascending, and the two
+    moving averages aligned with it. Arrays when numpy is available, lists
+    otherwise. Only products that sold in the window are included, and with
+    changed_since only those whose change_seq is above it.
+    """
+    first_day = today - timedelta(days=LONG_WINDOW_DAYS - 1)
+    short_start = (today - timedelta(days=SHORT_WINDOW_DAYS - 1)).isoformat()
+    params = [short_start, first_day.isoformat(), today.isoformat()]
+    changed = ""
+    if changed_since is not None:
+        changed = "AND product_id IN (SELECT id FROM products WHERE change_seq > ?)"
+        params.append(changed_since)
+    rows = conn.execute(f"""
+        SELECT product_id, sale_date >= ?, quantity
+        FROM daily_product_sales
+        WHERE sale_date BETWEEN ? AND ? AND product_id > 0 {changed}
+        ORDER BY product_id
+    """, params).fetchall()
+
+    if numpy is not None:
+        if not rows:
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0), numpy.zeros(0)
+        # One column per field, then one bincount per window
+        sale_ids, recent, quantity = (numpy.array(column) for column in zip(*rows))
+        product_ids, index = numpy.unique(sale_ids, return_inverse=True)
+        long_sum = numpy.bincount(index, weights=quantity.astype(float), minlength=len(product_ids))
+        short_sum = numpy.bincount(index, weights=quantity * (recent == 1), minlength=len(product_ids))
+        return product_ids, short_sum / SHORT_WINDOW_DAYS, long_sum / LONG_WINDOW_DAYS
+
+    product_ids, short_sums, long_sums = [], [], []
+    for product_id, recent, quantity in rows:
+        if not product_ids or product_ids[-1] != product_id:
+            product_ids.append(product_id)
+            short_sums.append(0)
+            long_sums.append(0)
+        long_sums[-1] += quantity
+        if recent:
+            short_sums[-1] += quantity
+    return (product_ids, [total / SHORT_WINDOW_DAYS for total in short_sums],
+            [total / LONG_WINDOW_DAYS for total in long_sums])
+
+
+class ReorderPlan:
+    """Forecast columns for a set of products, aligned by position
+
+    plan.get(product_id) gives {'ma7', 'ma28', 'velocity', 'days_of_cover',
+    'reorder_qty'} for one product; days_of_cover is None when it is not selling.
+    """
+
+    FIELDS = ('ma7', 'ma28', 'velocity', 'days_of_cover', 'reorder_qty')
+
+    def __init__(self, product_ids, columns):
+        self.product_ids = product_ids
+        self.columns = columns
+        self._positions = {product_id: position for position, product_id in enumerate(product_ids)}
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def __contains__(self, product_id):
+        return product_id in self._positions
+
+    def __getitem__(self, product_id):
+        position = self._positions[product_id]
+        return {name: self.columns[name][position] for name in self.FIELDS}
+
+    def get(self, product_id, default=None):
+        return self[product_id] if product_id in self._positions else default
+
+    def updated(self, changes):
+        """Copy of the plan with the products of another ReorderPlan replaced or added"""
+        product_ids = list(self.product_ids)
+        columns = {name: list(self.columns[name]) for name in self.FIELDS}
+        for product_id in changes.product_ids:
+            row = changes[product_id]
+            position = self._positions.get(product_id)
+            if position is None:
+                product_ids.append(product_id)
+                for name in self.FIELDS:
+                    columns[name].append(row[name])
+            else:
+                for name in self.FIELDS:
+                    columns[name][position] = row[name]
+        return ReorderPlan(product_ids, columns)
+
+    def running_out(self, max_days, limit):
+        """Ids of selling products with at most max_days of cover, soonest first"""
+        covers = self.columns['days_of_cover']
+        candidates = [(cover, product_id) for product_id, cover in zip(self.product_ids, covers)
+                      if cover is not None and cover <= max_days]
+        return [product_id for _, product_id in sorted(candidates)[:limit]]
+
+
+def reorder_plan(velocity, stock_rows):
+    """ReorderPlan for (product_id, stock, min_stock) rows, one vectorized pass
+
+    The forecast daily demand blends the 7 and 28 day averages. An order should
+    cover the lead time plus ORDER_COVER_DAYS of demand on top of min_stock.
+    """
+    product_ids, ma7, ma28 = velocity
+    horizon = LEAD_TIME_DAYS + ORDER_COVER_DAYS
+    if not stock_rows:
+        return ReorderPlan([], {name: [] for name in ReorderPlan.FIELDS})
+
+    if numpy is not None:
+        ids, stock, min_stock = (numpy.array(column, dtype=float) for column in zip(*stock_rows))
+        ids = ids.astype(numpy.int64)
+        min_stock = numpy.nan_to_num(min_stock)
+        # Line each product up with its row in the velocity arrays (0 if it did not sell)
+        short = numpy.zeros(len(ids))
+        long = numpy.zeros(len(ids))
+        if len(product_ids):
+            position = numpy.clip(numpy.searchsorted(product_ids, ids), 0, len(product_ids) - 1)
+            sold = product_ids[position] == ids
+            short[sold] = ma7[position[sold]]
+            long[sold] = ma28[position[sold]]
+        forecast = (short + long) / 2
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            cover = numpy.where(forecast > 0, numpy.maximum(stock, 0) / forecast, numpy.nan).round(1)
+        reorder = numpy.ceil(numpy.maximum(forecast * horizon + min_stock - stock, 0).round(6)).astype(int)
+        return ReorderPlan(ids.tolist(), {
+            'ma7': short.round(2).tolist(),
+            'ma28': long.round(2).tolist(),
+            'velocity': forecast.round(2).tolist(),
+            'days_of_cover': [None if math.isnan(days) else days for days in cover.tolist()],
+            'reorder_qty': reorder.tolist(),
+        })
+
+    averages = dict(zip(product_ids, zip(ma7, ma28)))
+    columns = {name: [] for name in ReorderPlan.FIELDS}
+    for product_id, stock, min_stock in stock_rows:
+        short, long = averages.get(product_id, (0.0, 0.0))
+        forecast = (short + long) / 2
+        columns['ma7'].append(round(short, 2))
+        columns['ma28'].append(round(long, 2))
+        columns['velocity'].append(round(forecast, 2))
+        columns['days_of_cover'].append(round(max(stock, 0) / forecast, 1) if forecast > 0 else None)
+        columns['reorder_qty'].append(math.ceil(round(max(forecast * horizon + (min_stock or 0) - stock, 0), 6)))
+    return ReorderPlan([row[0] for row in stock_rows], columns)
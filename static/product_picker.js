@@ -0,0 +1,48 @@
+// Type-ahead product picker backed by /api/products/search, for forms that
+// would otherwise list the whole catalogue in a <select>. The visible text
+// input carries a datalist of matches; choosing one writes the product id
+// into the hidden input and calls onSelect(product), or onSelect(null) when
+// the text no longer names a product.
+function productLabel(product) {
+    return product.barcode ? `${product.name} (${product.barcode})` : `${product.name} #${product.id}`;
+}
+
+function productPicker(input, hidden, onSelect) {
+    const list = document.getElementById(input.getAttribute('list'));
+    let matches = new Map();
+    let timer = null;
+
+    input.addEventListener('input', () => {
+        const product = matches.get(input.value);
+        if (product) {
+            hidden.value = product.id;
+            if (onSelect) onSelect(product);
+            return;
+        }
+        if (hidden.value) {
+            hidden.value = '';
+            if (onSelect) onSelect(null);
+        }
+
+        clearTimeout(timer);
+        const q = input.value.trim();
+        if (q.length < 2) {
+            list.innerHTML = '';
+            return;
+        }
+        timer = setTimeout(() => {
+            fetch('/api/products/search?q=' + encodeURIComponent(q))
+                .then(response => response.json())
+                .then(data => {
+                    list.innerHTML = '';
+                    matches = new Map();
+                    data.results.forEach(product => {
+                        const option = document.createElement('option');
+                        option.value = productLabel(product);
+                        matches.set(option.value, product);
+                        list.appendChild(option);
+                    });
+                });
+        }, 150);
+    });
+}
@@ -0,0 +1,219 @@
+"""
+Live event stream server
+Serves /api/stream from one asyncio process, so an open dashboard costs a
+socket and a small queue instead of a WSGI worker thread. Run it next to the
+WSGI workers and have the proxy send /api/stream to it:
+
+    python stream_server.py        # listens on STREAM_BIND, default 0.0.0.0:8001
+
+It tails the same live_events log as the workers and reads the same signed
+session cookie, so it needs the same DATABASE and SECRET_KEY (APP_CONFIG
+picks the config object, production by default).
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import queue
+import sys
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from werkzeug.http import parse_cookie
+
+import db
+import events
+from app import create_app
+
+try:
+    import resource
+except ImportError:      # Windows: no file descriptor limit to raise
+    resource = None
+
+STREAM_PATH = '/api/stream'
+HEADER_TIMEOUT = 10.0        # seconds a client gets to send its request headers
+RETRY_AFTER = 15
+
+logger = logging.getLogger('inventory.stream_server')
+
+
+class LoopQueue:
+    """Frames put by the broker's tail thread, awaited on the event loop
+
+    put_nowait matches queue.Queue's, so EventBroker fans out to it as it
+    does to a WSGI stream's queue; Full drops the client the same way.
+    """
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.maxsize = maxsize
+        self.frames = collections.deque()
+        self.ready = asyncio.Event()
+
+    def put_nowait(self, frame):
+        if len(self.frames) >= self.maxsize:
+            raise queue.Full
+        self.frames.append(frame)
+        self.loop.call_soon_threadsafe(self.ready.set)
+
+    async def get(self, timeout):
+        """Next frame; raises asyncio.TimeoutError after timeout seconds without one"""
+        while not self.frames:
+            # Cleared on the loop, so a set() scheduled by a later put always lands after it
+            self.ready.clear()
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        return self.frames.popleft()
+
+
+class StreamServer:
+    """The /api/stream endpoint of app, served from an event loop"""
+
+    def __init__(self, app):
+        self.app = app
+        self.heartbeat = app.config['EVENT_HEARTBEAT_SECONDS']
+        self.sessions = app.session_interface.get_signing_serializer(app)
+        self.session_max_age = int(app.permanent_session_lifetime.total_seconds())
+        self.loop = None
+        self.broker = None
+        self.server = None
+        # Replays read the log; one thread with its own connection keeps that off the loop
+        self._executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='stream-subscribe')
+        self._conn = None
+
+    async def start(self, host, port):
+        self.loop = asyncio.get_running_loop()
+        self.broker = events.EventBroker(
+            self.app.config['DATABASE'], pragmas=db.build_pragmas(self.app.config),
+            max_subscribers=self.app.config['STREAM_MAX_STREAMS'],
+            poll_seconds=self.app.config['EVENT_POLL_SECONDS'],
+            queue_factory=lambda size: LoopQueue(self.loop, size))
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    def _subscribe(self, last_event_id):
+        if self._conn is None:
+            self._conn = db.connect(self.app.config['DATABASE'], db.build_pragmas(self.app.config))
+        return self.broker.subscribe(self._conn, last_event_id)
+
+    def session(self, cookie_header):
+        """The Flask session in a Cookie header, {} if missing, expired or forged"""
+        cookie = parse_cookie(cookie_header).get(self.app.config['SESSION_COOKIE_NAME'])
+        if not cookie:
+            return {}
+        try:
+            return self.sessions.loads(cookie, max_age=self.session_max_age)
+        except Exception:
+            return {}
+
+    # Connections -----------------------------------------------------------------------
+    async def handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), HEADER_TIMEOUT)
+            await self.respond(head.decode('latin-1'), writer)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception:
+            logger.exception('Event stream failed')
+        finally:
+            writer.close()
+
+    async def respond(self, head, writer):
+        request_line, *header_lines = head.rstrip('\r\n').split('\r\n')
+        try:
+            method, target, _ = request_line.split(' ')
+            headers = {name.strip().lower(): value.strip()
+                       for name, value in (line.split(':', 1) for line in header_lines)}
+        except ValueError:
+            return await self.error(writer, 400, 'Malformed request')
+
+        url = urlsplit(target)
+        if url.path != STREAM_PATH:
+            return await self.error(writer, 404, 'Not found')
+        if method != 'GET':
+            return await self.error(writer, 405, 'Only GET is allowed')
+        if 'user_id' not in self.session(headers.get('cookie', '')):
+            return await self.error(writer, 401, 'Please log in')
+
+        last_event_id = headers.get('last-event-id') or parse_qs(url.query).get('last_event_id', [None])[0]
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            return await self.error(writer, 400, 'Invalid Last-Event-ID')
+
+        try:
+            subscription = await self.loop.run_in_executor(self._executor, self._subscribe, last_event_id)
+        except events.TooManySubscribers as e:
+            return await self.error(writer, 503, str(e), {'Retry-After': str(RETRY_AFTER)})
+
+        try:
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                         b'X-Accel-Buffering: no\r\nConnection: close\r\n\r\n')
+            await self.stream(subscription, writer)
+        finally:
+            self.broker.unsubscribe(subscription)
+
+    async def stream(self, subscription, writer):
+        """Same frames as EventBroker.stream: retry, replay, then live frames and keepalives"""
+        writer.write(f"retry: {events.RETRY_MS}\n\n".encode())
+        writer.writelines(subscription.backlog)
+        subscription.backlog = None
+        await writer.drain()
+        while True:
+            try:
+                # Once dropped, flush what is queued and end the stream
+                frame = await subscription.queue.get(0 if subscription.overflowed else self.heartbeat)
+            except asyncio.TimeoutError:
+                if subscription.overflowed:
+                    return
+                frame = b": keepalive\n\n"
+            writer.write(frame)
+            await writer.drain()
+
+    async def error(self, writer, status, message, headers=None):
+        body = json.dumps({'error': message}).encode()
+        lines = [f'HTTP/1.1 {status} {HTTPStatus(status).phrase}', 'Content-Type: application/json',
+                 f'Content-Length: {len(body)}', 'Connection: close']
+        lines.extend(f'{name}: {value}' for name, value in (headers or {}).items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        await writer.drain()
+
+
+def raise_file_limit(streams):
+    """Let the process hold a socket per stream; the soft limit is often only 1024"""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = streams + 64
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted if hard == resource.RLIM_INFINITY else min(wanted, hard),
+                                                    hard))
+
+
+async def serve(app):
+    host, port = app.config['STREAM_BIND'].rsplit(':', 1)
+    server = await StreamServer(app).start(host, int(port))
+    logger.info('Serving %s on %s (up to %s streams)', STREAM_PATH, app.config['STREAM_BIND'],
+                app.config['STREAM_MAX_STREAMS'])
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    app = create_app(os.environ.get('APP_CONFIG', 'production'))
+    raise_file_limit(app.config['STREAM_MAX_STREAMS'])
+    try:
+        asyncio.run(serve(app))
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
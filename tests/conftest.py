@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+# The app is a set of top-level modules, not an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as inventory  # noqa: E402
+import config  # noqa: E402
+
+
+@pytest.fixture
+def flask_app(tmp_path):
+    """App on a fresh, migrated database in tmp_path"""
+    class TestConfig(config.TestingConfig):
+        DATABASE = str(tmp_path / 'inventory.db')
+        DB_AUTO_MIGRATE = True
+        PROFILE_DIR = str(tmp_path / 'profiles')
+        ALERT_LOG_PATH = str(tmp_path / 'alerts.log')
+
+    application = inventory.create_app(TestConfig)
+    yield application
+    with application.app_context():
+        inventory.db.get_pool().close_all()
+
+
+@pytest.fixture
+def client(flask_app):
+    """Test client logged in as the seeded admin"""
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['username'] = 'Mabutsi'
+        session['role'] = 'Mabutsi'
+    return client
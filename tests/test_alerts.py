@@ -0,0 +1,140 @@
+"""
+Stock alerts
+Alerts are decided inside the stock-changing transaction and debounced per
+product; the dispatcher hands the outbox to a notifier and retries failures.
+"""
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import alerts
+import migrations
+
+NOW = '2026-03-01 12:00:00'
+
+
+class StubNotifier:
+    """Records alerts; the first `failures` sends raise"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+        self.delivered = threading.Event()
+
+    def send(self, alert):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('notifier down')
+        self.sent.append(alert)
+        self.delivered.set()
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = str(tmp_path / 'alerts.db')
+    conn = sqlite3.connect(database)
+    migrations.migrate(conn)
+    conn.execute("INSERT INTO products (id, name, cost, price, stock, min_stock) VALUES (1, 'Tea', 1, 2, 3, 5)")
+    conn.commit()
+    conn.close()
+    return database
+
+
+@pytest.fixture
+def conn(database):
+    conn = sqlite3.connect(database)
+    yield conn
+    conn.close()
+
+
+def outbox(conn):
+    return conn.execute("SELECT product_id, stock, threshold, created_at FROM alert_outbox ORDER BY id").fetchall()
+
+
+def test_debounce_window(conn):
+    assert alerts.evaluate(conn, [1], NOW, debounce_seconds=3600) == 1
+    assert alerts.evaluate(conn, [1], '2026-03-01 12:59:59', debounce_seconds=3600) == 0
+    assert alerts.evaluate(conn, [1], '2026-03-01 13:00:00', debounce_seconds=3600) == 1
+    assert [row[3] for row in outbox(conn)] == [NOW, '2026-03-01 13:00:00']
+
+
+def test_recovery_rearms_inside_the_window(conn):
+    alerts.evaluate(conn, [1], NOW)
+    conn.execute("UPDATE products SET stock = 20 WHERE id = 1")
+    assert alerts.evaluate(conn, [1], '2026-03-01 12:01:00') == 0
+    conn.execute("UPDATE products SET stock = 2 WHERE id = 1")
+    assert alerts.evaluate(conn, [1], '2026-03-01 12:02:00') == 1
+
+
+def test_outbox_rolls_back_with_the_stock_change(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("UPDATE products SET stock = 1 WHERE id = 1")
+    assert alerts.evaluate(conn, [1], NOW) == 1
+    conn.execute("ROLLBACK")
+
+    assert outbox(conn) == []
+    assert conn.execute("SELECT COUNT(*) FROM stock_alerts WHERE last_alert_sent IS NOT NULL").fetchone() == (0,)
+
+
+def test_checkout_writes_alert_only_when_the_basket_commits(flask_app, client):
+    for name, stock in (('Tea', 6), ('Coffee', 1)):
+        client.post('/add_product', data={'name': name, 'cost': '1', 'price': '2', 'stock': str(stock),
+                                          'min_stock': '5', 'barcode': name.upper()})
+    conn = sqlite3.connect(flask_app.config['DATABASE'])
+    try:
+        # Tea would drop below min_stock, but Coffee is short, so nothing commits
+        response = client.post('/api/checkout', json={'items': [{'barcode': 'TEA', 'quantity': 2},
+                                                                {'barcode': 'COFFEE', 'quantity': 2}]})
+        assert response.status_code == 409
+        assert outbox(conn) == []
+
+        response = client.post('/api/checkout', json={'items': [{'barcode': 'TEA', 'quantity': 2}]})
+        assert response.status_code == 200
+        assert [(row[1], row[2], row[3]) for row in outbox(conn)] == [(4, 5, response.get_json()['sale_time'])]
+    finally:
+        conn.close()
+
+
+def test_failed_delivery_is_retried(conn):
+    alerts.evaluate(conn, [1], NOW)
+    conn.commit()
+    notifier = StubNotifier(failures=1)
+
+    assert alerts.deliver_pending(conn, notifier) == 0
+    assert conn.execute("SELECT delivered_at, attempts, last_error FROM alert_outbox").fetchone() == \
+        (None, 1, 'notifier down')
+
+    assert alerts.deliver_pending(conn, notifier) == 1
+    assert [alert['product_name'] for alert in notifier.sent] == ['Tea']
+    assert alerts.deliver_pending(conn, notifier) == 0
+
+
+def test_delivery_gives_up_after_max_attempts(conn):
+    alerts.evaluate(conn, [1], NOW)
+    conn.commit()
+    notifier = StubNotifier(failures=alerts.MAX_ATTEMPTS + 1)
+    for _ in range(alerts.MAX_ATTEMPTS + 1):
+        alerts.deliver_pending(conn, notifier)
+
+    assert notifier.failures == 1
+    assert conn.execute("SELECT attempts FROM alert_outbox").fetchone() == (alerts.MAX_ATTEMPTS,)
+
+
+def test_dispatcher_retries_on_its_next_poll(database, conn):
+    alerts.evaluate(conn, [1], NOW)
+    conn.commit()
+    notifier = StubNotifier(failures=1)
+    dispatcher = alerts.AlertDispatcher(database, notifier, poll_seconds=0.05)
+
+    dispatcher.wake()
+    assert notifier.delivered.wait(5)
+    deadline = time.monotonic() + 5
+    while dispatcher.delivered < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert dispatcher.delivered == 1
+    assert len(notifier.sent) == 1
+    assert conn.execute("SELECT attempts, delivered_at IS NOT NULL FROM alert_outbox").fetchone() == (1, 1)
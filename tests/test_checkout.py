@@ -0,0 +1,101 @@
+"""
+Basket checkout
+Stock is taken with a conditional UPDATE inside one write transaction per
+basket: concurrent tills never oversell, a failing line undoes the whole
+basket, and in a group commit it undoes only its own job.
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+import db
+
+TILLS = 24
+
+
+def add_product(client, name, stock):
+    client.post('/add_product', data={'name': name, 'cost': '1', 'price': '2', 'stock': str(stock),
+                                      'barcode': name.upper()})
+
+
+def query(flask_app, sql, parameters=()):
+    conn = sqlite3.connect(flask_app.config['DATABASE'])
+    rows = conn.execute(sql, parameters).fetchall()
+    conn.close()
+    return rows
+
+
+def till(flask_app):
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+    return client
+
+
+@pytest.mark.parametrize('write_queue', [True, False])
+def test_concurrent_checkouts_never_oversell(flask_app, client, write_queue):
+    flask_app.config['DB_WRITE_QUEUE'] = write_queue
+    add_product(client, 'Tea', 10)
+    tills = [till(flask_app) for _ in range(TILLS)]
+    start = threading.Barrier(TILLS)
+    statuses = []
+
+    def checkout(till_client):
+        start.wait()
+        response = till_client.post('/api/checkout', json={'items': [{'barcode': 'TEA', 'quantity': 1}]})
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=checkout, args=(till_client,)) for till_client in tills]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert sorted(statuses) == [200] * 10 + [409] * (TILLS - 10)
+    assert query(flask_app, "SELECT stock FROM products WHERE barcode = 'TEA'") == [(0,)]
+    assert query(flask_app, "SELECT COUNT(*), SUM(quantity) FROM sales") == [(10, 10)]
+
+
+def test_basket_rolls_back_when_one_line_is_short(flask_app, client):
+    add_product(client, 'Tea', 5)
+    add_product(client, 'Coffee', 1)
+
+    response = client.post('/api/checkout', json={'items': [{'barcode': 'TEA', 'quantity': 2},
+                                                            {'barcode': 'COFFEE', 'quantity': 3}]})
+    assert response.status_code == 409
+    assert 'Coffee' in response.get_json()['error']
+
+    assert query(flask_app, "SELECT barcode, stock FROM products ORDER BY id") == [('TEA', 5), ('COFFEE', 1)]
+    assert query(flask_app, "SELECT COUNT(*) FROM sales") == [(0,)]
+    assert query(flask_app, "SELECT COUNT(*) FROM sale_transactions") == [(0,)]
+    assert query(flask_app, "SELECT COUNT(*) FROM live_events WHERE event_type = 'sale'") == [(0,)]
+
+
+def test_failed_job_in_group_commit_only_undoes_itself(tmp_path):
+    database = str(tmp_path / 'group.db')
+    conn = sqlite3.connect(database)
+    conn.execute("CREATE TABLE notes (body TEXT)")
+    conn.close()
+
+    def write(conn, body, fail=False):
+        conn.execute("INSERT INTO notes (body) VALUES (?)", (body,))
+        if fail:
+            raise ValueError(body)
+        return body
+
+    writer = db.WriteQueue(database, group_window=0.5, group_max=3)
+    futures = [writer.submit(write, 'kept'), writer.submit(write, 'undone', fail=True),
+               writer.submit(write, 'also kept')]
+
+    assert futures[0].result(10) == 'kept'
+    with pytest.raises(ValueError):
+        futures[1].result(10)
+    assert futures[2].result(10) == 'also kept'
+    stats = writer.stats()
+    assert (stats['batches'], stats['largest_batch'], stats['committed'], stats['failed']) == (1, 3, 2, 1)
+
+    conn = sqlite3.connect(database)
+    assert conn.execute("SELECT body FROM notes ORDER BY rowid").fetchall() == [('kept',), ('also kept',)]
+    conn.close()
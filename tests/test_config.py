@@ -0,0 +1,23 @@
+"""
+Production sizing
+The stream cap and thread counts follow EVENT_TARGET_STREAMS, so the
+workers together can hold the target number of open dashboards.
+"""
+
+import pytest
+
+import config
+
+
+@pytest.mark.parametrize('workers', [1, 3, 9, 17])
+def test_worker_threads_cover_the_stream_target(monkeypatch, workers):
+    monkeypatch.setenv('WEB_CONCURRENCY', str(workers))
+    monkeypatch.delenv('GUNICORN_THREADS', raising=False)
+    streams_per_worker = config.worker_threads(1000) - config.REQUEST_THREADS
+    assert streams_per_worker * workers >= 1000
+    assert (streams_per_worker - 1) * workers < 1000
+
+
+def test_gunicorn_threads_overrides_the_sizing(monkeypatch):
+    monkeypatch.setenv('GUNICORN_THREADS', '24')
+    assert config.worker_threads(1000) == 24
@@ -0,0 +1,60 @@
+"""
+Bulk product import
+A file whose overall shape is wrong is reported as a parse error, not a 500.
+"""
+
+import io
+import json
+import sqlite3
+
+import pytest
+
+import import_products
+
+
+def upload(client, name, body):
+    return client.post('/import_products', data={'file': (io.BytesIO(body), name)},
+                       headers={'Accept': 'application/json'}, content_type='multipart/form-data')
+
+
+@pytest.mark.parametrize('document', [
+    {'items': [{'name': 'Tea', 'cost': 1, 'price': 2, 'barcode': 'T-1'}]},
+    42,
+    'products',
+    {'products': {'name': 'Tea'}},
+])
+def test_json_with_wrong_top_level_shape_is_rejected(client, document):
+    response = upload(client, 'catalogue.json', json.dumps(document).encode())
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report['imported'] == 0
+    assert report['errors'][0]['error'].startswith('Could not parse file: JSON must be an array')
+
+
+@pytest.mark.parametrize('document', [
+    [{'name': 'Tea', 'cost': 1, 'price': 2, 'barcode': 'T-1'}],
+    {'products': [{'name': 'Tea', 'cost': 1, 'price': 2, 'barcode': 'T-1'}]},
+])
+def test_json_array_or_products_object_is_accepted(client, document):
+    report = upload(client, 'catalogue.json', json.dumps(document).encode()).get_json()
+    assert report['imported'] == 1 and not report['errors']
+
+
+def test_iter_records_raises_value_error_for_scalar():
+    with pytest.raises(ValueError):
+        list(import_products.iter_records(io.StringIO('42'), 'json'))
+
+
+def test_import_keeps_search_and_change_seq_current(flask_app, client):
+    upload(client, 'catalogue.csv', b'name,cost,price,barcode\nGreen tea,1,2,T-1\nCoffee,1,3,C-1\n')
+    upload(client, 'catalogue.csv', b'name,cost,price,barcode\nJasmine tea,1,2,T-1\nCoffee,1,3,C-1\n')
+
+    found = client.get('/api/products/search?q=jasmine').get_json()['results']
+    assert [product['barcode'] for product in found] == ['T-1']
+    assert client.get('/api/products/search?q=green').get_json()['results'] == []
+
+    conn = sqlite3.connect(flask_app.config['DATABASE'])
+    seqs = dict(conn.execute("SELECT barcode, change_seq FROM products"))
+    pending = conn.execute("SELECT COUNT(*) FROM bulk_load").fetchone()[0]
+    conn.close()
+    assert seqs['T-1'] > seqs['C-1'] and pending == 0
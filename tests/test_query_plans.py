@@ -0,0 +1,112 @@
+"""
+Query plans for the hot routes
+Each route is requested through the test client and the statements it ran
+are captured with sql_metrics, so the plans checked are the ones the route
+really uses. Each query must stay on the index added for it in migrations;
+a full table scan here is what made these pages slow on a large catalogue.
+"""
+
+import sqlite3
+from datetime import date
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def run_route(flask_app, client):
+    """GET a route; returns the (sql, parameters) it ran that contain a fragment"""
+    if not flask_app.config['SQL_METRICS']:
+        pytest.skip('statements are only captured with SQL_METRICS=1')
+    captured = []
+
+    @flask_app.before_request
+    def capture_statements():
+        captured.append(app.sql_metrics.capture_statements())
+
+    def run(path, fragment, **args):
+        captured.clear()
+        response = client.get(path, query_string=args)
+        assert response.status_code == 200, response.data
+        response.close()
+        matches = [(sql, parameters) for sql, parameters, _ in captured[0] if fragment in sql]
+        assert len(matches) == 1, [sql for sql, _, _ in captured[0]]
+        return matches[0]
+
+    return run
+
+
+@pytest.fixture
+def conn(flask_app):
+    conn = sqlite3.connect(flask_app.config['DATABASE'])
+    yield conn
+    conn.close()
+
+
+def plan(conn, sql, parameters=()):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters or ())]
+
+
+def uses_index(details, index):
+    return any(f'USING INDEX {index}' in detail or f'USING COVERING INDEX {index}' in detail
+               for detail in details)
+
+
+def sorts(details):
+    return any('TEMP B-TREE' in detail for detail in details)
+
+
+CURSOR = app.encode_sales_cursor('2026-01-31 12:00:00', 42)
+
+
+@pytest.mark.parametrize('args', [
+    {},
+    {'cursor': CURSOR},
+    {'start': date(2026, 1, 1).isoformat(), 'end': date(2026, 1, 31).isoformat()},
+])
+@pytest.mark.parametrize('path', ['/sales_history', '/api/sales'])
+def test_sales_history_page_walks_sale_time_index(run_route, conn, path, args):
+    details = plan(conn, *run_route(path, 'FROM sales s', **args))
+    assert uses_index(details, 'idx_sales_sale_time'), details
+    assert not sorts(details), details
+
+
+@pytest.mark.parametrize('filters, index', [
+    ({'product_id': 7}, 'idx_sales_product_time'),
+    ({'category': 'Dairy'}, 'idx_sales_category_time'),
+])
+@pytest.mark.parametrize('cursor', [None, CURSOR])
+def test_filtered_sales_history_page_follows_filter_index(run_route, conn, filters, index, cursor):
+    args = dict(filters, cursor=cursor) if cursor else filters
+    details = plan(conn, *run_route('/api/sales', 'FROM sales s', **args))
+    assert uses_index(details, index), details
+    assert not sorts(details), details
+
+
+def test_sales_export_by_category_follows_category_index(run_route, conn):
+    details = plan(conn, *run_route('/export_sales', 'FROM sales s', category='Dairy'))
+    assert uses_index(details, 'idx_sales_category_time'), details
+    assert not sorts(details), details
+
+
+def test_low_stock_count_uses_partial_index(run_route, conn):
+    details = plan(conn, *run_route('/', 'COUNT(*) FROM products WHERE stock <= min_stock'))
+    assert uses_index(details, 'idx_products_low_stock'), details
+
+
+def test_stock_alerts_low_stock_list_uses_partial_index(run_route, conn):
+    details = plan(conn, *run_route('/stock_alerts', 'WHERE p.stock <= p.min_stock'))
+    assert uses_index(details, 'idx_products_low_stock'), details
+    assert not sorts(details), details
+
+
+def test_purchase_orders_uses_order_date_index(run_route, conn):
+    details = plan(conn, *run_route('/purchase_orders', 'FROM purchase_orders po'))
+    assert uses_index(details, 'idx_purchase_orders_order_date'), details
+    assert not sorts(details), details
+
+
+def test_stock_alert_settings_join_uses_product_index(run_route, conn):
+    details = plan(conn, *run_route('/stock_alerts', 'FROM stock_alerts sa'))
+    assert uses_index(details, 'idx_stock_alerts_product'), details
@@ -0,0 +1,106 @@
+"""
+Reorder forecasts
+numpy is optional, so its vectorized path and the plain Python loops must
+give the same plan; the catalogue plan is updated per changed product
+instead of rebuilt, and must still match a full rebuild.
+"""
+
+import random
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import app as inventory
+import migrations
+import sales_analytics
+
+TODAY = date(2026, 3, 31)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'analytics.db')
+    migrations.migrate(conn)
+    rng = random.Random(18)
+    for product_id in range(1, 61):
+        conn.execute("INSERT INTO products (name, cost, price, stock, min_stock) VALUES (?, 1, 2, ?, ?)",
+                     (f'Product {product_id}', rng.randint(-3, 200), rng.choice([0, 5, 12])))
+    for _ in range(900):
+        # Some products never sell, some only before the 28 day window
+        product_id = rng.randint(1, 45)
+        sold_at = datetime(2026, 3, 31, 20) - timedelta(days=rng.randint(0, 40), hours=rng.randint(0, 12))
+        quantity = rng.randint(1, 7)
+        conn.execute("""
+            INSERT INTO sales (product_id, quantity, total_amount, sale_time, unit_price, unit_cost)
+            VALUES (?, ?, ?, ?, 2, 1)
+        """, (product_id, quantity, quantity * 2, sold_at.strftime('%Y-%m-%d %H:%M:%S')))
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def plan(conn):
+    stock_rows = conn.execute("SELECT id, stock, min_stock FROM products ORDER BY id").fetchall()
+    return sales_analytics.reorder_plan(sales_analytics.sales_velocity(conn, TODAY), stock_rows)
+
+
+def rows(plan):
+    return {product_id: plan[product_id] for product_id in plan.product_ids}
+
+
+def test_numpy_and_python_paths_give_the_same_plan(conn, monkeypatch):
+    pytest.importorskip('numpy')
+    with_numpy = plan(conn)
+    monkeypatch.setattr(sales_analytics, 'numpy', None)
+    without_numpy = plan(conn)
+
+    assert with_numpy.product_ids == without_numpy.product_ids
+    assert rows(with_numpy) == rows(without_numpy)
+    assert with_numpy.running_out(7, 10) == without_numpy.running_out(7, 10)
+
+
+def test_python_path_forecast(conn, monkeypatch):
+    monkeypatch.setattr(sales_analytics, 'numpy', None)
+    conn.execute("INSERT INTO products (id, name, cost, price, stock, min_stock) VALUES (100, 'Tea', 1, 2, 10, 5)")
+    for days_ago, quantity in ((0, 14), (10, 28), (30, 99)):
+        conn.execute("""
+            INSERT INTO sales (product_id, quantity, total_amount, sale_time, unit_price, unit_cost)
+            VALUES (100, ?, 0, ?, 2, 1)
+        """, (quantity, f'{TODAY - timedelta(days=days_ago)} 12:00:00'))
+
+    # 14 units in 7 days and 42 in 28: 2 and 1.5 a day, forecast 1.75
+    assert plan(conn)[100] == {'ma7': 2.0, 'ma28': 1.5, 'velocity': 1.75, 'days_of_cover': 5.7,
+                               'reorder_qty': 32}
+
+
+def test_updated_replaces_changed_products_only(conn):
+    full = plan(conn)
+    conn.execute("UPDATE products SET stock = 0 WHERE id = 3")
+    changed = sales_analytics.reorder_plan(sales_analytics.sales_velocity(conn, TODAY),
+                                           conn.execute("SELECT id, stock, min_stock FROM products WHERE id = 3").fetchall())
+    assert rows(full.updated(changed)) == rows(plan(conn))
+
+
+def test_catalogue_plan_follows_sales_without_full_rebuild(flask_app, client, monkeypatch):
+    for name in ('Tea', 'Coffee'):
+        client.post('/add_product', data={'name': name, 'cost': '1', 'price': '2', 'stock': '50',
+                                          'min_stock': '5', 'barcode': name.upper()})
+    client.post('/api/checkout', json={'items': [{'barcode': 'TEA', 'quantity': 3}]})
+
+    built = []
+    full_plan = inventory.reorder_plan
+    monkeypatch.setattr(inventory, 'reorder_plan', lambda stock_rows: built.append(len(stock_rows)) or full_plan(stock_rows))
+
+    with flask_app.test_request_context():
+        before = inventory.catalogue_reorder_plan()
+    client.post('/api/checkout', json={'items': [{'barcode': 'COFFEE', 'quantity': 20}]})
+    with flask_app.test_request_context():
+        after = inventory.catalogue_reorder_plan()
+        assert inventory.catalogue_reorder_plan() is after
+        inventory.reference_cache.invalidate()
+        rebuilt = inventory.catalogue_reorder_plan()
+
+    assert built == [2, 2]      # the first call and the forced rebuild, not the sale in between
+    assert rows(after) == rows(rebuilt)
+    assert after[2]['velocity'] > before[2]['velocity']
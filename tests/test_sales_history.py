@@ -0,0 +1,92 @@
+"""
+Sales history
+Pages are keyset-paginated on (sale_time, id); the category filter reads the
+category copied onto each sale, which follows the product.
+"""
+
+import base64
+import sqlite3
+
+import pytest
+
+import app
+
+
+def add_product(client, name, category, stock=100):
+    client.post('/add_product', data={'name': name, 'cost': '1', 'price': '2', 'stock': str(stock),
+                                      'category': category, 'barcode': name.upper()})
+
+
+def product_id(flask_app, name):
+    conn = sqlite3.connect(flask_app.config['DATABASE'])
+    row = conn.execute("SELECT id FROM products WHERE name = ?", (name,)).fetchone()
+    conn.close()
+    return row[0]
+
+
+def sell(client, product_id, quantity=1):
+    return client.post('/api/checkout', json={'items': [{'product_id': product_id, 'quantity': quantity}]})
+
+
+def sales(client, **args):
+    return client.get('/api/sales', query_string=args).get_json()['sales']
+
+
+def test_category_filter_follows_recategorised_product(flask_app, client):
+    add_product(client, 'Milk', 'Dairy')
+    add_product(client, 'Bread', 'Bakery')
+    milk = product_id(flask_app, 'Milk')
+    sell(client, milk)
+    sell(client, product_id(flask_app, 'Bread'))
+
+    assert [sale['product'] for sale in sales(client, category='Dairy')] == ['Milk']
+
+    client.post(f'/edit_product/{milk}', data={'name': 'Milk', 'cost': '1', 'price': '2', 'stock': '99',
+                                               'min_stock': '5', 'category': 'Chilled'})
+    assert sales(client, category='Dairy') == []
+    assert [sale['product'] for sale in sales(client, category='Chilled')] == ['Milk']
+
+
+def test_cursor_pages_through_tied_sale_times_exactly_once(flask_app, client):
+    add_product(client, 'Milk', 'Dairy')
+    milk = product_id(flask_app, 'Milk')
+    # Runs of sales recorded in the same second, split across page boundaries
+    times = ['2026-03-01 09:00:00'] * 5 + ['2026-03-01 10:00:00'] * 7 + ['2026-03-02 08:30:00'] * 4
+    conn = sqlite3.connect(flask_app.config['DATABASE'])
+    conn.executemany("""
+        INSERT INTO sales (product_id, quantity, total_amount, sale_time, unit_price, unit_cost)
+        VALUES (?, 1, 2, ?, 2, 1)
+    """, [(milk, sale_time) for sale_time in times])
+    conn.commit()
+    expected = [row[0] for row in conn.execute("SELECT id FROM sales ORDER BY sale_time DESC, id DESC")]
+    conn.close()
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        args = {'per_page': 3, 'cursor': cursor} if cursor else {'per_page': 3}
+        page = client.get('/api/sales', query_string=args).get_json()
+        seen.extend(sale['id'] for sale in page['sales'])
+        pages += 1
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert seen == expected
+    assert pages == 6
+
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor',
+    '%%%',
+    base64.urlsafe_b64encode(b'no separator').decode(),
+    base64.urlsafe_b64encode(b'2026-03-01 09:00:00|seven').decode(),
+    base64.urlsafe_b64encode(b'\xff\xfe|1').decode(),
+    app.encode_sales_cursor('2026-03-01 09:00:00', 10 ** 30),
+])
+def test_malformed_cursor_is_rejected(client, cursor):
+    response = client.get('/api/sales', query_string={'cursor': cursor})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid filter or cursor'}
+
+    response = client.get('/sales_history', query_string={'cursor': cursor})
+    assert response.status_code == 302
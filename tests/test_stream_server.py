@@ -0,0 +1,96 @@
+"""
+Live event stream server
+/api/stream served from one event loop: hundreds of open screens each get
+every write, without a thread per screen, and only logged-in sessions get in.
+"""
+
+import asyncio
+import socket
+import threading
+
+import pytest
+
+import stream_server
+
+SCREENS = 300
+
+
+@pytest.fixture
+def server(flask_app):
+    flask_app.config['EVENT_POLL_SECONDS'] = 0.05
+    server = stream_server.StreamServer(flask_app)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.start('127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield server
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+
+def session_cookie(flask_app, **session):
+    value = flask_app.session_interface.get_signing_serializer(flask_app).dumps(session)
+    return f"{flask_app.config['SESSION_COOKIE_NAME']}={value}"
+
+
+def open_stream(server, cookie, headers=''):
+    sock = socket.create_connection(('127.0.0.1', server.port), timeout=10)
+    sock.sendall(f'GET /api/stream HTTP/1.1\r\nHost: test\r\nCookie: {cookie}\r\n{headers}\r\n'.encode())
+    return sock
+
+
+def read_until(sock, marker):
+    data = b''
+    while marker not in data:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def test_hundreds_of_screens_each_receive_a_sale(flask_app, client, server):
+    client.post('/add_product', data={'name': 'Tea', 'cost': '1', 'price': '2', 'stock': '10',
+                                      'barcode': 'TEA'})
+    cookie = session_cookie(flask_app, user_id=1)
+    threads = threading.active_count()
+    screens = [open_stream(server, cookie) for _ in range(SCREENS)]
+    try:
+        for sock in screens:
+            assert read_until(sock, b'retry:').startswith(b'HTTP/1.1 200 OK')
+        assert server.broker.stats()['subscribers'] == SCREENS
+        # The subscribe thread and the broker's tail, not one per screen
+        assert threading.active_count() - threads <= 2
+
+        response = client.post('/api/checkout', json={'items': [{'barcode': 'TEA', 'quantity': 1}]})
+        assert response.status_code == 200
+
+        for sock in screens:
+            assert b'event: sale' in read_until(sock, b'event: sale')
+    finally:
+        for sock in screens:
+            sock.close()
+
+
+def test_resume_replays_missed_events(flask_app, client, server):
+    client.post('/add_product', data={'name': 'Tea', 'cost': '1', 'price': '2', 'stock': '10',
+                                      'barcode': 'TEA'})
+    client.post('/api/checkout', json={'items': [{'barcode': 'TEA', 'quantity': 1}]})
+
+    sock = open_stream(server, session_cookie(flask_app, user_id=1), 'Last-Event-ID: 0\r\n')
+    try:
+        assert b'event: sale' in read_until(sock, b'event: sale')
+    finally:
+        sock.close()
+
+
+@pytest.mark.parametrize('cookie', ['', 'session=forged', 'anonymous'])
+def test_stream_needs_a_logged_in_session(flask_app, server, cookie):
+    if cookie == 'anonymous':
+        cookie = session_cookie(flask_app, theme='dark')
+    sock = open_stream(server, cookie)
+    try:
+        assert read_until(sock, b'}').startswith(b'HTTP/1.1 401 Unauthorized')
+    finally:
+        sock.close()
+    assert server.broker.stats()['subscribers'] == 0
@@ -0,0 +1,14 @@
+"""
+WSGI entry point for production servers
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    waitress-serve --listen=0.0.0.0:8000 --threads=8 wsgi:app
+
+Uses the production config unless APP_CONFIG says otherwise.
+"""
+
+import os
+
+from app import create_app
+
+app = create_app(os.environ.get('APP_CONFIG', 'production'))